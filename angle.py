@@ -0,0 +1,200 @@
+import sys
+import numpy as np
+import configuration as cfg
+
+ANGLE_METHODS = ('fft', 'capon')
+# Chirps of the left and right TX antennas form the horizontal virtual array (see configuration.NUM_TX)
+AZIMUTH_TX = (0, 1)
+"""
+- ANGLE_METHODS: Angle spectrum estimators: zero-padded FFT over the virtual array, or Capon
+  (minimum variance) beamforming over the chirps of a frame.
+- AZIMUTH_TX: TX antennas, by chirp index within a loop, whose virtual antennas lie on one
+  horizontal line spaced half a wavelength apart.
+"""
+
+
+def angle_axis(numAngleBins=cfg.NUM_ANGLE_BINS):
+    """
+    Azimuth of every angle bin, for a virtual array spaced half a wavelength apart.
+
+    Args:
+        numAngleBins (int): Number of angle bins.
+
+    Returns:
+        ndarray: (numAngleBins,) angles in degrees, increasing, zero (broadside) in the centre bin.
+    """
+    sines = (np.arange(numAngleBins) - numAngleBins // 2) * 2 / numAngleBins
+    return np.degrees(np.arcsin(np.clip(sines, -1, 1)))
+
+
+class AngleProcessor:
+    """
+    Angle of arrival over the virtual array of the TX/RX antennas.
+
+    With TDM-MIMO every TX chirp of a loop sees all RX antennas, so the range FFT of a
+    frame, (loops, tx, rx, range bins), holds a virtual array of tx * rx antennas. The
+    angle spectrum is only computed where it is needed: for the range bins kept by the
+    RangeDopplerProcessor (rangeAzimuth) or for the CFAR detections (detectionAngles).
+    All frames of a batch are processed together.
+    """
+    def __init__(self, frameConfig, numAngleBins=None, azimuthTx=None, method='fft', dopplerWindow=np.hamming,
+                 diagonalLoading=1e-2):
+        """
+        Initialize the AngleProcessor.
+
+        Args:
+            frameConfig (FrameConfig): Frame geometry.
+            numAngleBins (int): Number of angle bins (default: frameConfig.numAngleBins).
+            azimuthTx (tuple): TX antennas forming the horizontal array (default: AZIMUTH_TX with
+                               three TX antennas, otherwise all of them).
+            method (str): One of ANGLE_METHODS.
+            dopplerWindow (callable): Window function along the loops, as in RangeDopplerProcessor.
+            diagonalLoading (float): Capon regularization, relative to the mean antenna power.
+        """
+        if method not in ANGLE_METHODS:
+            raise ValueError(f"method must be one of {ANGLE_METHODS}, got {method!r}")
+        self.numLoops = frameConfig.numLoopsPerFrame
+        self.numTx = frameConfig.numTxAntennas
+        self.numRx = frameConfig.numRxAntennas
+        self.numAngleBins = numAngleBins if numAngleBins is not None else frameConfig.numAngleBins
+        if azimuthTx is None:
+            azimuthTx = AZIMUTH_TX if self.numTx == 3 else tuple(range(self.numTx))
+        self.azimuthTx = list(azimuthTx)
+        self.numVirtual = len(self.azimuthTx) * self.numRx
+        if self.numVirtual > self.numAngleBins:
+            raise ValueError(f"numAngleBins must be at least {self.numVirtual}, got {self.numAngleBins}")
+        self.method = method
+        self.diagonalLoading = diagonalLoading
+        self.angles = angle_axis(self.numAngleBins)
+        self.dopplerWindow = dopplerWindow(self.numLoops).astype(np.float32)
+
+        # Steering vectors of the angle bins, (angle bins, virtual antennas), for Capon
+        phase = np.pi * np.sin(np.radians(self.angles))[:, np.newaxis] * np.arange(self.numVirtual)
+        self.steering = np.exp(1j * phase).astype(np.complex64)
+
+    def virtualArray(self, cube):
+        """
+        Arrange a range FFT cube as a virtual array.
+
+        Args:
+            cube (ndarray): (n, loops, tx, rx, range bins) range FFT, e.g. RangeDopplerProcessor.rangeCube().
+
+        Returns:
+            ndarray: (n, loops, virtual antennas, range bins) complex array.
+        """
+        n, loops, _, _, numBins = cube.shape
+        return cube[:, :, self.azimuthTx].reshape(n, loops, self.numVirtual, numBins)
+
+    def rangeAzimuth(self, cube):
+        """
+        Range-azimuth maps of a batch of frames, for the range bins of the cube.
+
+        Args:
+            cube (ndarray): (n, loops, tx, rx, range bins) range FFT after clutter removal.
+
+        Returns:
+            ndarray: (n, angle bins, range bins) float32 power, angles as in self.angles.
+        """
+        virtual = self.virtualArray(cube)
+        if self.method == 'capon':
+            # Snapshots are the chirps, one covariance per frame and range bin
+            snapshots = np.moveaxis(virtual, 3, 1)
+            return np.moveaxis(self._capon(snapshots), 1, 2)
+        spectrum = np.fft.fft(virtual, n=self.numAngleBins, axis=2)
+        spectrum = np.fft.fftshift(spectrum, axes=2)
+        power = np.square(np.abs(spectrum)).mean(axis=1)
+        return power.astype(np.float32)
+
+    def detectionAngles(self, cube, detections, frames, rangeOffset=0):
+        """
+        Azimuth of CFAR detections.
+
+        Only the Doppler bin of each detection is evaluated, as a windowed DFT over the
+        loops, and its virtual array vector is turned into an angle spectrum.
+
+        TDM-MIMO motion is not compensated: the TX antennas transmit one after the other,
+        so a moving target adds a Doppler phase step between the TX parts of the virtual
+        array, which biases the azimuth of fast targets.
+
+        Args:
+            cube (ndarray): (n, loops, tx, rx, range bins) range FFT after clutter removal.
+            detections (ndarray): detection.DETECTION_DTYPE detections of the frames, with
+                                  absolute range bins as set by TargetDetector.
+            frames (ndarray): Frame numbers of the n frames of the cube.
+            rangeOffset (int): Range bin of the first range bin of the cube, if it is cropped
+                               (the first of RangeDopplerProcessor.rangeBins).
+
+        Returns:
+            tuple: (detections,) azimuth in degrees and (detections, angle bins) float32 power spectra.
+        """
+        if not len(detections):
+            return np.zeros(0, dtype=np.float32), np.zeros((0, self.numAngleBins), dtype=np.float32)
+        index = np.searchsorted(frames, detections['frame'])
+        rangeBin = detections['range_bin'] - rangeOffset
+        if rangeBin.min() < 0 or rangeBin.max() >= cube.shape[-1]:
+            raise ValueError(f"detection range bins must be within [{rangeOffset}, {rangeOffset + cube.shape[-1]}), "
+                             f"got [{detections['range_bin'].min()}, {detections['range_bin'].max()}]")
+        # (detections, loops, virtual antennas) slow-time samples of the detected cells
+        samples = self.virtualArray(cube)[index, :, :, rangeBin]
+        frequency = (detections['doppler_bin'] - self.numLoops // 2)[:, np.newaxis] / self.numLoops
+        dft = (self.dopplerWindow * np.exp(-2j * np.pi * frequency * np.arange(self.numLoops))).astype(np.complex64)
+        if self.method == 'capon':
+            power = self._capon(samples[:, np.newaxis])[:, 0]
+        else:
+            vectors = np.einsum('dl,dlv->dv', dft, samples)
+            spectrum = np.fft.fftshift(np.fft.fft(vectors, n=self.numAngleBins, axis=1), axes=1)
+            power = np.square(np.abs(spectrum)).astype(np.float32)
+        return self.angles[np.argmax(power, axis=1)].astype(np.float32), power
+
+    def _capon(self, snapshots):
+        """
+        Batched Capon spectra.
+
+        Args:
+            snapshots (ndarray): (..., snapshots, virtual antennas) complex samples.
+
+        Returns:
+            ndarray: (..., angle bins) float32 power.
+        """
+        numSnapshots = snapshots.shape[-2]
+        covariance = np.einsum('...sv,...sw->...vw', snapshots, snapshots.conj()) / numSnapshots
+        loading = self.diagonalLoading * np.trace(covariance, axis1=-2, axis2=-1).real / self.numVirtual
+        covariance += (loading[..., np.newaxis, np.newaxis] + 1e-12) * np.eye(self.numVirtual)
+        inverse = np.linalg.inv(covariance)
+        # 1 / (a^H R^-1 a) for every steering vector a
+        quadratic = np.einsum('av,...vw,aw->...a', self.steering.conj(), inverse, self.steering).real
+        return (1 / np.maximum(quadratic, 1e-30)).astype(np.float32)
+
+
+def main():
+    # Usage: python angle.py <filename.bin> [max_range_meters] [fft|capon]
+    from detection import TargetDetector
+    from plotData import RawDataReader, bin2np_frames
+    from processing import RangeDopplerProcessor
+
+    reader = RawDataReader(sys.argv[1])
+    maxRange = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    method = sys.argv[3] if len(sys.argv) > 3 else 'fft'
+    config = reader.frameconfig
+    rangeBins = (0, min(config.numRangeBins, int(maxRange / cfg.RANGE_RESOLUTION)))
+    batchFrames = 8
+
+    processor = RangeDopplerProcessor(config, maxBatch=batchFrames, rangeBins=rangeBins)
+    angleProcessor = AngleProcessor(config, method=method)
+    detector = TargetDetector(tracker=False, rangeOffset=rangeBins[0])
+    frames = np.empty((batchFrames, config.frameSize), dtype=np.complex64)
+    for first in range(0, len(reader), batchFrames):
+        n = min(batchFrames, len(reader) - first)
+        bin2np_frames(reader[first:first + n], out=frames[:n])
+        results = processor.process(frames[:n])
+        frameNumbers = np.arange(first, first + n)
+        detections = detector.detect(results['rangeDoppler'], frameNumbers)
+        azimuth, _ = angleProcessor.detectionAngles(processor.rangeCube(n), detections, frameNumbers,
+                                                    rangeOffset=rangeBins[0])
+        for detection, angle in zip(detections, azimuth):
+            print(f"frame {detection['frame']}: range {detection['range']:.2f} m, "
+                  f"velocity {detection['velocity']:.2f} m/s, azimuth {angle:.1f} deg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import configuration as cfg
+from plotData import FrameConfig, bin2np_frame, bin2np_frames, clutter_removal, dopplerFFT, frameReshape, rangeFFT
+from steaming import RECEIVER_MODES
+
+RECEIVE_STAGES = tuple(f'receive_{receiver}' for receiver in RECEIVER_MODES)
+BENCHMARK_STAGES = RECEIVE_STAGES + ('convert', 'reshape', 'range_fft', 'clutter_removal', 'doppler_fft', 'processor',
+                                     'roi_processor', 'detection', 'render', 'colormap', 'end_to_end')
+BASELINE_PATH = 'benchmark_baseline.json'
+REGRESSION_TOLERANCE = 0.15
+"""
+- RECEIVE_STAGES: Packet receive and frame assembly by adcCapThread, one stage per receiver
+  of steaming.RECEIVER_MODES.
+- BENCHMARK_STAGES: Measured hot paths, from packet receive to rendering, and the whole
+  convert, process and detect chain per batch ('end_to_end').
+- BASELINE_PATH: Default file of stored results to compare against.
+- REGRESSION_TOLERANCE: Relative change of throughput, median latency or peak memory that
+  is flagged as a regression.
+"""
+
+
+def synthetic_frames(numFrames, seed=0):
+    """
+    Generate raw frames at the configured geometry, with two moving targets and noise.
+
+    Args:
+        numFrames (int): Number of frames.
+        seed (int): Seed of the noise, so every run measures the same data.
+
+    Returns:
+        ndarray: (numFrames, UINT16_IN_FRAME) int16 frames, as received from the DCA1000.
+    """
+    from dca1000_emulator import synthesize_frames
+
+    targets = [{'range': 1.0, 'velocity': 0.5, 'angle': 15}, {'range': 2.2, 'velocity': -0.3, 'angle': -20}]
+    return synthesize_frames(numFrames, targets, seed=seed)
+
+
+def _stage(name, frames, batchFrames):
+    """
+    Prepare a stage for measurement.
+
+    Args:
+        name (str): One of BENCHMARK_STAGES except RECEIVE_STAGES.
+        frames (ndarray): Raw frames from synthetic_frames.
+        batchFrames (int): Number of frames per call of batched stages.
+
+    Returns:
+        tuple: Function running the stage once on frames starting at a given index, and the
+               number of frames it handles per call.
+    """
+    from detection import TargetDetector
+    from processing import RangeDopplerProcessor, RoiProcessor
+    from viewer import RangeDopplerViewer, apply_colormap, colormap_lut
+
+    config = FrameConfig()
+    numFrames = len(frames)
+    complexFrames = bin2np_frames(frames)
+    reshaped = frameReshape(complexFrames[0], config)
+    rangeResult = clutter_removal(rangeFFT(reshaped, config), axis=2)
+    # The displayed range window, as in plotData and the viewer
+    rangeBins = (0, int(3 / cfg.RANGE_RESOLUTION))
+
+    if name == 'convert':
+        return (lambda i: bin2np_frame(frames[i % numFrames])), 1
+    if name == 'reshape':
+        return (lambda i: np.ascontiguousarray(frameReshape(complexFrames[i % numFrames], config))), 1
+    if name == 'range_fft':
+        return (lambda i: rangeFFT(reshaped, config)), 1
+    if name == 'clutter_removal':
+        return (lambda i: clutter_removal(rangeResult, axis=2)), 1
+    if name == 'doppler_fft':
+        return (lambda i: dopplerFFT(rangeResult, config)), 1
+
+    processor = RangeDopplerProcessor(config, maxBatch=batchFrames, rangeBins=rangeBins)
+    batches = [complexFrames[first:first + batchFrames] for first in range(0, numFrames - batchFrames + 1, batchFrames)]
+    results = processor.process(batches[0])
+    if name == 'processor':
+        return (lambda i: processor.process(batches[i % len(batches)])), batchFrames
+    if name == 'roi_processor':
+        roiProcessor = RoiProcessor(config, ranges=(0, 3), velocities=(-1, 1), maxBatch=batchFrames)
+        return (lambda i: roiProcessor.process(batches[i % len(batches)])), batchFrames
+    detector = TargetDetector(tracker=False)
+    frameNumbers = np.arange(batchFrames)
+    if name == 'detection':
+        maps = results['rangeDoppler'].copy()
+        return (lambda i: detector.detect(maps, frameNumbers)), batchFrames
+    if name == 'render':
+        viewer = RangeDopplerViewer(config.numDopplerBins, maxFps=None, headless=True)
+        single = {key: value[0].copy() for key, value in results.items()}
+
+        def render(i):
+            viewer.update(single['rangeDoppler'], single['rangeChirp'], single['rangeProfile'], i, force=True)
+            return viewer.toRGB()
+        return render, 1
+    if name == 'colormap':
+        lut = colormap_lut('viridis')
+        rangeDoppler = results['rangeDoppler'][0].copy()
+        return (lambda i: apply_colormap(rangeDoppler, rangeDoppler.min(), rangeDoppler.max(), lut)), 1
+    if name == 'end_to_end':
+        rawBatches = [frames[first:first + batchFrames] for first in range(0, numFrames - batchFrames + 1, batchFrames)]
+        out = np.empty((batchFrames, config.frameSize), dtype=np.complex64)
+        scratch = np.empty((2, batchFrames, config.frameSize // 2), dtype=np.uint64)
+
+        def endToEnd(i):
+            bin2np_frames(rawBatches[i % len(rawBatches)], out=out, scratch=scratch)
+            batch = processor.process(out)
+            return detector.detect(batch['rangeDoppler'], frameNumbers)
+        return endToEnd, batchFrames
+    raise ValueError(f"name must be one of {BENCHMARK_STAGES}, got {name!r}")
+
+
+def measure(function, framesPerCall, iterations=50, warmup=3):
+    """
+    Measure the throughput, latency and peak memory of a stage.
+
+    Timing and memory are measured in separate passes, so that tracing allocations does
+    not slow down the timed calls.
+
+    Args:
+        function (callable): Stage function taking the iteration index.
+        framesPerCall (int): Number of frames handled per call.
+        iterations (int): Number of timed calls.
+        warmup (int): Number of untimed calls first, e.g. for FFT planning and caches.
+
+    Returns:
+        dict: Frames/sec, mean and p50/p90/p99 latency per call in seconds, and peak
+              memory allocated during a call in bytes.
+    """
+    for i in range(warmup):
+        function(i)
+    latencies = np.empty(iterations)
+    start = time.perf_counter()
+    for i in range(iterations):
+        begin = time.perf_counter()
+        function(i)
+        latencies[i] = time.perf_counter() - begin
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    function(0)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+    return {'fps': iterations * framesPerCall / elapsed,
+            'mean': float(latencies.mean()),
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'peak_bytes': int(peak)}
+
+
+def _run_receiver(datagrams, numFrames, receiver, port, trace=False):
+    """
+    Send datagrams over loopback as fast as possible to a new adcCapThread.
+
+    Args:
+        datagrams (list): Datagrams of the frames, built before the receiver starts.
+        numFrames (int): Number of frames in the datagrams.
+        receiver (str): adcCapThread receiver, one of steaming.RECEIVER_MODES.
+        port (int): Data port of the receiver; port + 1 is used as its config port.
+        trace (bool): Trace the allocations made from the start of the receiver until the
+                      last packet has been handled.
+
+    Returns:
+        tuple: Completion timestamps of the frames, receiver statistics and peak memory
+               allocated in bytes (0 without trace).
+    """
+    import socket
+    from steaming import adcCapThread
+
+    # The ring is allocated up front by the constructor, outside of the traced receive loop
+    capThread = adcCapThread(1, "adc", static_ip='127.0.0.1', data_port=port, config_port=port + 1,
+                             bufferSize=numFrames + 1, receiver=receiver, lostPacketPolicy='zerofill',
+                             clock=time.perf_counter)
+    capThread.daemon = True
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2**22)
+    if trace:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+    capThread.start()
+    for datagram in datagrams:
+        sender.sendto(datagram, ('127.0.0.1', port))
+    time.sleep(0.5)
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+    capThread.stop()
+    sender.close()
+    _, _, _, timestamps = capThread.getFrames(numFrames)
+    return timestamps.copy(), capThread.getStats(), peak
+
+
+def measure_receive(frames, receiver='recvmmsg', port=5298):
+    """
+    Measure how fast an adcCapThread assembles frames sent over loopback as fast as possible.
+
+    Timing and memory are measured in separate runs, as in measure(); the memory run
+    traces the allocations of the receive loop, from the start of the receiver thread to
+    the last packet.
+
+    Args:
+        frames (ndarray): Raw frames from synthetic_frames.
+        receiver (str): adcCapThread receiver, one of steaming.RECEIVER_MODES.
+        port (int): Data port of the receiver; port + 1 is used as its config port, and
+                    port + 2 and port + 3 by the memory run.
+
+    Returns:
+        dict: Frames/sec, latency percentiles of the interval between frames in seconds, peak
+              memory allocated by the receive loop in bytes, and the packets lost because
+              the sender outran the receiver.
+    """
+    from dca1000_emulator import packetize
+    from steaming import BYTES_IN_FRAME
+
+    datagrams = list(packetize(bytes(1000) + frames.tobytes(), BYTES_IN_FRAME - 1000))
+    timestamps, stats, _ = _run_receiver(datagrams, len(frames), receiver, port)
+    _, _, peak = _run_receiver(datagrams, len(frames), receiver, port + 2, trace=True)
+    intervals = np.diff(timestamps)
+    if not len(intervals):
+        return {'fps': 0.0, 'mean': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'peak_bytes': int(peak),
+                'lost_packets': stats['lost_packets']}
+    p50, p90, p99 = np.percentile(intervals, (50, 90, 99))
+    return {'fps': len(intervals) / (timestamps[-1] - timestamps[0]),
+            'mean': float(intervals.mean()),
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'peak_bytes': int(peak),
+            'lost_packets': stats['lost_packets']}
+
+
+def run_benchmarks(stages=BENCHMARK_STAGES, numFrames=32, batchFrames=8, iterations=50):
+    """
+    Run benchmark stages on synthetic frames at the configured geometry.
+
+    Args:
+        stages (tuple): Names from BENCHMARK_STAGES.
+        numFrames (int): Number of distinct synthetic frames cycled through.
+        batchFrames (int): Number of frames per call of batched stages.
+        iterations (int): Number of timed calls per stage.
+
+    Returns:
+        dict: 'machine' description, 'geometry' and the measure() results of every stage.
+    """
+    for name in stages:
+        if name not in BENCHMARK_STAGES:
+            raise ValueError(f"stages must be taken from {BENCHMARK_STAGES}, got {name!r}")
+    frames = synthetic_frames(numFrames)
+    results = {}
+    for name in stages:
+        if name in RECEIVE_STAGES:
+            # Stopped receivers keep their ports until their socket times out
+            index = RECEIVE_STAGES.index(name)
+            results[name] = measure_receive(frames, RECEIVER_MODES[index], port=5298 + 4 * index)
+        else:
+            function, framesPerCall = _stage(name, frames, batchFrames)
+            results[name] = measure(function, framesPerCall, iterations)
+    return {'machine': {'platform': platform.platform(),
+                        'processor': platform.processor(),
+                        'cpus': os.cpu_count(),
+                        'python': platform.python_version(),
+                        'numpy': np.__version__},
+            'geometry': {'frame_size': cfg.RADAR_CONFIG.frame_size, 'batch_frames': batchFrames},
+            'stages': results}
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare benchmark results with a stored baseline.
+
+    Args:
+        results (dict): Output of run_benchmarks.
+        baseline (dict): Stored output of run_benchmarks.
+        tolerance (float): Relative change flagged as a regression.
+
+    Returns:
+        dict: Regression messages by stage, only for stages with regressions.
+    """
+    regressions = {}
+    for name, current in results['stages'].items():
+        reference = baseline['stages'].get(name)
+        if reference is None:
+            continue
+        messages = []
+        if current['fps'] < reference['fps'] * (1 - tolerance):
+            messages.append(f"throughput {current['fps']:.1f} fps < baseline {reference['fps']:.1f} fps")
+        if current['p50'] > reference['p50'] * (1 + tolerance):
+            messages.append(f"p50 latency {current['p50'] * 1e3:.2f} ms > baseline {reference['p50'] * 1e3:.2f} ms")
+        if current['peak_bytes'] > reference['peak_bytes'] * (1 + tolerance):
+            messages.append(f"peak memory {current['peak_bytes'] / 2**20:.1f} MiB > "
+                            f"baseline {reference['peak_bytes'] / 2**20:.1f} MiB")
+        if messages:
+            regressions[name] = messages
+    return regressions
+
+
+def main():
+    # Usage: python benchmark.py [save] [stage ...]
+    # Compares with benchmark_baseline.json if it exists; 'save' stores the results as the new baseline.
+    arguments = sys.argv[1:]
+    save = 'save' in arguments
+    stages = tuple(name for name in arguments if name != 'save') or BENCHMARK_STAGES
+
+    results = run_benchmarks(stages)
+    print(f"{'stage':<16}{'fps':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak MiB':>10}")
+    for name, stage in results['stages'].items():
+        print(f"{name:<16}{stage['fps']:>10.1f}{stage['p50'] * 1e3:>10.2f}{stage['p90'] * 1e3:>10.2f}"
+              f"{stage['p99'] * 1e3:>10.2f}{stage['peak_bytes'] / 2**20:>10.1f}")
+
+    regressions = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        if baseline['machine'] != results['machine']:
+            print(f"Note: {BASELINE_PATH} was measured on a different machine or software versions")
+        regressions = compare(results, baseline)
+        for name, messages in regressions.items():
+            for message in messages:
+                print(f"REGRESSION {name}: {message}")
+        if not regressions:
+            print(f"No regressions against {BASELINE_PATH}")
+    if save:
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH) as f:
+                stored = json.load(f)
+            # Keep the baselines of stages that were not run this time
+            results['stages'] = dict(stored['stages'], **results['stages'])
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"Saved the results to {BASELINE_PATH}")
+    sys.exit(1 if regressions and not save else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+CLUTTER_METHODS = ('frame', 'ema', 'mean', 'recursive')
+"""
+- CLUTTER_METHODS: Background models of ClutterFilter:
+  - 'frame': mean over the loops of the current frame only, like plotData.clutter_removal (stateless).
+  - 'ema': exponential moving average of the frame means.
+  - 'mean': running mean of the frame means over the last `window` frames.
+  - 'recursive': first-order recursive filter updated at every chirp, so chirps can be
+    filtered as they arrive without waiting for the rest of the frame.
+"""
+
+
+def _checkpoint_path(path):
+    # np.savez appends '.npz' to paths without it, save() and load() do the same
+    path = os.fspath(path)
+    return path if path.endswith('.npz') else path + '.npz'
+
+
+class ClutterFilter:
+    """
+    Stateful static clutter removal on range FFT cubes.
+
+    A background per (tx, rx, range bin) is estimated across frames and subtracted in
+    place from complex64 range FFTs, so clutter that persists over many frames is removed
+    and not only the mean of the current frame. The background is updated once per frame
+    (once per chirp for 'recursive') with a fixed number of operations, whatever the
+    length of the history. Filtering a batch of frames in one call or frame by frame gives
+    the same result, and the state can be checkpointed to resume a replay partway through
+    a capture.
+    """
+    def __init__(self, method='ema', alpha=0.05, window=32):
+        """
+        Initialize the ClutterFilter.
+
+        Args:
+            method (str): One of CLUTTER_METHODS.
+            alpha (float or ndarray): Update weight of 'ema' (per frame) and 'recursive' (per
+                                      chirp); an array of one weight per range bin filters every
+                                      range bin with its own time constant.
+            window (int): Number of frames averaged by 'mean'.
+        """
+        if method not in CLUTTER_METHODS:
+            raise ValueError(f"method must be one of {CLUTTER_METHODS}, got {method!r}")
+        if np.any(np.asarray(alpha) <= 0) or np.any(np.asarray(alpha) > 1):
+            raise ValueError(f"alpha must be in (0, 1], got {alpha!r}")
+        if window < 1:
+            raise ValueError(f"window must be at least 1, got {window!r}")
+        self.method = method
+        self.alpha = np.asarray(alpha, dtype=np.float32)
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the background, e.g. when the scene changes.
+        """
+        self.framesProcessed = 0
+        self.chirpsProcessed = 0
+        self.background = None
+        self._history = None
+        self._sum = None
+        self._count = 0
+        self._position = 0
+
+    def apply(self, cube):
+        """
+        Remove the clutter from a batch of frames in place, updating the background.
+
+        Args:
+            cube (ndarray): (n, loops, tx, rx, range bins) complex64 range FFT, e.g. a view
+                            of the RangeDopplerProcessor buffers.
+
+        Returns:
+            ndarray: cube.
+        """
+        if cube.ndim != 5:
+            raise ValueError(f"cube must have shape (n, loops, tx, rx, range bins), got {cube.shape}")
+        if self.method == 'recursive':
+            for frame in cube:
+                self.applyChirps(frame)
+                self.framesProcessed += 1
+            return cube
+
+        means = np.mean(cube, axis=1)
+        self._init_state(means.shape[1:])
+        for frame, mean in zip(cube, means):
+            if self.method == 'frame':
+                self.background[...] = mean
+            elif self.method == 'ema':
+                if self.framesProcessed:
+                    self.background += self.alpha * (mean - self.background)
+                else:
+                    self.background[...] = mean
+            else:
+                # Running sum over a ring of frame means: add the newest, drop the oldest
+                if self._count == self.window:
+                    self._sum -= self._history[self._position]
+                else:
+                    self._count += 1
+                self._history[self._position] = mean
+                self._sum += mean
+                self._position = (self._position + 1) % self.window
+                np.divide(self._sum, self._count, out=self.background, casting='same_kind')
+            frame -= self.background
+            self.framesProcessed += 1
+        return cube
+
+    def applyChirps(self, chirps):
+        """
+        Remove the clutter from consecutive chirps in place with the 'recursive' method.
+
+        Every chirp has the background of the previous chirps subtracted and then updates
+        it, so any number of chirps, down to a single one, can be filtered at a time.
+
+        Args:
+            chirps (ndarray): (m, tx, rx, range bins) complex64 range FFT of m chirps.
+
+        Returns:
+            ndarray: chirps.
+        """
+        if self.method != 'recursive':
+            raise ValueError(f"applyChirps needs the 'recursive' method, not {self.method!r}")
+        self._init_state(chirps.shape[1:])
+        for chirp in chirps:
+            if self._count == 0:
+                self.background[...] = chirp
+                self._count = 1
+            chirp -= self.background
+            # chirp now holds the innovation x - background
+            self.background += self.alpha * chirp
+        self.chirpsProcessed += len(chirps)
+        return chirps
+
+    def state(self):
+        """
+        Get a checkpoint of the filter.
+
+        Returns:
+            dict: Copies of the configuration and background arrays, see restore().
+        """
+        state = {'method': self.method,
+                 'alpha': self.alpha.copy(),
+                 'window': self.window,
+                 'framesProcessed': self.framesProcessed,
+                 'chirpsProcessed': self.chirpsProcessed,
+                 'count': self._count,
+                 'position': self._position}
+        if self.background is not None:
+            state['background'] = self.background.copy()
+        if self._history is not None:
+            state['history'] = self._history.copy()
+            state['sum'] = self._sum.copy()
+        return state
+
+    def restore(self, state):
+        """
+        Continue from a checkpoint taken with state().
+
+        Args:
+            state (dict): The checkpoint, e.g. from state() or load().
+        """
+        self.method = str(state['method'])
+        self.alpha = np.asarray(state['alpha'], dtype=np.float32)
+        self.window = int(state['window'])
+        self.reset()
+        self.framesProcessed = int(state['framesProcessed'])
+        self.chirpsProcessed = int(state['chirpsProcessed'])
+        self._count = int(state['count'])
+        self._position = int(state['position'])
+        if 'background' in state:
+            self.background = np.array(state['background'], dtype=np.complex64)
+        if 'history' in state:
+            self._history = np.array(state['history'], dtype=np.complex64)
+            self._sum = np.array(state['sum'], dtype=np.complex128)
+
+    def save(self, path):
+        """
+        Write a checkpoint to an .npz file.
+
+        The checkpoint is written to a temporary file in the same directory and renamed
+        over path, so an interrupted save leaves the previous checkpoint intact.
+
+        Args:
+            path (str): Path of the checkpoint; '.npz' is appended if missing, as by np.savez.
+        """
+        path = _checkpoint_path(path)
+        fd, tempPath = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(path) + '.',
+                                        dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.savez(file, **self.state())
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tempPath, path)
+        except BaseException:
+            os.unlink(tempPath)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """
+        Create a ClutterFilter from a checkpoint written by save().
+
+        Args:
+            path (str): Path of the checkpoint, as given to save().
+
+        Returns:
+            ClutterFilter: The restored filter.
+        """
+        with np.load(_checkpoint_path(path)) as checkpoint:
+            state = {name: checkpoint[name] for name in checkpoint.files}
+        clutterFilter = cls(str(state['method']), state['alpha'], int(state['window']))
+        clutterFilter.restore(state)
+        return clutterFilter
+
+    def _init_state(self, shape):
+        """
+        Allocate the background for (tx, rx, range bins) on first use.
+        """
+        if self.background is not None:
+            if self.background.shape != shape:
+                raise ValueError(f"expected range FFTs of shape {self.background.shape}, got {shape}")
+            return
+        self.background = np.zeros(shape, dtype=np.complex64)
+        if self.method == 'mean':
+            self._history = np.zeros((self.window,) + shape, dtype=np.complex64)
+            self._sum = np.zeros(shape, dtype=np.complex128)
+
+
+def main():
+    # Usage: python clutter.py <filename.bin> [ema|mean|recursive] [checkpoint.npz]
+    from plotData import RawDataReader, bin2np_frames
+    from processing import RangeDopplerProcessor
+
+    path = sys.argv[1]
+    method = sys.argv[2] if len(sys.argv) > 2 else 'ema'
+    checkpointPath = sys.argv[3] if len(sys.argv) > 3 else None
+    batchFrames = 16
+
+    reader = RawDataReader(path)
+    config = reader.frameconfig
+    clutterFilter = ClutterFilter(method)
+    start = 0
+    if checkpointPath is not None:
+        try:
+            clutterFilter = ClutterFilter.load(checkpointPath)
+            start = clutterFilter.framesProcessed
+            print(f"Resuming at frame {start} from {checkpointPath}")
+        except FileNotFoundError:
+            pass
+
+    processor = RangeDopplerProcessor(config, maxBatch=batchFrames, clutterRemoval=clutterFilter)
+    frames = np.empty((batchFrames, config.frameSize), dtype=np.complex64)
+    scratch = np.empty((2, batchFrames, config.frameSize // 2), dtype=np.uint64)
+    began = time.perf_counter()
+    for first in range(start, len(reader), batchFrames):
+        batch = reader[first:first + batchFrames]
+        n = len(batch)
+        bin2np_frames(batch, frames[:n], scratch[:, :n])
+        profile = processor.process(frames[:n])['rangeProfile']
+        print(f"Frames {first}-{first + n - 1}: residual range profile mean {profile.mean():.1f}")
+        if checkpointPath is not None:
+            clutterFilter.save(checkpointPath)
+    seconds = time.perf_counter() - began
+    if seconds:
+        print(f"{(len(reader) - start) / seconds:.1f} frames/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+from plotData import RawDataReader
+from recorder import CAPTURE_EXTENSION, INDEX_DTYPE, CaptureRecorder, read_index
+
+AUDIO_EXTENSION = '.audio'
+AUDIO_INDEX_EXTENSION = '.aidx'
+MANIFEST_EXTENSION = '.json'
+AUDIO_INDEX_DTYPE = np.dtype([('sample', '<i8'), ('timestamp', '<f8'), ('count', '<u4'), ('dropped', '<u4')])
+"""
+- AUDIO_EXTENSION: Raw float32 audio samples, interleaved by channel.
+- AUDIO_INDEX_EXTENSION: One AUDIO_INDEX_DTYPE record per audio block.
+- MANIFEST_EXTENSION: JSON description of a co-capture: clock, audio format and radar segments.
+- AUDIO_INDEX_DTYPE: Index of the first sample of a block in the audio file, time of that
+  sample, number of samples and number of samples dropped before the block.
+"""
+
+
+class AudioCapture:
+    """
+    Non-blocking audio input: the stream callback copies every block into a sample ring.
+
+    The callback never blocks or allocates: it writes the samples and the time of their
+    first sample into preallocated rings and advances a counter; read() runs on the
+    consumer thread. If the consumer falls more than the ring capacity behind, the oldest
+    samples are dropped and counted. The callback has the signature of a sounddevice
+    InputStream callback, so the same object takes blocks from a real microphone or from
+    a FakeAudioSource.
+    """
+    def __init__(self, sampleRate=44100, channels=1, blockSize=1024, bufferSeconds=30, clock=time.monotonic,
+                 device=None):
+        """
+        Initialize the AudioCapture.
+
+        Args:
+            sampleRate (int): Samples per second.
+            channels (int): Number of channels.
+            blockSize (int): Samples per callback.
+            bufferSeconds (float): Capacity of the sample ring in seconds.
+            clock (callable): Clock stamping the blocks, shared with the radar capture.
+            device: sounddevice input device (default: the system default).
+        """
+        self.sampleRate = sampleRate
+        self.channels = channels
+        self.blockSize = blockSize
+        self.clock = clock
+        self.device = device
+        self.capacity = max(blockSize, int(bufferSeconds * sampleRate))
+        self.maxBlocks = self.capacity // blockSize + 1
+        self._samples = np.zeros((self.capacity, channels), dtype=np.float32)
+        self._blockStart = np.zeros(self.maxBlocks, dtype=np.int64)
+        self._blockTime = np.zeros(self.maxBlocks, dtype=np.float64)
+        self._blockCount = np.zeros(self.maxBlocks, dtype=np.int64)
+        # Single producer (callback), single consumer (read): each counter has one writer
+        self._writeSamples = 0
+        self._writeBlocks = 0
+        self._readSamples = 0
+        self._readBlocks = 0
+        self.droppedSamples = 0
+        self.statusFlags = 0
+        self._stream = None
+
+    def callback(self, indata, frames, time_info, status):
+        """
+        Store a block of samples; called by the audio stream.
+
+        Args:
+            indata (ndarray): (frames, channels) samples.
+            frames (int): Number of samples.
+            time_info: Stream timing information (unused, blocks are stamped with clock).
+            status: Stream status flags, counted in statusFlags when set.
+        """
+        # The block was recorded over the blockSize / sampleRate seconds before the callback
+        timestamp = self.clock() - frames / self.sampleRate
+        if status:
+            self.statusFlags += 1
+        start = self._writeSamples
+        first = start % self.capacity
+        head = min(frames, self.capacity - first)
+        self._samples[first:first + head] = indata[:head]
+        self._samples[:frames - head] = indata[head:]
+        slot = self._writeBlocks % self.maxBlocks
+        self._blockStart[slot] = start
+        self._blockTime[slot] = timestamp
+        self._blockCount[slot] = frames
+        self._writeSamples = start + frames
+        # Published last: read() only looks at blocks below _writeBlocks, whose records are complete
+        self._writeBlocks += 1
+
+    def start(self):
+        """
+        Open and start the sounddevice input stream.
+        """
+        import sounddevice as sd
+
+        self._stream = sd.InputStream(samplerate=self.sampleRate, channels=self.channels, blocksize=self.blockSize,
+                                      dtype='float32', device=self.device, callback=self.callback)
+        self._stream.start()
+
+    def stop(self):
+        """
+        Stop and close the input stream, if one was started.
+        """
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def read(self, timeout=0.1):
+        """
+        Get the blocks stored since the last call.
+
+        Args:
+            timeout (float): Seconds to wait for at least one block.
+
+        Returns:
+            tuple: (samples, channels) float32 copy of the samples, and AUDIO_INDEX_DTYPE records
+                   of their blocks, with sample positions counted from the start of the capture.
+        """
+        deadline = time.monotonic() + timeout
+        while self._writeBlocks == self._readBlocks and time.monotonic() < deadline:
+            time.sleep(0.005)
+        # Snapshot the block counter only and take the sample position from the last published
+        # block: _writeSamples may already include a block the callback is still writing
+        endBlocks = self._writeBlocks
+        if endBlocks == self._readBlocks:
+            endSamples = self._readSamples
+        else:
+            last = (endBlocks - 1) % self.maxBlocks
+            endSamples = int(self._blockStart[last] + self._blockCount[last])
+
+        # Blocks overwritten before they were read are dropped
+        firstBlock = max(self._readBlocks, endBlocks - self.maxBlocks + 1)
+        slots = np.arange(firstBlock, endBlocks) % self.maxBlocks
+        records = np.zeros(len(slots), dtype=AUDIO_INDEX_DTYPE)
+        records['sample'] = self._blockStart[slots]
+        records['timestamp'] = self._blockTime[slots]
+        records['count'] = self._blockCount[slots]
+        oldest = max(self._readSamples, endSamples - self.capacity)
+        keep = records['sample'] >= oldest
+        records = records[keep]
+        start = int(records['sample'][0]) if len(records) else endSamples
+        if len(records):
+            records['dropped'][0] = start - self._readSamples
+        self.droppedSamples += start - self._readSamples
+
+        positions = np.arange(start, endSamples) % self.capacity
+        samples = self._samples[positions]
+        self._readSamples = endSamples
+        self._readBlocks = endBlocks
+        return samples, records
+
+
+class FakeAudioSource(threading.Thread):
+    """
+    A thread class feeding generated audio to an AudioCapture callback in real time, for tests
+    without a sound device.
+    """
+    def __init__(self, capture, frequency=600.0, amplitude=0.5):
+        """
+        Initialize the FakeAudioSource.
+
+        Args:
+            capture (AudioCapture): Capture receiving the blocks.
+            frequency (float): Frequency of the generated tone in Hz, as in generate_sound.py.
+            amplitude (float): Amplitude of the tone.
+        """
+        threading.Thread.__init__(self)
+        self.whileSign = True
+        self.capture = capture
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.blocksSent = 0
+
+    def run(self):
+        """
+        Run the thread.
+        """
+        capture = self.capture
+        period = capture.blockSize / capture.sampleRate
+        start = time.monotonic()
+        while self.whileSign:
+            delay = start + (self.blocksSent + 1) * period - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            t = (self.blocksSent * capture.blockSize + np.arange(capture.blockSize)) / capture.sampleRate
+            block = self.amplitude * np.sin(2 * np.pi * self.frequency * t)
+            capture.callback(np.repeat(block[:, np.newaxis], capture.channels, axis=1).astype(np.float32),
+                             capture.blockSize, None, None)
+            self.blocksSent += 1
+
+    def stop(self):
+        """
+        Stop generating blocks.
+        """
+        self.whileSign = False
+
+
+class AudioRecorder(threading.Thread):
+    """
+    A thread class writing the blocks of an AudioCapture to <basePath>.audio and <basePath>.aidx.
+    """
+    def __init__(self, capture, basePath):
+        """
+        Initialize the AudioRecorder.
+
+        Args:
+            capture (AudioCapture): Capture to record from.
+            basePath (str): Path prefix of the audio and index files.
+        """
+        threading.Thread.__init__(self)
+        self.whileSign = True
+        self.capture = capture
+        self.basePath = basePath
+        self.samplesWritten = 0
+        self.blocksWritten = 0
+
+    def run(self):
+        """
+        Run the thread.
+        """
+        with open(self.basePath + AUDIO_EXTENSION, 'wb') as audioFile, \
+                open(self.basePath + AUDIO_INDEX_EXTENSION, 'wb') as indexFile:
+            while True:
+                running = self.whileSign
+                samples, records = self.capture.read(0.1 if running else 0)
+                if len(records):
+                    # Positions in the file, with the dropped samples left out
+                    records['sample'] = self.samplesWritten + np.concatenate(
+                        ([0], np.cumsum(records['count'][:-1])))
+                    audioFile.write(samples.tobytes())
+                    indexFile.write(records.tobytes())
+                    self.samplesWritten += len(samples)
+                    self.blocksWritten += len(records)
+                elif not running:
+                    break
+                audioFile.flush()
+                indexFile.flush()
+
+    def stop(self):
+        """
+        Stop recording once the blocks already captured are written.
+        """
+        self.whileSign = False
+
+    def getStats(self):
+        """
+        Get the recorder counters.
+
+        Returns:
+            dict: Samples and blocks written, and samples dropped by the capture ring.
+        """
+        return {'samples': self.samplesWritten,
+                'blocks': self.blocksWritten,
+                'dropped_samples': self.capture.droppedSamples}
+
+
+class CoCapture:
+    """
+    Record radar frames and audio together, stamped with one monotonic clock.
+
+    The radar frames are written by a CaptureRecorder to <basePath>_<n>.mmw segments and
+    the audio by an AudioRecorder to <basePath>.audio; <basePath>.json describes both,
+    and CoCaptureReader gives aligned random access to the result. The capture thread
+    must use the same clock as the audio, e.g. adcCapThread(..., clock=time.monotonic).
+    """
+    def __init__(self, capThread, audioCapture, basePath, **recorderOptions):
+        """
+        Initialize the CoCapture.
+
+        Args:
+            capThread (adcCapThread): Radar receiver, created with clock=audioCapture.clock.
+            audioCapture (AudioCapture): Audio input.
+            basePath (str): Path prefix of all files of the co-capture.
+            **recorderOptions: Further CaptureRecorder arguments, e.g. segmentBytes.
+        """
+        if capThread.clock is not audioCapture.clock:
+            raise ValueError("capThread and audioCapture must use the same clock")
+        self.capThread = capThread
+        self.audioCapture = audioCapture
+        self.basePath = basePath
+        self.radarRecorder = CaptureRecorder(capThread, basePath, **recorderOptions)
+        self.audioRecorder = AudioRecorder(audioCapture, basePath)
+        self._audioSource = None
+
+    def start(self, audioSource=None):
+        """
+        Start the audio input, the recorders and the radar receiver.
+
+        Args:
+            audioSource (FakeAudioSource): Thread to start instead of the sound device, for tests.
+        """
+        self.radarRecorder.start()
+        self.audioRecorder.start()
+        if audioSource is not None:
+            audioSource.start()
+        else:
+            self.audioCapture.start()
+        self._audioSource = audioSource
+        self.capThread.start()
+
+    def stop(self):
+        """
+        Stop capturing, write out the buffered frames and audio, and write the manifest.
+
+        Returns:
+            dict: The manifest.
+        """
+        self.capThread.stop()
+        if self._audioSource is not None:
+            self._audioSource.stop()
+            self._audioSource.join()
+        else:
+            self.audioCapture.stop()
+        self.radarRecorder.stop()
+        self.audioRecorder.stop()
+        self.radarRecorder.join()
+        self.audioRecorder.join()
+
+        clock = self.audioCapture.clock
+        manifest = {'clock': getattr(clock, '__name__', repr(clock)),
+                    'audio': {'sample_rate': self.audioCapture.sampleRate,
+                              'channels': self.audioCapture.channels,
+                              'path': os.path.basename(self.basePath + AUDIO_EXTENSION)},
+                    'radar_segments': [os.path.basename(path) for path in self.radarRecorder.segmentPaths],
+                    'radar': self.radarRecorder.getStats(),
+                    'audio_stats': self.audioRecorder.getStats()}
+        with open(self.basePath + MANIFEST_EXTENSION, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        return manifest
+
+
+class CoCaptureReader:
+    """
+    Aligned random access to a co-capture written by CoCapture.
+
+    Radar frames are memory-mapped from their segments and the audio from its sample
+    file; the frame and block indexes map both onto the shared clock, so the audio
+    recorded during any radar frame, or any time span, is found without reading the
+    rest of the capture.
+    """
+    def __init__(self, basePath):
+        """
+        Open a co-capture.
+
+        Args:
+            basePath (str): Path prefix given to CoCapture.
+        """
+        directory = os.path.dirname(os.path.abspath(basePath))
+        with open(basePath + MANIFEST_EXTENSION) as f:
+            self.manifest = json.load(f)
+        segments = self.manifest['radar_segments'] or sorted(
+            os.path.basename(path) for path in glob.glob(basePath + '_*' + CAPTURE_EXTENSION))
+        self.segments = [RawDataReader(os.path.join(directory, name)) for name in segments]
+        indexes = [read_index(segment.path)[:len(segment)] for segment in self.segments]
+        self.index = np.concatenate(indexes) if indexes else np.zeros(0, dtype=INDEX_DTYPE)
+        self._segmentStarts = np.cumsum([0] + [len(index) for index in indexes])
+
+        audio = self.manifest['audio']
+        self.sampleRate = audio['sample_rate']
+        self.channels = audio['channels']
+        audioPath = os.path.join(directory, audio['path'])
+        numSamples = os.path.getsize(audioPath) // (4 * self.channels)
+        self.audio = np.memmap(audioPath, dtype=np.float32, mode='r', shape=(numSamples, self.channels)) \
+            if numSamples else np.zeros((0, self.channels), dtype=np.float32)
+        self.audioIndex = np.fromfile(basePath + AUDIO_INDEX_EXTENSION, dtype=AUDIO_INDEX_DTYPE)
+
+        radarConfig = self.segments[0].frameconfig.radarConfig if self.segments else None
+        self.frameSeconds = radarConfig.frame_active_time * 1e-3 if radarConfig is not None else 0.0
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame(self, i):
+        """
+        Get a radar frame.
+
+        Args:
+            i (int): Frame position in the co-capture, from 0.
+
+        Returns:
+            tuple: Raw frame from its segment, and its INDEX_DTYPE record (frame number, timestamp, lost flag).
+        """
+        segment = int(np.searchsorted(self._segmentStarts, i, side='right')) - 1
+        return self.segments[segment][i - self._segmentStarts[segment]], self.index[i]
+
+    def sampleTime(self, samples):
+        """
+        Clock time of audio samples.
+
+        Args:
+            samples (ndarray): Sample positions in the audio file.
+
+        Returns:
+            ndarray: Times on the shared clock, interpolated within each block.
+        """
+        block = np.clip(np.searchsorted(self.audioIndex['sample'], samples, side='right') - 1, 0, None)
+        records = self.audioIndex[block]
+        return records['timestamp'] + (np.asarray(samples) - records['sample']) / self.sampleRate
+
+    def audioBetween(self, start, stop):
+        """
+        Get the audio recorded in a time span.
+
+        Args:
+            start (float): Start time on the shared clock.
+            stop (float): End time on the shared clock.
+
+        Returns:
+            tuple: (samples, channels) view into the audio and the time of its first sample.
+        """
+        if not len(self.audioIndex):
+            return self.audio[:0], start
+        blocks = self.audioIndex
+        blockEnds = blocks['timestamp'] + blocks['count'] / self.sampleRate
+        first = int(np.searchsorted(blockEnds, start, side='right'))
+        last = int(np.searchsorted(blocks['timestamp'], stop, side='left'))
+        if first >= last:
+            return self.audio[:0], start
+        begin = blocks['sample'][first] + max(0, int((start - blocks['timestamp'][first]) * self.sampleRate))
+        end = blocks['sample'][last - 1] + min(int(blocks['count'][last - 1]),
+                                               int(np.ceil((stop - blocks['timestamp'][last - 1]) * self.sampleRate)))
+        return self.audio[begin:end], float(self.sampleTime(begin))
+
+    def audioForFrame(self, i):
+        """
+        Get the audio recorded while the chirps of a radar frame were sent.
+
+        Frames are stamped when their last packet arrives, so the chirps span the
+        frame active time before the timestamp.
+
+        Args:
+            i (int): Frame position in the co-capture.
+
+        Returns:
+            tuple: (samples, channels) view into the audio and the time of its first sample.
+        """
+        timestamp = self.index['timestamp'][i]
+        return self.audioBetween(timestamp - self.frameSeconds, timestamp)
+
+
+def main():
+    # Usage: python cocapture.py <duration_seconds> [fake] [capture_to_replay]
+    import configuration as cfg
+    from steaming import adcCapThread
+
+    duration = float(sys.argv[1])
+    fake = len(sys.argv) > 2 and sys.argv[2] == 'fake'
+    basePath = str(int(time.time()))
+    if fake:
+        a = adcCapThread(1, "adc", static_ip='127.0.0.1', lostPacketPolicy='zerofill', clock=time.monotonic)
+    else:
+        a = adcCapThread(1, "adc", clock=time.monotonic)
+    audio = AudioCapture(clock=time.monotonic)
+    coCapture = CoCapture(a, audio, basePath)
+    coCapture.start(FakeAudioSource(audio) if fake else None)
+
+    replayer = None
+    if fake and len(sys.argv) > 3:
+        from dca1000_emulator import replay
+
+        packetsPerSec = cfg.RADAR_CONFIG.packets_in_frame * cfg.RADAR_CONFIG.frame_rate
+        # Frames are read from the capture a few at a time as they are sent
+        replayer = threading.Thread(target=replay, args=(sys.argv[3], '127.0.0.1', 4098, 0, packetsPerSec),
+                                    daemon=True)
+        replayer.start()
+    time.sleep(duration)
+    manifest = coCapture.stop()
+    print(manifest['radar'])
+    print(manifest['audio_stats'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from plotData import FrameConfig, RawDataReader
+from radar_config import RadarConfig
+from recorder import INDEX_DTYPE, read_header, read_index
+
+# Optional codecs, fastest first; zlib is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+COMPRESSED_MAGIC = b'MMWZ0001'
+CHUNK_MAGIC = b'CHNK'
+FOOTER_MAGIC = b'MMWZEND1'
+COMPRESSED_EXTENSION = '.mmwz'
+CODECS = ('zstd', 'lz4', 'zlib')
+CHUNK_HEADER = struct.Struct('<4sqIQI')
+FOOTER = struct.Struct('<QQ8s')
+CHUNK_DTYPE = np.dtype([('offset', '<u8'), ('size', '<u8'), ('first_frame', '<i8'), ('frames', '<u4'),
+                        ('crc', '<u4')])
+"""
+- COMPRESSED_MAGIC: First bytes of a compressed capture.
+- CHUNK_MAGIC: First bytes of every chunk, used to recover the chunks of a file without footer.
+- FOOTER_MAGIC: Last bytes of a complete compressed capture.
+- COMPRESSED_EXTENSION: File extension of compressed captures.
+- CODECS: Lossless compressors of the shuffled chunk bytes, fastest first.
+- CHUNK_HEADER: Chunk magic, first frame position, number of frames, compressed size and CRC-32
+  of the compressed bytes; followed by one INDEX_DTYPE record per frame and the compressed bytes.
+- FOOTER: Offset of the chunk table, number of chunks and FOOTER_MAGIC, at the end of the file.
+- CHUNK_DTYPE: Chunk table entry: offset of the compressed bytes, their size, first frame
+  position, number of frames and CRC-32.
+"""
+
+
+def default_codec():
+    """
+    Get the fastest installed codec.
+
+    Returns:
+        str: One of CODECS.
+    """
+    return 'zstd' if zstandard is not None else 'lz4' if lz4_frame is not None else 'zlib'
+
+
+def _compress(data, codec, level):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == 'lz4':
+        return lz4_frame.compress(data, compression_level=level)
+    return zlib.compress(data, level)
+
+
+def _decompress(data, codec, size):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    if codec == 'lz4':
+        return lz4_frame.decompress(data)
+    return zlib.decompress(data, bufsize=size)
+
+
+def encode_chunk(frames, codec, level=1, lag=4):
+    """
+    Compress a chunk of raw frames losslessly.
+
+    The int16 samples are delta coded against the sample lag positions earlier (the same
+    I or Q component of the previous sample pair in the LVDS layout), so slowly varying
+    signals become small numbers. Shuffling the low and high bytes of the deltas into
+    two planes leaves long runs of 0x00 and 0xFF high bytes for the compressor.
+
+    Args:
+        frames (ndarray): (n, UINT16_IN_FRAME) int16 frames.
+        codec (str): One of CODECS.
+        level (int): Compression level of the codec.
+        lag (int): Delta distance in samples; the frame length must be a multiple of it.
+            0 disables the delta coding, which suits noise-dominated captures.
+
+    Returns:
+        bytes: The compressed chunk.
+    """
+    samples = np.ascontiguousarray(frames, dtype=np.int16).reshape(-1)
+    if lag:
+        delta = np.empty_like(samples)
+        delta[:lag] = samples[:lag]
+        np.subtract(samples[lag:], samples[:-lag], out=delta[lag:])
+    else:
+        delta = samples
+    shuffled = delta.view(np.uint8).reshape(-1, 2).T.copy()
+    return _compress(shuffled.tobytes(), codec, level)
+
+
+def decode_chunk(data, codec, out, lag=4):
+    """
+    Decompress a chunk written by encode_chunk into a caller buffer.
+
+    Args:
+        data (bytes): The compressed chunk.
+        codec (str): One of CODECS.
+        out (ndarray): (n, UINT16_IN_FRAME) int16 C-contiguous buffer of the chunk's frames.
+        lag (int): Delta distance used by encode_chunk.
+
+    Returns:
+        ndarray: out.
+    """
+    flat = out.reshape(-1)
+    shuffled = np.frombuffer(_decompress(data, codec, flat.nbytes), dtype=np.uint8).reshape(2, -1)
+    interleaved = flat.view(np.uint8).reshape(-1, 2)
+    interleaved[:, 0] = shuffled[0]
+    interleaved[:, 1] = shuffled[1]
+    # Undo the delta coding: a running sum per lag phase, wrapping like the int16 subtraction
+    if lag:
+        phases = flat.reshape(-1, lag)
+        np.cumsum(phases, axis=0, dtype=np.int16, out=phases)
+    return out
+
+
+class CompressedCaptureWriter:
+    """
+    Write frames to a chunked, compressed and indexed capture.
+
+    Frames are collected into chunks of chunkFrames frames, compressed with encode_chunk
+    and appended, each with a header holding its frame index records. A chunk table and
+    footer are written on close(); without them (e.g. after a crash) the reader recovers
+    every complete chunk by scanning the chunk headers.
+    """
+    def __init__(self, path, radarConfig, chunkFrames=16, codec=None, level=1, lag=4, metadata=None):
+        """
+        Create a compressed capture.
+
+        Args:
+            path (str): Path of the new file.
+            radarConfig (RadarConfig): Radar configuration of the frames, stored in the header.
+            chunkFrames (int): Number of frames per chunk, the unit of compression and seeking.
+            codec (str): One of CODECS (default: the fastest installed one).
+            level (int): Compression level of the codec.
+            lag (int): Delta distance in samples, see encode_chunk.
+            metadata (dict): Further JSON-serializable header entries, e.g. the source file.
+        """
+        codec = codec if codec is not None else default_codec()
+        if codec not in CODECS:
+            raise ValueError(f"codec must be one of {CODECS}, got {codec!r}")
+        if (codec == 'zstd' and zstandard is None) or (codec == 'lz4' and lz4_frame is None):
+            raise ImportError(f"codec {codec!r} is not installed")
+        self.path = path
+        self.radarConfig = radarConfig
+        self.chunkFrames = chunkFrames
+        self.codec = codec
+        self.level = level
+        self.lag = lag
+        self.framesWritten = 0
+        self.rawBytes = 0
+        self.compressedBytes = 0
+        self._chunks = []
+        self._pending = []
+        self._pendingRecords = []
+
+        header = {'radar_config': radarConfig.to_dict(),
+                  'BYTES_IN_FRAME': radarConfig.bytes_in_frame,
+                  'codec': codec,
+                  'lag': lag,
+                  'chunk_frames': chunkFrames,
+                  'index_dtype': INDEX_DTYPE.descr,
+                  'created': time.time()}
+        header.update(metadata or {})
+        body = json.dumps(header).encode()
+        self._file = open(path, 'wb')
+        self._file.write(COMPRESSED_MAGIC + struct.pack('<I', len(body)) + body)
+
+    def write(self, frames, records):
+        """
+        Append frames.
+
+        Args:
+            frames (ndarray): (n, UINT16_IN_FRAME) int16 frames.
+            records (ndarray): n INDEX_DTYPE records: frame number, timestamp and lost flag.
+        """
+        self._pending.append(np.array(frames, dtype=np.int16, copy=True))
+        self._pendingRecords.append(np.asarray(records, dtype=INDEX_DTYPE))
+        pendingFrames = sum(len(chunk) for chunk in self._pending)
+        if pendingFrames >= self.chunkFrames:
+            frames = np.concatenate(self._pending)
+            records = np.concatenate(self._pendingRecords)
+            full = len(frames) // self.chunkFrames * self.chunkFrames
+            for first in range(0, full, self.chunkFrames):
+                chunk = frames[first:first + self.chunkFrames]
+                self.writeChunk(encode_chunk(chunk, self.codec, self.level, self.lag),
+                                records[first:first + self.chunkFrames])
+            self._pending = [frames[full:]] if full < len(frames) else []
+            self._pendingRecords = [records[full:]] if full < len(frames) else []
+
+    def writeChunk(self, data, records):
+        """
+        Append a chunk already compressed with encode_chunk, e.g. by a pool of encoders.
+
+        Args:
+            data (bytes): The compressed chunk.
+            records (ndarray): INDEX_DTYPE records of its frames.
+        """
+        records = np.asarray(records, dtype=INDEX_DTYPE)
+        crc = zlib.crc32(data)
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, self.framesWritten, len(records), len(data), crc))
+        self._file.write(records.tobytes())
+        offset = self._file.tell()
+        self._file.write(data)
+        self._chunks.append((offset, len(data), self.framesWritten, len(records), crc))
+        self.framesWritten += len(records)
+        self.rawBytes += len(records) * self.radarConfig.bytes_in_frame
+        self.compressedBytes += len(data)
+
+    def close(self):
+        """
+        Write the remaining frames, the chunk table and the footer, and close the file.
+        """
+        if self._pending:
+            frames = np.concatenate(self._pending)
+            records = np.concatenate(self._pendingRecords)
+            if len(frames):
+                self.writeChunk(encode_chunk(frames, self.codec, self.level, self.lag), records)
+            self._pending, self._pendingRecords = [], []
+        tableOffset = self._file.tell()
+        self._file.write(np.array(self._chunks, dtype=CHUNK_DTYPE).tobytes())
+        self._file.write(FOOTER.pack(tableOffset, len(self._chunks), FOOTER_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CompressedCaptureReader:
+    """
+    Random access to the frames of a compressed capture.
+
+    The chunk table gives the chunks holding any frame range; they are decompressed in
+    parallel threads (the codecs and numpy release the GIL) straight into the caller's
+    buffer. The frame index records of all frames are available in self.index.
+    """
+    def __init__(self, path, workers=None):
+        """
+        Open a compressed capture.
+
+        Args:
+            path (str): Path of the file.
+            workers (int): Number of decoding threads (default: all cores).
+        """
+        self.path = path
+        self.workers = workers if workers is not None else os.cpu_count()
+        self._file = open(path, 'rb')
+        prefix = self._file.read(len(COMPRESSED_MAGIC) + 4)
+        if prefix[:len(COMPRESSED_MAGIC)] != COMPRESSED_MAGIC:
+            raise ValueError(f"{path} is not a compressed capture")
+        self.header = json.loads(self._file.read(struct.unpack('<I', prefix[len(COMPRESSED_MAGIC):])[0]).decode())
+        self._dataStart = self._file.tell()
+        self.codec = self.header['codec']
+        self.lag = self.header['lag']
+        self.frameconfig = FrameConfig(RadarConfig.from_dict(self.header['radar_config']))
+        self.frameLength = self.frameconfig.frameSize * 2
+
+        self.recovered = False
+        self.chunks, self.index = self._read_table()
+        self._chunkStarts = self.chunks['first_frame']
+        self._executor = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, index):
+        """
+        Get frames as flat int16 arrays, like RawDataReader.
+
+        Args:
+            index (int or slice): Frame position or contiguous frame range.
+
+        Returns:
+            ndarray: (frameSize * 2,) or (n, frameSize * 2) int16 array.
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("only contiguous frame ranges are supported")
+            return self.read(start, stop)
+        if index < 0:
+            index += len(self)
+        return self.read(index, index + 1)[0]
+
+    def read(self, start, stop, out=None):
+        """
+        Decode a frame range.
+
+        Args:
+            start (int): First frame position.
+            stop (int): End of the range (exclusive).
+            out (ndarray): Optional (stop - start, frameSize * 2) int16 buffer to decode into.
+
+        Returns:
+            ndarray: out, or a new array, holding the frames.
+        """
+        stop = min(stop, len(self))
+        count = max(0, stop - start)
+        if out is None:
+            out = np.empty((count, self.frameLength), dtype=np.int16)
+        if not count:
+            return out
+        first = int(np.searchsorted(self._chunkStarts, start, side='right')) - 1
+        last = int(np.searchsorted(self._chunkStarts, stop, side='left'))
+        tasks = []
+        for chunk in self.chunks[first:last]:
+            chunkStart, chunkFrames = int(chunk['first_frame']), int(chunk['frames'])
+            lo, hi = max(start, chunkStart), min(stop, chunkStart + chunkFrames)
+            tasks.append((chunk, lo - chunkStart, hi - chunkStart, out[lo - start:hi - start]))
+        if len(tasks) > 1 and self.workers > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers)
+            list(self._executor.map(lambda task: self._decode(*task), tasks))
+        else:
+            for task in tasks:
+                self._decode(*task)
+        return out
+
+    def close(self):
+        """
+        Close the file and stop the decoding threads.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._file.close()
+
+    def _decode(self, chunk, lo, hi, out):
+        """
+        Decode frames lo:hi of a chunk into out.
+        """
+        data = os.pread(self._file.fileno(), int(chunk['size']), int(chunk['offset']))
+        if zlib.crc32(data) != chunk['crc']:
+            raise ValueError(f"chunk at offset {chunk['offset']} of {self.path} is corrupted")
+        if lo == 0 and hi == chunk['frames'] and out.flags['C_CONTIGUOUS']:
+            decode_chunk(data, self.codec, out, self.lag)
+        else:
+            frames = np.empty((int(chunk['frames']), self.frameLength), dtype=np.int16)
+            out[...] = decode_chunk(data, self.codec, frames, self.lag)[lo:hi]
+
+    def _read_table(self):
+        """
+        Read the chunk table and frame index, or recover them from the chunk headers.
+
+        Returns:
+            tuple: CHUNK_DTYPE chunk table and INDEX_DTYPE records of all frames.
+        """
+        size = os.fstat(self._file.fileno()).st_size
+        if size >= self._dataStart + FOOTER.size:
+            tableOffset, numChunks, magic = FOOTER.unpack(
+                os.pread(self._file.fileno(), FOOTER.size, size - FOOTER.size))
+            if magic == FOOTER_MAGIC:
+                chunks = np.frombuffer(os.pread(self._file.fileno(), numChunks * CHUNK_DTYPE.itemsize, tableOffset),
+                                       dtype=CHUNK_DTYPE)
+                records = [np.frombuffer(os.pread(self._file.fileno(), int(chunk['frames']) * INDEX_DTYPE.itemsize,
+                                                  int(chunk['offset']) - int(chunk['frames']) * INDEX_DTYPE.itemsize),
+                                         dtype=INDEX_DTYPE) for chunk in chunks]
+                return chunks, np.concatenate(records) if records else np.zeros(0, dtype=INDEX_DTYPE)
+
+        # No footer: keep every chunk that is complete and intact
+        self.recovered = True
+        chunks, records = [], []
+        offset = self._dataStart
+        framePosition = 0
+        while offset + CHUNK_HEADER.size <= size:
+            magic, firstFrame, numFrames, dataSize, crc = CHUNK_HEADER.unpack(
+                os.pread(self._file.fileno(), CHUNK_HEADER.size, offset))
+            dataOffset = offset + CHUNK_HEADER.size + numFrames * INDEX_DTYPE.itemsize
+            if magic != CHUNK_MAGIC or firstFrame != framePosition or dataOffset + dataSize > size:
+                break
+            data = os.pread(self._file.fileno(), dataSize, dataOffset)
+            if zlib.crc32(data) != crc:
+                break
+            records.append(np.frombuffer(os.pread(self._file.fileno(), numFrames * INDEX_DTYPE.itemsize,
+                                                  offset + CHUNK_HEADER.size), dtype=INDEX_DTYPE))
+            chunks.append((dataOffset, dataSize, firstFrame, numFrames, crc))
+            framePosition += numFrames
+            offset = dataOffset + dataSize
+        return (np.array(chunks, dtype=CHUNK_DTYPE),
+                np.concatenate(records) if records else np.zeros(0, dtype=INDEX_DTYPE))
+
+
+def _source_records(reader):
+    """
+    Frame index records of a raw capture: from its .idx file, or nominal ones for a .bin file.
+    """
+    index = read_index(reader.path)[:len(reader)]
+    if len(index) == len(reader):
+        return index
+    records = np.zeros(len(reader), dtype=INDEX_DTYPE)
+    records['frame_num'] = np.arange(len(reader))
+    records['timestamp'] = records['frame_num'] * reader.frameconfig.radarConfig.periodicity * 1e-3
+    return records
+
+
+def convert_capture(path, outputPath=None, chunkFrames=16, codec=None, level=1, workers=None):
+    """
+    Convert a raw .bin capture or CaptureRecorder segment to a compressed capture.
+
+    Chunks are compressed by a pool of threads and written in order.
+
+    Args:
+        path (str): Raw .bin capture or CaptureRecorder segment.
+        outputPath (str): Path of the compressed capture (default: path with COMPRESSED_EXTENSION).
+        chunkFrames (int): Number of frames per chunk.
+        codec (str): One of CODECS (default: the fastest installed one).
+        level (int): Compression level of the codec.
+        workers (int): Number of compressing threads (default: all cores).
+
+    Returns:
+        dict: Output path, frames, raw and compressed bytes, compression ratio and seconds.
+    """
+    outputPath = outputPath or os.path.splitext(path)[0] + COMPRESSED_EXTENSION
+    workers = workers if workers is not None else os.cpu_count()
+    reader = RawDataReader(path)
+    records = _source_records(reader)
+    start = time.perf_counter()
+    writer = CompressedCaptureWriter(outputPath, reader.frameconfig.radarConfig, chunkFrames, codec, level,
+                                     metadata={'source': os.path.basename(path),
+                                               'source_header': read_header(path) is not None})
+    bounds = [(first, min(first + chunkFrames, len(reader))) for first in range(0, len(reader), chunkFrames)]
+    with ThreadPoolExecutor(workers) as pool:
+        encoded = pool.map(lambda bound: encode_chunk(reader[bound[0]:bound[1]], writer.codec, level, writer.lag),
+                           bounds)
+        for (first, stop), data in zip(bounds, encoded):
+            writer.writeChunk(data, records[first:stop])
+    writer.close()
+    return {'path': outputPath,
+            'frames': writer.framesWritten,
+            'raw_bytes': writer.rawBytes,
+            'compressed_bytes': writer.compressedBytes,
+            'ratio': writer.rawBytes / writer.compressedBytes if writer.compressedBytes else 0.0,
+            'seconds': time.perf_counter() - start}
+
+
+def main():
+    # Usage: python compressed_capture.py <filename.bin|segment.mmw> [output.mmwz] [zstd|lz4|zlib] [level]
+    path = sys.argv[1]
+    outputPath = sys.argv[2] if len(sys.argv) > 2 else None
+    codec = sys.argv[3] if len(sys.argv) > 3 else None
+    level = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    stats = convert_capture(path, outputPath, codec=codec, level=level)
+    print(f"Wrote {stats['frames']} frames to {stats['path']}: {stats['raw_bytes'] / 2**20:.1f} MiB -> "
+          f"{stats['compressed_bytes'] / 2**20:.1f} MiB ({stats['ratio']:.2f}x) in {stats['seconds']:.1f} s")
+
+    reader = CompressedCaptureReader(stats['path'])
+    start = time.perf_counter()
+    out = np.empty((min(64, len(reader)), reader.frameLength), dtype=np.int16)
+    for first in range(0, len(reader), len(out)):
+        reader.read(first, first + len(out), out[:len(reader) - first])
+    seconds = time.perf_counter() - start
+    print(f"Decoded at {len(reader) / seconds:.1f} frames/sec" if seconds else "")
+
+
+if __name__ == "__main__":
+    main()
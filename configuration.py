@@ -1,6 +1,7 @@
 import numpy as np
+from radar_config import RadarConfig
 
-NUM_TX = 1 # tx order tx0,tx2,tx1, face to the board (left,right,upper) 
+NUM_TX = 3 # tx order tx0,tx2,tx1, face to the board (left,right,upper) 
 NUM_RX = 4
 
 START_FREQ = 60 
@@ -17,12 +18,20 @@ RAMP_END_TIME = 40
 NUM_FRAMES = 0 
 #  Set this to 0 to continuously stream data
 LOOPS_PER_FRAME = 128 # num of chirp loop, one loop has three chirps
-#PERIODICITY = 100 
+PERIODICITY = 100 
 # time for one chirp in ms  100ms == 10FPS
+NUM_ANGLE_BINS = 64
+
+# Single source of truth: the frame geometry of capture, DSP and tools is derived from RADAR_CONFIG
+RADAR_CONFIG = RadarConfig(num_tx=NUM_TX, num_rx=NUM_RX, start_freq=START_FREQ, adc_start_time=ADC_START_TIME,
+                           freq_slope=FREQ_SLOPE, adc_samples=ADC_SAMPLES, sample_rate=SAMPLE_RATE,
+                           rx_gain=RX_GAIN, idle_time=IDLE_TIME, ramp_end_time=RAMP_END_TIME,
+                           loops_per_frame=LOOPS_PER_FRAME, periodicity=PERIODICITY, num_frames=NUM_FRAMES,
+                           num_angle_bins=NUM_ANGLE_BINS)
+
 NUM_DOPPLER_BINS = LOOPS_PER_FRAME
 NUM_RANGE_BINS = ADC_SAMPLES
-NUM_ANGLE_BINS = 64
-RANGE_RESOLUTION = (3e8 * SAMPLE_RATE * 1e3) / (2 * FREQ_SLOPE * 1e12 * ADC_SAMPLES)
-MAX_RANGE = (300 * SAMPLE_RATE) / (2 * FREQ_SLOPE * 1e3)
-DOPPLER_RESOLUTION = 3e8 / (2 * START_FREQ * 1e9 * (IDLE_TIME + RAMP_END_TIME) * 1e-6 * NUM_DOPPLER_BINS * NUM_TX)
-MAX_DOPPLER = 3e8 / (4 * START_FREQ * 1e9 * (IDLE_TIME + RAMP_END_TIME) * 1e-6 * NUM_TX)
+RANGE_RESOLUTION = RADAR_CONFIG.range_resolution
+MAX_RANGE = RADAR_CONFIG.max_range
+DOPPLER_RESOLUTION = RADAR_CONFIG.doppler_resolution
+MAX_DOPPLER = RADAR_CONFIG.max_doppler
@@ -1,33 +1,34 @@
 from steaming import adcCapThread
+from recorder import CaptureRecorder
 import time
 import sys
 
 if __name__=='__main__':
-    a = adcCapThread(1,"adc")
-    a.start()
-    counter = 0
-    t = time.time()
-    time_min = 0
-    
-    f = open(str(t).split(".")[0]+".bin", "wb")
+    # Usage: python data_capture.py <minutes> [static_ip] [data_port]
     duration=int(sys.argv[1])
-    
-    while True:
-        readItem,itemNum,lostPacketFlag=a.getFrame()
-        if itemNum>0:
-            counter+=1
-            f.write(readItem.tobytes())
-            if counter == 600:
-                counter = 0
-                time_min+=1        
-            
-        elif itemNum==-1:
-            print(readItem)
-        elif itemNum==-2:       
-            time.sleep(0.04)
-        if time_min>=duration:    
-           a.whileSign = False 
-           f.close()
-           break
+    static_ip = sys.argv[2] if len(sys.argv) > 2 else '192.168.33.30'
+    data_port = int(sys.argv[3]) if len(sys.argv) > 3 else 4098
+    # Lost packets are zero-filled and flagged, so a dropped packet does not end an hours-long capture
+    a = adcCapThread(1,"adc", static_ip=static_ip, data_port=data_port, lostPacketPolicy='zerofill')
+    t = time.time()
+
+    # The recorder consumes the capture ring on its own thread and writes <t>_0000.mmw, ...
+    r = CaptureRecorder(a, str(t).split(".")[0])
+    a.start()
+    r.start()
+
+    # Record for the requested number of minutes of wall-clock time
+    end = time.monotonic() + duration * 60
+    while time.monotonic() < end:
+        if not a.is_alive():
+            print('Receiver stopped early, ending the capture')
+            break
+        time.sleep(min(1.0, end - time.monotonic()))
+
+    a.stop()
+    r.stop()
+    r.join()
+    print(a.getStats())
+    print(r.getStats())
     print('Done')
     print('\a')
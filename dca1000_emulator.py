@@ -0,0 +1,339 @@
+import os
+import socket
+import sys
+import threading
+import time
+import numpy as np
+import configuration as cfg
+from steaming import BYTES_IN_FRAME, BYTES_IN_PACKET, PACKET_HEADER
+
+SPEED_OF_LIGHT = 3e8
+"""
+- SPEED_OF_LIGHT: Speed of light in m/s, as in the resolutions of radar_config.py.
+"""
+
+
+def packetize(stream, first_byte_count=0, first_packet_num=1):
+    """
+    Split a raw ADC byte stream into DCA1000 UDP datagrams.
+
+    Args:
+        stream (bytes-like): Raw ADC data, e.g. the contents of a captured .bin file.
+        first_byte_count (int): DCA1000 byte count of the first packet, i.e. the number of
+                                bytes the board has already sent before this stream.
+        first_packet_num (int): Sequence number of the first packet.
+
+    Yields:
+        bytes: One datagram, a 10-byte header followed by up to BYTES_IN_PACKET payload bytes.
+    """
+    stream = memoryview(stream).cast('B')
+    for index, offset in enumerate(range(0, len(stream) - BYTES_IN_PACKET + 1, BYTES_IN_PACKET)):
+        byte_count = first_byte_count + offset
+        header = PACKET_HEADER.pack(first_packet_num + index, byte_count & 0xFFFFFFFF, byte_count >> 32)
+        yield header + stream[offset:offset + BYTES_IN_PACKET].tobytes()
+
+
+def capture_datagrams(path, first_byte_count=0, chunkFrames=16):
+    """
+    Split the frames of a capture file into DCA1000 UDP datagrams, reading a few frames at a time.
+
+    Frames are read with RawDataReader, so the header of a CaptureRecorder segment is not
+    sent and a long capture is never held in memory as a whole.
+
+    Args:
+        path (str): Raw .bin capture or CaptureRecorder segment.
+        first_byte_count (int): DCA1000 byte count of the first packet.
+        chunkFrames (int): Number of frames read at a time.
+
+    Yields:
+        bytes: One datagram, as from packetize().
+    """
+    from plotData import RawDataReader
+
+    reader = RawDataReader(path)
+    byte_count = first_byte_count
+    leftover = np.zeros(0, dtype=np.uint8)
+    for first in range(0, len(reader), chunkFrames):
+        data = np.frombuffer(memoryview(reader[first:first + chunkFrames]).cast('B'), dtype=np.uint8)
+        # Frames do not end on packet boundaries, the remainder starts the next chunk
+        if len(leftover):
+            data = np.concatenate((leftover, data))
+        whole = len(data) - len(data) % BYTES_IN_PACKET
+        yield from packetize(data[:whole], byte_count, 1 + (byte_count - first_byte_count) // BYTES_IN_PACKET)
+        byte_count += whole
+        leftover = data[whole:].copy()
+
+
+def impair(datagrams, loss=0.0, reorder=0.0, reorder_depth=8, seed=None):
+    """
+    Drop and reorder datagrams, as a congested link would.
+
+    Args:
+        datagrams (iterable): Datagrams in sending order, e.g. from packetize().
+        loss (float): Probability of dropping each datagram.
+        reorder (float): Probability of delaying each datagram behind later ones.
+        reorder_depth (int): Maximum number of datagrams a delayed datagram falls behind.
+        seed (int): Seed of the random generator, for reproducible impairments.
+
+    Yields:
+        bytes: The datagrams that are sent, in their new order.
+    """
+    rng = np.random.default_rng(seed)
+    held = []
+    for index, datagram in enumerate(datagrams):
+        if loss and rng.random() < loss:
+            continue
+        if reorder and rng.random() < reorder:
+            held.append((index + int(rng.integers(1, reorder_depth + 1)), datagram))
+        else:
+            yield datagram
+        if held:
+            due = [item for item in held if item[0] <= index]
+            held = [item for item in held if item[0] > index]
+            for _, late in due:
+                yield late
+    for _, late in held:
+        yield late
+
+
+def synthesize_frames(num_frames, targets=(), radar_config=cfg.RADAR_CONFIG, noise=8.0, seed=None):
+    """
+    Generate raw ADC frames of point targets, in the LVDS layout of a DCA1000 capture.
+
+    Every target is a point with a constant radial velocity; its range moves from frame to
+    frame, and its azimuth sets the phase across the virtual array of angle.AZIMUTH_TX.
+
+    Args:
+        num_frames (int): Number of frames.
+        targets (iterable): Dicts with 'range' (m), and optionally 'velocity' (m/s, positive
+                            moving away), 'angle' (degrees) and 'amplitude' (ADC counts).
+        radar_config (RadarConfig): Frame geometry and chirp parameters.
+        noise (float): Standard deviation of the complex white noise in ADC counts.
+        seed (int): Seed of the noise generator.
+
+    Returns:
+        ndarray: (num_frames, uint16_in_frame) int16 frames, e.g. for .tobytes() and replay().
+    """
+    from angle import AZIMUTH_TX
+
+    rc = radar_config
+    rng = np.random.default_rng(seed)
+    loops, tx, rx, samples = rc.loops_per_frame, rc.num_tx, rc.num_rx, rc.adc_samples
+    wavelength = SPEED_OF_LIGHT / (rc.start_freq * 1e9)
+    chirp = (np.arange(loops)[:, np.newaxis] * tx + np.arange(tx)).reshape(loops, tx, 1, 1)
+    # Position of every virtual antenna along the azimuth array, in half wavelengths
+    azimuthTx = AZIMUTH_TX if tx == 3 else tuple(range(tx))
+    block = np.array([azimuthTx.index(t) if t in azimuthTx else 0 for t in range(tx)])
+    position = (block[:, np.newaxis] * rx + np.arange(rx)).reshape(1, tx, rx, 1)
+    sample = np.arange(samples).reshape(1, 1, 1, samples)
+
+    frames = np.empty((num_frames, rc.uint16_in_frame), dtype=np.int16)
+    for f in range(num_frames):
+        signal = rng.normal(scale=noise / np.sqrt(2), size=(loops, tx, rx, samples, 2)).view(np.complex128)[..., 0]
+        for target in targets:
+            velocity = target.get('velocity', 0.0)
+            distance = target['range'] + velocity * f * rc.periodicity * 1e-3
+            phase = (2 * np.pi * distance / rc.range_resolution * sample / samples
+                     + 4 * np.pi * velocity * chirp * rc.chirp_time * 1e-6 / wavelength
+                     + np.pi * np.sin(np.radians(target.get('angle', 0.0))) * position)
+            signal = signal + target.get('amplitude', 500.0) * np.exp(1j * phase)
+        # complex I Q pairs to the LVDS order I0 I1 Q0 Q1 of each two samples
+        pairs = np.stack([signal.real, signal.imag], axis=-1).reshape(-1, 2, 2)
+        frames[f] = np.clip(np.round(pairs.transpose(0, 2, 1)), -32768, 32767).reshape(-1)
+    return frames
+
+
+def replay(stream, host='127.0.0.1', port=4098, first_byte_count=0, packets_per_sec=None, loss=0.0, reorder=0.0,
+           reorder_depth=8, seed=None, bind=None):
+    """
+    Send a raw ADC byte stream to an adcCapThread as the DCA1000 would.
+
+    Args:
+        stream (bytes-like or str): Raw ADC data to send, or the path of a capture file,
+                                    replayed with capture_datagrams().
+        host (str): Destination address, the static_ip the receiver is bound to.
+        port (int): Destination port, the data_port the receiver is bound to.
+        first_byte_count (int): DCA1000 byte count of the first packet.
+        packets_per_sec (float): Send rate limit, or None to send as fast as possible.
+        loss (float): Probability of dropping each packet, see impair().
+        reorder (float): Probability of delaying each packet, see impair().
+        reorder_depth (int): Maximum number of packets a delayed packet falls behind.
+        seed (int): Seed of the loss and reordering generator.
+        bind (tuple): (address, port) the sender is bound to, e.g. ('192.168.33.180', 4098) on
+                      a host that takes the DCA1000 address; None lets the system choose.
+
+    Returns:
+        int: Number of packets sent.
+    """
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2**22)
+    if bind is not None:
+        sender.bind(bind)
+    if isinstance(stream, (str, os.PathLike)):
+        datagrams = capture_datagrams(stream, first_byte_count)
+    else:
+        datagrams = packetize(stream, first_byte_count)
+    if loss or reorder:
+        datagrams = impair(datagrams, loss, reorder, reorder_depth, seed)
+    start = time.perf_counter()
+    sent = 0
+    for datagram in datagrams:
+        sender.sendto(datagram, (host, port))
+        sent += 1
+        if packets_per_sec:
+            # Sleep until the schedule catches up with the packets already sent
+            delay = start + sent / packets_per_sec - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    sender.close()
+    return sent
+
+
+def _drain(capThread, received):
+    """
+    Consume the frames of a capture thread as fast as they arrive, until it stops.
+    """
+    while capThread.whileSign or capThread.getStats()['ring_occupancy']:
+        frames, _, _, _ = capThread.getFrames(64, 0.2)
+        received[0] += len(frames)
+        capThread.releaseFrames()
+
+
+def load_test(frames_per_sec, stream, receiver='recvmmsg', host='127.0.0.1', port=4098, settle=1.0, **options):
+    """
+    Replay a stream to a fresh adcCapThread at a given frame rate and check that it keeps up.
+
+    Args:
+        frames_per_sec (float): Replay rate in frames per second.
+        stream (bytes-like): Raw ADC data of whole frames.
+        receiver (str): adcCapThread receiver, one of steaming.RECEIVER_MODES.
+        host (str): Address the receiver is bound to.
+        port (int): Data port of the receiver; port + 1 is used as its config port.
+        settle (float): Seconds given to the receiver to catch up after the last packet.
+        **options: Further replay() arguments, e.g. loss or reorder.
+
+    Returns:
+        dict: Requested and achieved send rates, frames sent and received, the receiver
+              statistics and whether every frame arrived complete ('sustained').
+    """
+    from steaming import adcCapThread
+
+    capThread = adcCapThread(1, "adc", static_ip=host, data_port=port, config_port=port + 1, bufferSize=64,
+                             receiver=receiver, lostPacketPolicy='zerofill', overflowPolicy='drop_oldest')
+    # A receiver blocked in recv after stop() must not keep the process alive; it releases
+    # its ports once the socket times out, so every load test uses new ones
+    capThread.daemon = True
+    received = [0]
+    consumer = threading.Thread(target=_drain, args=(capThread, received), daemon=True)
+    capThread.start()
+    consumer.start()
+
+    # A leading partial frame lets the receiver find the start of the first full frame
+    numFrames = len(stream) // BYTES_IN_FRAME
+    start = time.perf_counter()
+    sent = replay(bytes(1000) + bytes(stream), host, port, BYTES_IN_FRAME - 1000,
+                  packets_per_sec=frames_per_sec * BYTES_IN_FRAME / BYTES_IN_PACKET, **options)
+    elapsed = time.perf_counter() - start
+    time.sleep(settle)
+    capThread.stop()
+    consumer.join()
+    stats = capThread.getStats()
+
+    # The last frame is only published when the next frame starts, which never comes
+    expected = numFrames - 1
+    return {'frames_per_sec': frames_per_sec,
+            'sent_frames_per_sec': sent * BYTES_IN_PACKET / BYTES_IN_FRAME / elapsed if elapsed else 0.0,
+            'frames_sent': numFrames,
+            'frames_received': received[0],
+            'receiver': stats,
+            'sustained': (received[0] >= expected and stats['lost_packets'] == 0
+                          and stats['dropped_frames'] == 0)}
+
+
+def max_frame_rate(stream, receiver='recvmmsg', start_rate=None, max_rate=1000.0, tolerance=0.05, port=4098,
+                   **options):
+    """
+    Find the highest frame rate at which an adcCapThread receives every frame complete.
+
+    The rate is doubled from start_rate until a load test fails, then bisected. The
+    replayer shares the machine with the receiver, so when the achieved send rate falls
+    short of the requested one the result is a lower bound of the receiver's capacity.
+
+    Args:
+        stream (bytes-like): Raw ADC data of whole frames, e.g. from synthesize_frames().
+        receiver (str): adcCapThread receiver, one of steaming.RECEIVER_MODES.
+        start_rate (float): First rate tried in frames per second (default: the configured frame rate).
+        max_rate (float): Highest rate tried.
+        tolerance (float): Relative precision of the bisection.
+        port (int): First data port; each load test uses a new pair of ports.
+        **options: Further load_test() arguments.
+
+    Returns:
+        tuple: Highest sustained frame rate (0.0 if none), and the results of all load tests.
+    """
+    rate = start_rate if start_rate is not None else cfg.RADAR_CONFIG.frame_rate
+    trials = []
+
+    def trial(frames_per_sec):
+        result = load_test(frames_per_sec, stream, receiver, port=port + 2 * len(trials), **options)
+        trials.append(result)
+        return result
+
+    good, bad = 0.0, None
+    while rate <= max_rate:
+        result = trial(rate)
+        if not result['sustained']:
+            bad = rate
+            break
+        if result['sent_frames_per_sec'] < (1 - tolerance) * rate:
+            # The replayer cannot send faster, so this is as far as the test goes
+            return max(good, result['sent_frames_per_sec']), trials
+        good = rate
+        rate *= 2
+    if bad is None:
+        return good, trials
+    while bad - good > tolerance * bad:
+        middle = (good + bad) / 2
+        if trial(middle)['sustained']:
+            good = middle
+        else:
+            bad = middle
+    return good, trials
+
+
+def main():
+    # Usage: python dca1000_emulator.py <filename.bin|synthetic> [host] [port] [packets_per_sec] [loss] [reorder]
+    #        python dca1000_emulator.py benchmark [recvmmsg|zerocopy|python] [frames]
+    if sys.argv[1] == 'benchmark':
+        receiver = sys.argv[2] if len(sys.argv) > 2 else 'recvmmsg'
+        numFrames = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+        stream = synthesize_frames(numFrames, [{'range': 1.0, 'velocity': 0.5}], seed=0).tobytes()
+        rate, trials = max_frame_rate(stream, receiver, port=5098)
+        for result in trials:
+            print(f"{result['frames_per_sec']:7.1f} fps requested, {result['sent_frames_per_sec']:7.1f} sent, "
+                  f"{result['frames_received']}/{result['frames_sent']} received, "
+                  f"{result['receiver']['lost_packets']} packets lost: "
+                  f"{'ok' if result['sustained'] else 'FAILED'}")
+        last = trials[-1]
+        if last['sustained'] and last['sent_frames_per_sec'] < 0.95 * last['frames_per_sec']:
+            print(f"The replayer could not send faster than {rate:.1f} fps; the {receiver} receiver kept up")
+        else:
+            print(f"Maximum sustainable frame rate of the {receiver} receiver: {rate:.1f} fps")
+        return
+
+    host = sys.argv[2] if len(sys.argv) > 2 else '127.0.0.1'
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 4098
+    packets_per_sec = float(sys.argv[4]) if len(sys.argv) > 4 else None
+    loss = float(sys.argv[5]) if len(sys.argv) > 5 else 0.0
+    reorder = float(sys.argv[6]) if len(sys.argv) > 6 else 0.0
+
+    if sys.argv[1] == 'synthetic':
+        stream = synthesize_frames(100, [{'range': 1.0, 'velocity': 0.5}, {'range': 2.0, 'angle': 20}]).tobytes()
+    else:
+        stream = sys.argv[1]
+    sent = replay(stream, host, port, packets_per_sec=packets_per_sec, loss=loss, reorder=reorder)
+    print(f"Sent {sent} packets to {host}:{port}")
+
+
+if __name__ == "__main__":
+    main()
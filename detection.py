@@ -0,0 +1,541 @@
+import sys
+import numpy as np
+import configuration as cfg
+
+CFAR_METHODS = ('ca', 'os')
+DETECTION_DTYPE = np.dtype([('frame', '<i8'), ('doppler_bin', '<i4'), ('range_bin', '<i4'),
+                            ('range', '<f4'), ('velocity', '<f4'), ('value', '<f4'), ('snr', '<f4')])
+TRACK_DTYPE = np.dtype([('frame', '<i8'), ('track_id', '<i8'), ('range', '<f4'), ('velocity', '<f4'),
+                        ('doppler_velocity', '<f4'), ('hits', '<i4'), ('confirmed', '?')])
+"""
+- CFAR_METHODS: Cell averaging ('ca') or ordered statistic ('os') noise estimation.
+- DETECTION_DTYPE: One detected peak: frame number, cell, range (m), radial velocity (m/s),
+  cell value and signal-to-noise ratio (dB).
+- TRACK_DTYPE: State of one track after a frame: range (m), range rate (m/s) estimated by
+  the tracker, last measured Doppler velocity (m/s), number of updates and confirmation.
+"""
+
+
+def cfar_scale(numTraining, pfa):
+    """
+    Threshold factor of a CA-CFAR detector on square-law (power) cells.
+
+    Args:
+        numTraining (int): Number of training cells.
+        pfa (float): Probability of false alarm.
+
+    Returns:
+        float: Factor applied to the mean of the training cells.
+    """
+    return numTraining * (pfa ** (-1 / numTraining) - 1)
+
+
+def os_cfar_scale(numTraining, rank, pfa):
+    """
+    Threshold factor of an OS-CFAR detector on square-law (power) cells.
+
+    For exponentially distributed noise, the probability that a cell exceeds scale times
+    the rank-th smallest of numTraining training cells is the product over i < rank of
+    (numTraining - i) / (numTraining - i + scale); it is solved for scale by bisection.
+
+    Args:
+        numTraining (int): Number of training cells.
+        rank (int): 1-based rank of the training cell used as noise estimate.
+        pfa (float): Probability of false alarm.
+
+    Returns:
+        float: Factor applied to the rank-th training cell.
+    """
+    counts = numTraining - np.arange(rank)
+    low, high = 0.0, 1.0
+    while np.sum(np.log(counts / (counts + high))) > np.log(pfa):
+        high *= 2
+    for _ in range(60):
+        middle = (low + high) / 2
+        if np.sum(np.log(counts / (counts + middle))) > np.log(pfa):
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def _check_doppler_window(guard, training, numDoppler):
+    """
+    Reject windows that wrap around the Doppler axis onto themselves.
+    """
+    width = 2 * (guard[0] + training[0]) + 1
+    if width > numDoppler:
+        raise ValueError(f"the CFAR window spans {width} Doppler bins, more than the {numDoppler} of the maps")
+
+
+def _pad_cells(maps, padDoppler, padRange, fill):
+    """
+    Pad (n, doppler, range) maps: circularly along Doppler, with a constant along range.
+    """
+    maps = np.concatenate([maps[:, maps.shape[1] - padDoppler:], maps, maps[:, :padDoppler]], axis=1)
+    return np.pad(maps, ((0, 0), (0, 0), (padRange, padRange)), constant_values=fill)
+
+
+def _window_sums(integral, padDoppler, padRange, halfDoppler, halfRange, shape):
+    """
+    Sum of the (2*halfDoppler+1, 2*halfRange+1) window around every cell from an integral image.
+    """
+    numDoppler, numRange = shape
+    top = slice(padDoppler - halfDoppler, padDoppler - halfDoppler + numDoppler)
+    bottom = slice(padDoppler + halfDoppler + 1, padDoppler + halfDoppler + 1 + numDoppler)
+    left = slice(padRange - halfRange, padRange - halfRange + numRange)
+    right = slice(padRange + halfRange + 1, padRange + halfRange + 1 + numRange)
+    return (integral[..., bottom, right] - integral[..., top, right]
+            - integral[..., bottom, left] + integral[..., top, left])
+
+
+def _integral_image(padded):
+    integral = np.zeros(padded.shape[:-2] + (padded.shape[-2] + 1, padded.shape[-1] + 1), dtype=np.float64)
+    np.cumsum(padded, axis=-2, out=integral[..., 1:, 1:])
+    np.cumsum(integral[..., 1:, 1:], axis=-1, out=integral[..., 1:, 1:])
+    return integral
+
+
+def ca_cfar_2d(maps, guard=(2, 2), training=(4, 8), pfa=1e-4, scale=None):
+    """
+    Two-dimensional cell-averaging CFAR over a batch of range-Doppler maps.
+
+    The training and guard window sums are taken from integral images, so the cost per
+    cell does not depend on the window sizes. The Doppler axis wraps around; at the range
+    edges only the training cells inside the map are averaged, and the threshold factor
+    follows their number. The window must not be wider than the number of Doppler bins.
+
+    Args:
+        maps (ndarray): (n, doppler bins, range bins) or (doppler bins, range bins) power maps.
+        guard (tuple): Guard cells on each side, (Doppler, range).
+        training (tuple): Training cells on each side beyond the guard cells, (Doppler, range).
+        pfa (float): Probability of false alarm, used if scale is None.
+        scale (float): Threshold factor applied to the noise estimate (default: cfar_scale of
+                       the number of training cells of every cell).
+
+    Returns:
+        tuple: Boolean detection mask and noise estimate, both of the shape of maps.
+    """
+    maps = np.asarray(maps)
+    single = maps.ndim == 2
+    maps = maps.reshape((-1,) + maps.shape[-2:])
+    shape = maps.shape[1:]
+    _check_doppler_window(guard, training, shape[0])
+    padDoppler = guard[0] + training[0]
+    padRange = guard[1] + training[1]
+
+    integral = _integral_image(_pad_cells(maps, padDoppler, padRange, 0))
+    cells = _integral_image(_pad_cells(np.ones((1,) + shape), padDoppler, padRange, 0))
+    outer = (guard[0] + training[0], guard[1] + training[1])
+    trainingSum = (_window_sums(integral, padDoppler, padRange, *outer, shape)
+                   - _window_sums(integral, padDoppler, padRange, *guard, shape))
+    trainingCount = (_window_sums(cells, padDoppler, padRange, *outer, shape)
+                     - _window_sums(cells, padDoppler, padRange, *guard, shape))
+    noise = (trainingSum / np.maximum(trainingCount, 1)).astype(np.float32)
+
+    if scale is None:
+        # Fewer training cells at the range edges need a higher factor for the same pfa
+        scale = cfar_scale(np.maximum(trainingCount, 1), pfa).astype(np.float32)
+    detections = maps > scale * noise
+    if single:
+        return detections[0], noise[0]
+    return detections, noise
+
+
+def os_cfar_2d(maps, guard=(2, 2), training=(4, 8), rank=0.75, pfa=1e-4, scale=None, candidates=None):
+    """
+    Two-dimensional ordered-statistic CFAR over a batch of range-Doppler maps.
+
+    The noise estimate of a cell is the rank-th quantile of its training cells, which is
+    robust to other targets in the training window but, unlike ca_cfar_2d, costs time
+    and memory proportional to the number of training cells. Restricting it to candidate
+    cells, e.g. the local maxima of the maps, keeps it within the frame period.
+
+    Args:
+        maps (ndarray): (n, doppler bins, range bins) or (doppler bins, range bins) power maps.
+        guard (tuple): Guard cells on each side, (Doppler, range).
+        training (tuple): Training cells on each side beyond the guard cells, (Doppler, range).
+        rank (float): Quantile of the training cells used as noise estimate, between 0 and 1.
+        pfa (float): Probability of false alarm, used if scale is None.
+        scale (float): Threshold factor applied to the noise estimate (default: os_cfar_scale).
+        candidates (ndarray): Boolean mask of the cells to test (default: all cells).
+
+    Returns:
+        tuple: Boolean detection mask and noise estimate (inf outside the candidates),
+               both of the shape of maps.
+    """
+    maps = np.asarray(maps, dtype=np.float32)
+    shape = maps.shape
+    maps = maps.reshape((-1,) + shape[-2:])
+    numDoppler, numRange = maps.shape[1:]
+    if candidates is None:
+        candidates = np.ones(maps.shape, dtype=bool)
+    _check_doppler_window(guard, training, numDoppler)
+    index, dopplerBin, rangeBin = np.nonzero(candidates.reshape(maps.shape))
+    outer = (guard[0] + training[0], guard[1] + training[1])
+    padDoppler = outer[0]
+    # Cells outside the map along range are +inf, so they sort last and are rarely picked
+    padded = _pad_cells(maps, padDoppler, outer[1], np.inf)
+
+    offsets = [(d, r) for d in range(-outer[0], outer[0] + 1) for r in range(-outer[1], outer[1] + 1)
+               if abs(d) > guard[0] or abs(r) > guard[1]]
+    window = np.empty((len(index), len(offsets)), dtype=np.float32)
+    for k, (d, r) in enumerate(offsets):
+        window[:, k] = padded[index, dopplerBin + padDoppler + d, rangeBin + outer[1] + r]
+    k = min(len(offsets) - 1, int(rank * len(offsets)))
+    if scale is None:
+        scale = os_cfar_scale(len(offsets), k + 1, pfa)
+
+    noise = np.full(maps.shape, np.inf, dtype=np.float32)
+    noise[index, dopplerBin, rangeBin] = np.partition(window, k, axis=1)[:, k]
+    detections = maps > scale * noise
+    return detections.reshape(shape), noise.reshape(shape)
+
+
+def local_peaks(maps, detections):
+    """
+    Group detected cells into peaks: keep the cells that are maxima of their 3x3 neighbourhood.
+
+    Args:
+        maps (ndarray): (n, doppler bins, range bins) maps.
+        detections (ndarray): Boolean detection mask of the same shape.
+
+    Returns:
+        ndarray: Boolean mask of the peaks.
+    """
+    numDoppler, numRange = maps.shape[-2:]
+    padded = _pad_cells(maps.reshape((-1,) + maps.shape[-2:]), 1, 1, -np.inf).reshape(
+        maps.shape[:-2] + (numDoppler + 2, numRange + 2))
+    peaks = detections.copy()
+    for d in (-1, 0, 1):
+        for r in (-1, 0, 1):
+            if d or r:
+                peaks &= maps >= padded[..., 1 + d:1 + d + numDoppler, 1 + r:1 + r + numRange]
+    return peaks
+
+
+def suppress_sidelobes(maps, peaks, guard=(2, 2), sidelobeLevel=30.0):
+    """
+    Non-maximum suppression of the peaks produced by stronger ones.
+
+    A strong target leaks along its Doppler row (range sidelobes) and its range column
+    (Doppler sidelobes and clutter removal residue), and the ripple of that leakage passes
+    the CFAR of the weaker cells around it. A peak is removed when a stronger peak lies in
+    the guard window around it, or lies within the guard cells of its row or column and is
+    more than sidelobeLevel dB stronger.
+
+    Args:
+        maps (ndarray): (n, doppler bins, range bins) power maps.
+        peaks (ndarray): Boolean mask of the peaks, e.g. from local_peaks.
+        guard (tuple): Half-width of the suppression window and of the row and column bands, (Doppler, range).
+        sidelobeLevel (float): Level in dB below a stronger peak on the same row or column
+                               under which a peak is taken for one of its sidelobes.
+
+    Returns:
+        ndarray: Boolean mask of the remaining peaks.
+    """
+    numDoppler = maps.shape[-2]
+    index, dopplerBin, rangeBin = np.nonzero(peaks.reshape((-1,) + peaks.shape[-2:]))
+    values = maps.reshape((-1,) + maps.shape[-2:])[index, dopplerBin, rangeBin]
+    ratio = 10 ** (-sidelobeLevel / 10)
+    kept = np.ones(len(index), dtype=bool)
+    bounds = np.searchsorted(index, np.arange(index[-1] + 2)) if len(index) else [0]
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        # Pairs of peaks of one frame: [i, j] compares peak i to peak j
+        value = values[start:stop]
+        dopplerDistance = np.abs(dopplerBin[start:stop, np.newaxis] - dopplerBin[np.newaxis, start:stop])
+        dopplerDistance = np.minimum(dopplerDistance, numDoppler - dopplerDistance)
+        sameRow = dopplerDistance <= guard[0]
+        sameColumn = np.abs(rangeBin[start:stop, np.newaxis] - rangeBin[np.newaxis, start:stop]) <= guard[1]
+        stronger = value[:, np.newaxis] > value[np.newaxis]
+        sidelobe = (sameRow | sameColumn) & (value[np.newaxis] < ratio * value[:, np.newaxis])
+        kept[start:stop] = ~np.any(stronger & ((sameRow & sameColumn) | sidelobe), axis=0)
+
+    remaining = np.zeros(peaks.shape, dtype=bool)
+    remaining.reshape((-1,) + peaks.shape[-2:])[index[kept], dopplerBin[kept], rangeBin[kept]] = True
+    return remaining
+
+
+class Track:
+    """
+    One target followed by the AlphaBetaTracker.
+    """
+    def __init__(self, trackId, range_m, doppler_velocity):
+        self.trackId = trackId
+        self.range = range_m
+        self.velocity = 0.0
+        self.dopplerVelocity = doppler_velocity
+        self.hits = 1
+        self.misses = 0
+
+
+class AlphaBetaTracker:
+    """
+    Lightweight multi-target tracker on range with alpha-beta filters.
+
+    Every frame, the tracks are predicted forward, detections are associated to them by
+    greedy nearest neighbour inside a range and Doppler velocity gate, and unassociated
+    detections start new tracks. A track is confirmed after confirmHits updates and
+    deleted after maxMisses frames without detection.
+    """
+    def __init__(self, alpha=0.5, beta=0.2, rangeGate=0.3, velocityGate=1.0, confirmHits=3, maxMisses=5,
+                 framePeriod=cfg.RADAR_CONFIG.periodicity * 1e-3):
+        """
+        Initialize the AlphaBetaTracker.
+
+        Args:
+            alpha (float): Range gain of the filter.
+            beta (float): Range rate gain of the filter.
+            rangeGate (float): Maximum range difference in meters between a track and its detection.
+            velocityGate (float): Maximum Doppler velocity difference in m/s.
+            confirmHits (int): Number of updates after which a track is confirmed.
+            maxMisses (int): Number of consecutive frames without detection after which a track is deleted.
+            framePeriod (float): Time between frames in seconds.
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.rangeGate = rangeGate
+        self.velocityGate = velocityGate
+        self.confirmHits = confirmHits
+        self.maxMisses = maxMisses
+        self.framePeriod = framePeriod
+        self.tracks = []
+        self._nextId = 0
+        self._lastFrame = None
+
+    def update(self, detections, frame=0):
+        """
+        Advance the tracks to a frame.
+
+        Args:
+            detections (ndarray): DETECTION_DTYPE detections of the frame.
+            frame (int): Frame number, stored in the returned states. The tracks are predicted
+                         over the frames since the previous update, so skipped frames are
+                         accounted for; one frame period if frame does not advance.
+
+        Returns:
+            ndarray: TRACK_DTYPE state of every live track after the frame.
+        """
+        frame = int(frame)
+        if self._lastFrame is not None and frame > self._lastFrame:
+            dt = (frame - self._lastFrame) * self.framePeriod
+        else:
+            dt = self.framePeriod
+        self._lastFrame = frame
+        for track in self.tracks:
+            track.range += track.velocity * dt
+
+        # Greedy nearest-neighbour association inside the gates
+        used = np.zeros(len(detections), dtype=bool)
+        if len(self.tracks) and len(detections):
+            ranges = np.array([track.range for track in self.tracks])
+            velocities = np.array([track.dopplerVelocity for track in self.tracks])
+            rangeError = np.abs(detections['range'][np.newaxis] - ranges[:, np.newaxis])
+            velocityError = np.abs(detections['velocity'][np.newaxis] - velocities[:, np.newaxis])
+            cost = rangeError / self.rangeGate + velocityError / self.velocityGate
+            cost[(rangeError > self.rangeGate) | (velocityError > self.velocityGate)] = np.inf
+            assigned = np.zeros(len(self.tracks), dtype=bool)
+            for flat in np.argsort(cost, axis=None):
+                t, d = np.unravel_index(flat, cost.shape)
+                if not np.isfinite(cost[t, d]):
+                    break
+                if assigned[t] or used[d]:
+                    continue
+                assigned[t] = used[d] = True
+                self._correct(self.tracks[t], detections[d], dt)
+            for track, hit in zip(self.tracks, assigned):
+                if not hit:
+                    track.misses += 1
+        else:
+            for track in self.tracks:
+                track.misses += 1
+
+        self.tracks = [track for track in self.tracks if track.misses <= self.maxMisses]
+        for detection in detections[~used]:
+            self.tracks.append(Track(self._nextId, float(detection['range']), float(detection['velocity'])))
+            self._nextId += 1
+
+        states = np.zeros(len(self.tracks), dtype=TRACK_DTYPE)
+        for state, track in zip(states, self.tracks):
+            state['frame'] = frame
+            state['track_id'] = track.trackId
+            state['range'] = track.range
+            state['velocity'] = track.velocity
+            state['doppler_velocity'] = track.dopplerVelocity
+            state['hits'] = track.hits
+            state['confirmed'] = track.hits >= self.confirmHits
+        return states
+
+    def _correct(self, track, detection, dt):
+        residual = float(detection['range']) - track.range
+        track.range += self.alpha * residual
+        track.velocity += self.beta / dt * residual
+        track.dopplerVelocity = float(detection['velocity'])
+        track.hits += 1
+        track.misses = 0
+
+
+class TargetDetector:
+    """
+    CFAR detection, peak grouping and tracking of batches of range-Doppler maps.
+
+    The same object serves batch processing of a capture (detect_capture) and streaming
+    (detect_stream): maps are given in frame order, batch by batch.
+    """
+    def __init__(self, method='ca', guard=(2, 2), training=(4, 8), pfa=1e-4, scale=None, sidelobeLevel=30.0,
+                 rangeOffset=0, rangeResolution=cfg.RANGE_RESOLUTION, dopplerResolution=cfg.DOPPLER_RESOLUTION,
+                 tracker=None):
+        """
+        Initialize the TargetDetector.
+
+        Args:
+            method (str): One of CFAR_METHODS.
+            guard (tuple): Guard cells on each side, (Doppler, range).
+            training (tuple): Training cells on each side beyond the guard cells, (Doppler, range).
+            pfa (float): Probability of false alarm of the CFAR.
+            scale (float): Threshold factor, overriding pfa.
+            sidelobeLevel (float): Level in dB of the peaks removed as sidelobes of stronger
+                                   ones, see suppress_sidelobes(), or None to keep every peak.
+            rangeOffset (int): Range bin of the first column of the maps, if they are cropped.
+            rangeResolution (float): Meters per range bin.
+            dopplerResolution (float): m/s per Doppler bin.
+            tracker (AlphaBetaTracker): Tracker fed with the detections (default: a new one),
+                                        or False to only detect.
+        """
+        if method not in CFAR_METHODS:
+            raise ValueError(f"method must be one of {CFAR_METHODS}, got {method!r}")
+        self.method = method
+        self.guard = guard
+        self.training = training
+        self.pfa = pfa
+        self.scale = scale
+        self.sidelobeLevel = sidelobeLevel
+        self.rangeOffset = rangeOffset
+        self.rangeResolution = rangeResolution
+        self.dopplerResolution = dopplerResolution
+        self.tracker = AlphaBetaTracker() if tracker is None else tracker or None
+
+    def detect(self, maps, frames):
+        """
+        Detect peaks in a batch of range-Doppler maps.
+
+        Args:
+            maps (ndarray): (n, doppler bins, range bins) magnitude maps with zero velocity in
+                            the centre row, e.g. RangeDopplerProcessor 'rangeDoppler' results,
+                            or a single (doppler bins, range bins) map.
+            frames (ndarray): Frame numbers of the maps, or the frame number of a single map.
+
+        Returns:
+            ndarray: DETECTION_DTYPE detections, in frame order.
+        """
+        maps = np.asarray(maps, dtype=np.float32)
+        maps = maps.reshape((-1,) + maps.shape[-2:])
+        frames = np.atleast_1d(frames)
+        power = np.square(maps)
+        if self.method == 'ca':
+            detected, noise = ca_cfar_2d(power, self.guard, self.training, self.pfa, self.scale)
+            peaks = local_peaks(power, detected)
+        else:
+            # Only local maxima can become peaks, so the costly estimate is limited to them
+            peaks = local_peaks(power, np.ones(power.shape, dtype=bool))
+            detected, noise = os_cfar_2d(power, self.guard, self.training, pfa=self.pfa, scale=self.scale,
+                                         candidates=peaks)
+            peaks &= detected
+        if self.sidelobeLevel is not None:
+            peaks = suppress_sidelobes(power, peaks, self.guard, self.sidelobeLevel)
+        index, dopplerBin, rangeBin = np.nonzero(peaks)
+
+        detections = np.zeros(len(index), dtype=DETECTION_DTYPE)
+        detections['frame'] = frames[index]
+        detections['doppler_bin'] = dopplerBin
+        detections['range_bin'] = rangeBin + self.rangeOffset
+        detections['range'] = (rangeBin + self.rangeOffset) * self.rangeResolution
+        detections['velocity'] = (dopplerBin - power.shape[1] // 2) * self.dopplerResolution
+        detections['value'] = power[index, dopplerBin, rangeBin]
+        detections['snr'] = 10 * np.log10(detections['value'] / np.maximum(noise[index, dopplerBin, rangeBin], 1e-30))
+        return detections
+
+    def process(self, maps, frames):
+        """
+        Detect peaks in a batch of maps and update the tracks frame by frame.
+
+        Args:
+            maps (ndarray): (n, doppler bins, range bins) magnitude maps or a single map, see detect().
+            frames (ndarray): Frame numbers of the maps.
+
+        Returns:
+            tuple: DETECTION_DTYPE detections and TRACK_DTYPE track states of all frames of the batch.
+        """
+        frames = np.atleast_1d(frames)
+        detections = self.detect(maps, frames)
+        states = []
+        if self.tracker is not None:
+            bounds = np.searchsorted(detections['frame'], frames, side='left')
+            ends = np.searchsorted(detections['frame'], frames, side='right')
+            for frame, start, end in zip(frames, bounds, ends):
+                states.append(self.tracker.update(detections[start:end], frame))
+        tracks = np.concatenate(states) if states else np.zeros(0, dtype=TRACK_DTYPE)
+        return detections, tracks
+
+
+def detect_capture(rangeDoppler, detector=None, batchFrames=64, startFrame=0):
+    """
+    Run detection and tracking over the range-Doppler maps of a whole capture.
+
+    Args:
+        rangeDoppler (ndarray): (frames, doppler bins, range bins) maps, e.g. a memory-mapped
+                                product of offline_processing or ProductCache; read in batches.
+        detector (TargetDetector): Detector to use (default: a new CA-CFAR detector with tracker).
+        batchFrames (int): Number of maps processed at once.
+        startFrame (int): Frame number of the first map.
+
+    Returns:
+        tuple: DETECTION_DTYPE detections and TRACK_DTYPE track states of all frames.
+    """
+    detector = detector if detector is not None else TargetDetector()
+    detections, tracks = [], []
+    for first in range(0, len(rangeDoppler), batchFrames):
+        maps = rangeDoppler[first:first + batchFrames]
+        frames = np.arange(startFrame + first, startFrame + first + len(maps))
+        batchDetections, batchTracks = detector.process(maps, frames)
+        detections.append(batchDetections)
+        tracks.append(batchTracks)
+    if not detections:
+        return np.zeros(0, dtype=DETECTION_DTYPE), np.zeros(0, dtype=TRACK_DTYPE)
+    return np.concatenate(detections), np.concatenate(tracks)
+
+
+def detect_stream(subscription, detector=None):
+    """
+    Run detection and tracking on the results of a StreamingPipeline as they arrive.
+
+    Args:
+        subscription (Subscription): Value returned by StreamingPipeline.subscribe().
+        detector (TargetDetector): Detector to use (default: a new CA-CFAR detector with tracker).
+
+    Yields:
+        tuple: The pipeline result, its DETECTION_DTYPE detections and the TRACK_DTYPE track states.
+    """
+    detector = detector if detector is not None else TargetDetector()
+    for result in subscription:
+        detections, tracks = detector.process(result['rangeDoppler'][np.newaxis], np.array([result['frame']]))
+        yield result, detections, tracks
+
+
+def main():
+    # Usage: python detection.py <filename.bin>
+    from product_cache import ProductCache
+
+    products = ProductCache().get(sys.argv[1])
+    detections, tracks = detect_capture(products['rangeDoppler'])
+    confirmed = tracks[tracks['confirmed']]
+    print(f"{len(detections)} detections in {len(products)} frames, "
+          f"{len(np.unique(confirmed['track_id']))} confirmed tracks")
+    for trackId in np.unique(confirmed['track_id']):
+        states = confirmed[confirmed['track_id'] == trackId]
+        print(f"  track {trackId}: frames {states['frame'][0]}-{states['frame'][-1]}, "
+              f"range {states['range'].min():.2f}-{states['range'].max():.2f} m")
+
+
+if __name__ == "__main__":
+    main()
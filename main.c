@@ -3,7 +3,13 @@
 #include <stdint.h>
 #include <complex.h>
 
-#define FRAME_SIZE 12 * 128 * 256 * 4
+// Frame geometry, must match configuration.py; print it with
+// python -c "import configuration; print(configuration.RADAR_CONFIG.c_defines())"
+#define NUM_LOOPS 128
+#define NUM_TX 3
+#define NUM_RX 4
+#define ADC_SAMPLES 256
+#define FRAME_SIZE (NUM_LOOPS * NUM_TX * NUM_RX * ADC_SAMPLES * 4)
 #define BIN_FILENAME "1684598876.bin"
 #define TOTAL_FRAME_NUMBER 799
 
@@ -80,9 +86,9 @@ int16_t* complexFrame(int16_t* bin_frame) {
  * @return The reshaped 4D array.
  */
 Complex**** reshape(const Complex* np_frame, int np_frame_length, int* shape) {
-    int dim1 = 128;
-    int dim2 = 3;
-    int dim3 = 4;
+    int dim1 = NUM_LOOPS;
+    int dim2 = NUM_TX;
+    int dim3 = NUM_RX;
     int dim0 = np_frame_length / (dim1 * dim2 * dim3);
 
     Complex**** frameWithChirp = (Complex****)malloc(sizeof(Complex***) * dim1);
@@ -173,7 +179,7 @@ int main() {
         printf("Size of np_frame %d\n", sizeof(np_frame));
         
         int shape[4];
-        int np_frame_length = 128 * 3 * 4 * 256;  // Adjust the length according to your data
+        int np_frame_length = NUM_LOOPS * NUM_TX * NUM_RX * ADC_SAMPLES;
 
         // Reshape and transpose np_frame
         Complex**** frameWithChirp = reshape(np_frame, np_frame_length, shape);
@@ -0,0 +1,269 @@
+import os
+import sys
+import numpy as np
+import configuration as cfg
+
+SPEED_OF_LIGHT = 3e8
+"""
+- SPEED_OF_LIGHT: Speed of light in m/s, as in the resolutions of radar_config.py.
+"""
+
+
+class IncrementalSTFT:
+    """
+    Sliding-window STFT of a stream of samples, computed as the samples arrive.
+
+    Samples are appended to a preallocated buffer; every window that is complete is
+    transformed once, in one batched FFT per push, and only the overlap still needed by
+    the next window is kept, moved to the front when the buffer runs full. The columns
+    of a stream pushed in pieces are identical to those of the whole signal at once.
+    Several channels, e.g. antennas, can be pushed together as (k, channels) samples and
+    are transformed in the same FFT.
+    """
+    def __init__(self, windowSize, hopSize, sampleRate, window=np.hanning, nfft=None, bufferSize=None):
+        """
+        Initialize the IncrementalSTFT.
+
+        Args:
+            windowSize (int): Number of samples per window.
+            hopSize (int): Number of samples between the starts of consecutive windows.
+            sampleRate (float): Samples per second, for the time and frequency axes.
+            window (callable): Window function, e.g. np.hanning.
+            nfft (int): FFT size, at least windowSize (default: windowSize).
+            bufferSize (int): Capacity of the sample buffer (default: 8 windows).
+        """
+        if not 0 < hopSize <= windowSize:
+            raise ValueError(f"hopSize must be between 1 and windowSize={windowSize}, got {hopSize}")
+        self.windowSize = windowSize
+        self.hopSize = hopSize
+        self.sampleRate = sampleRate
+        self.nfft = nfft if nfft is not None else windowSize
+        self.window = window(windowSize).astype(np.float32)
+        self.bufferSize = max(bufferSize or 8 * windowSize, windowSize + hopSize)
+        self.columns = 0
+        self._buffer = None
+        self._start = 0
+        self._stop = 0
+
+    @property
+    def frequencies(self):
+        """
+        Frequency of every row of the spectra in Hz, increasing (fftshifted for complex input).
+        """
+        if self._buffer is not None and not np.iscomplexobj(self._buffer):
+            return np.fft.rfftfreq(self.nfft, 1 / self.sampleRate)
+        return np.fft.fftshift(np.fft.fftfreq(self.nfft, 1 / self.sampleRate))
+
+    def columnTimes(self, first, count):
+        """
+        Centre time of spectrum columns, in seconds from the first sample.
+
+        Args:
+            first (int): Index of the first column.
+            count (int): Number of columns.
+
+        Returns:
+            ndarray: (count,) times.
+        """
+        return ((first + np.arange(count)) * self.hopSize + self.windowSize / 2) / self.sampleRate
+
+    def push(self, samples):
+        """
+        Append samples and transform the windows they complete.
+
+        Args:
+            samples (ndarray): (k,) or (k, channels) real or complex samples; the number of
+                               channels is fixed by the first push.
+
+        Returns:
+            ndarray: (windows, frequencies) or (windows, channels, frequencies) float32 power
+                     of the completed windows, possibly empty; one-sided for real input,
+                     fftshifted for complex input.
+        """
+        samples = np.asarray(samples)
+        if self._buffer is None:
+            dtype = np.complex64 if np.iscomplexobj(samples) else np.float32
+            self._buffer = np.zeros((self.bufferSize,) + samples.shape[1:], dtype=dtype)
+        spectra = []
+        while len(samples):
+            if self._stop == self.bufferSize:
+                # Keep only the samples of windows that are not complete yet
+                kept = self._stop - self._start
+                self._buffer[:kept] = self._buffer[self._start:self._stop]
+                self._start, self._stop = 0, kept
+            count = min(len(samples), self.bufferSize - self._stop)
+            self._buffer[self._stop:self._stop + count] = samples[:count]
+            self._stop += count
+            samples = samples[count:]
+            spectra.append(self._transform())
+        if not spectra:
+            return self._empty()
+        return np.concatenate(spectra)
+
+    def _empty(self):
+        """
+        Get an empty result, shaped like those of push().
+        """
+        return np.zeros((0,) + self._buffer.shape[1:] + (len(self.frequencies),), dtype=np.float32)
+
+    def _transform(self):
+        """
+        Transform the complete windows in the buffer and drop the samples no longer needed.
+        """
+        numWindows = max(0, (self._stop - self._start - self.windowSize) // self.hopSize + 1)
+        if not numWindows:
+            return self._empty()
+        # (windows, [channels,] windowSize) views of the buffer
+        segments = np.lib.stride_tricks.sliding_window_view(
+            self._buffer[self._start:self._stop], self.windowSize, axis=0)[:numWindows * self.hopSize:self.hopSize]
+        if np.iscomplexobj(self._buffer):
+            spectrum = np.fft.fftshift(np.fft.fft(segments * self.window, n=self.nfft, axis=-1), axes=-1)
+        else:
+            spectrum = np.fft.rfft(segments * self.window, n=self.nfft, axis=-1)
+        self._start += numWindows * self.hopSize
+        self.columns += numWindows
+        return np.square(np.abs(spectrum)).astype(np.float32)
+
+
+class MicroDopplerExtractor:
+    """
+    Time-Doppler spectrogram of one range bin over consecutive frames.
+
+    The slow-time samples of the range bin (one per chirp loop and virtual antenna) are
+    concatenated frame after frame and fed to an IncrementalSTFT, so the spectrogram of a
+    long capture or a live stream is built a few columns at a time. The spectrograms of
+    the virtual antennas are summed in power: a coherent sum of the antennas would be a
+    beam towards boresight, attenuating targets at other angles. Alternatively, a single
+    virtual antenna can be followed.
+    The idle time between the chirps of consecutive frames, and lost frames, are filled
+    with zeros, so that the slow-time axis stays uniformly sampled.
+    """
+    def __init__(self, frameConfig, rangeBin, windowSize=256, hopSize=32, fillGaps=True, antenna=None):
+        """
+        Initialize the MicroDopplerExtractor.
+
+        Args:
+            frameConfig (FrameConfig): Frame geometry.
+            rangeBin (int): Range bin to follow, relative to the range bins of the cubes given to push().
+            windowSize (int): Number of slow-time samples per STFT window.
+            hopSize (int): Number of slow-time samples between windows.
+            fillGaps (bool): Zero-fill the time between frames; otherwise frames are concatenated directly.
+            antenna (int): Virtual antenna (tx * numRxAntennas + rx) to follow, or None to sum
+                           the power of all of them.
+        """
+        radarConfig = frameConfig.radarConfig
+        self.rangeBin = rangeBin
+        self.antenna = antenna
+        self.numLoops = frameConfig.numLoopsPerFrame
+        # One slow-time sample per loop of numTx chirps
+        loopPeriod = radarConfig.chirp_time * 1e-6 * radarConfig.num_tx
+        self.gapSamples = 0
+        if fillGaps:
+            self.gapSamples = max(0, int(round(radarConfig.periodicity * 1e-3 / loopPeriod)) - self.numLoops)
+        self.wavelength = SPEED_OF_LIGHT / (radarConfig.start_freq * 1e9)
+        self.stft = IncrementalSTFT(windowSize, hopSize, 1 / loopPeriod)
+        self._lastFrame = None
+
+    @property
+    def velocities(self):
+        """
+        Radial velocity of every row of the spectrogram in m/s.
+        """
+        return self.stft.frequencies * self.wavelength / 2
+
+    def push(self, cube, frames):
+        """
+        Append a batch of frames.
+
+        Args:
+            cube (ndarray): (n, loops, tx, rx, range bins) range FFT, e.g. RangeDopplerProcessor.rangeCube().
+            frames (ndarray): Frame numbers of the n frames, increasing.
+
+        Returns:
+            ndarray: (columns, Doppler bins) float32 power of the spectrogram columns completed by the batch.
+        """
+        n = cube.shape[0]
+        # (n, loops, virtual antennas) slow-time samples
+        slowTime = cube[..., self.rangeBin].reshape(n, self.numLoops, -1)
+        if self.antenna is not None:
+            slowTime = slowTime[..., self.antenna]
+        periodSamples = self.numLoops + self.gapSamples
+        missing = 0 if self._lastFrame is None else frames[0] - self._lastFrame - 1
+        span = frames[-1] - frames[0] + 1
+        samples = np.zeros(((missing + span) * periodSamples,) + slowTime.shape[2:], dtype=np.complex64)
+        for frame, chirps in zip(frames, slowTime):
+            offset = (missing + frame - frames[0]) * periodSamples
+            samples[offset:offset + self.numLoops] = chirps
+        self._lastFrame = frames[-1]
+        power = self.stft.push(samples)
+        return power if self.antenna is not None else power.sum(axis=1)
+
+
+def audio_spectrogram(path, windowSize=4096, hopSize=1024, blockSize=2**16):
+    """
+    Spectrogram of an audio recording, read and transformed block by block.
+
+    Args:
+        path (str): Audio file readable by soundfile, e.g. the .wav recordings of analyseSound.ipynb.
+        windowSize (int): Number of samples per STFT window.
+        hopSize (int): Number of samples between windows.
+        blockSize (int): Number of samples read at a time.
+
+    Returns:
+        tuple: (columns, frequencies) float32 power, column times in seconds and frequencies in Hz.
+    """
+    import soundfile as sf
+
+    stft = IncrementalSTFT(windowSize, hopSize, sf.info(path).samplerate)
+    columns = []
+    for block in sf.blocks(path, blocksize=blockSize, dtype='float32', always_2d=True):
+        # Mix the channels down to mono
+        columns.append(stft.push(block.mean(axis=1)))
+    spectrogram = np.concatenate(columns) if columns else np.zeros((0, windowSize // 2 + 1), dtype=np.float32)
+    return spectrogram, stft.columnTimes(0, len(spectrogram)), stft.frequencies
+
+
+def main():
+    # Usage: python micro_doppler.py <filename.bin|segment.mmw> <range_meters> | python micro_doppler.py <recording.wav>
+    import matplotlib.pyplot as plt
+    from recorder import read_header
+
+    path = sys.argv[1]
+    # Raw .bin captures and CaptureRecorder segments are radar data, anything else is audio
+    isRadar = os.path.splitext(path)[1].lower() in ('.bin', '.mmw') or read_header(path) is not None
+    if not isRadar:
+        spectrogram, times, frequencies = audio_spectrogram(path)
+        extent = (times[0], times[-1], frequencies[0], frequencies[-1])
+        ylabel = 'Frequency (Hz)'
+    else:
+        from plotData import RawDataReader, bin2np_frames
+        from processing import RangeDopplerProcessor
+
+        reader = RawDataReader(path)
+        config = reader.frameconfig
+        rangeBin = int(float(sys.argv[2]) / cfg.RANGE_RESOLUTION)
+        batchFrames = 16
+        processor = RangeDopplerProcessor(config, maxBatch=batchFrames, rangeBins=(rangeBin, rangeBin + 1))
+        extractor = MicroDopplerExtractor(config, 0)
+        frames = np.empty((batchFrames, config.frameSize), dtype=np.complex64)
+        columns = []
+        for first in range(0, len(reader), batchFrames):
+            n = min(batchFrames, len(reader) - first)
+            bin2np_frames(reader[first:first + n], out=frames[:n])
+            processor.rangeStage(frames[:n])
+            processor.clutterStage(n)
+            columns.append(extractor.push(processor.rangeCube(n), np.arange(first, first + n)))
+        spectrogram = np.concatenate(columns)
+        times = extractor.stft.columnTimes(0, len(spectrogram))
+        extent = (times[0], times[-1], extractor.velocities[0], extractor.velocities[-1])
+        ylabel = 'Velocity (m/s)'
+
+    plt.imshow(10 * np.log10(spectrogram.T + 1e-12), aspect='auto', origin='lower', extent=extent, cmap='viridis')
+    plt.xlabel('Time (s)')
+    plt.ylabel(ylabel)
+    plt.colorbar(label='Power (dB)')
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
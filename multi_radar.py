@@ -0,0 +1,559 @@
+import dataclasses
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import configuration as cfg
+
+RING_HEADER_DTYPE = np.dtype([('slots', '<i8'), ('frame_length', '<i8'),
+                              ('write_seq', '<i8'), ('read_seq', '<i8'), ('dropped_frames', '<i8'),
+                              ('status', '<i8'), ('stop', '<i8'), ('pid', '<i8'), ('heartbeat', '<f8'),
+                              ('packets', '<i8'), ('frames', '<i8'), ('lost_packets', '<i8'),
+                              ('lost_frames', '<i8'), ('skipped_frames', '<i8')])
+RING_ALIGN = 4096
+RECEIVER_STATES = ('starting', 'running', 'stopped', 'failed')
+"""
+- RING_HEADER_DTYPE: Shared header of a SharedFrameRing: geometry, ring counters, receiver
+  control and status, and the receiver counters copied from adcCapThread.getStats().
+- RING_ALIGN: Alignment of the header, index arrays and frame area in the shared memory.
+- RECEIVER_STATES: Values of the receiver status, by index.
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class RadarDevice:
+    """
+    Network endpoint of one DCA1000 and the core its receiver process runs on.
+    """
+    name: str
+    static_ip: str = '192.168.33.30'
+    adc_ip: str = '192.168.33.180'
+    data_port: int = 4098
+    config_port: int = 4096
+    cpu: int = None
+
+
+def _aligned(size):
+    return -(-size // RING_ALIGN) * RING_ALIGN
+
+
+class SharedFrameRing:
+    """
+    Single-producer/single-consumer frame ring in shared memory.
+
+    The layout follows the adcCapThread ring: frame sequence number k lives in slot
+    k % slots, the producer alone advances write_seq and the consumer alone advances
+    read_seq. A slot is filled before write_seq is published (an aligned 8-byte store),
+    so the consumer never sees a partial frame. A full ring drops the new frames, so the
+    receiver never waits for the consumer.
+    """
+    def __init__(self, memory, owner):
+        """
+        Map the ring in a SharedMemory block; use create() or attach().
+
+        Args:
+            memory (SharedMemory): The shared memory block.
+            owner (bool): Whether this process created the block and unlinks it.
+        """
+        self.memory = memory
+        self.owner = owner
+        self.name = memory.name
+        self.header = np.ndarray((), dtype=RING_HEADER_DTYPE, buffer=memory.buf)
+        self.slots = int(self.header['slots'])
+        self.frameLength = int(self.header['frame_length'])
+        offset = _aligned(RING_HEADER_DTYPE.itemsize)
+        self.frameNums = np.ndarray(self.slots, dtype=np.int64, buffer=memory.buf, offset=offset)
+        offset += _aligned(self.slots * 8)
+        self.timestamps = np.ndarray(self.slots, dtype=np.float64, buffer=memory.buf, offset=offset)
+        offset += _aligned(self.slots * 8)
+        self.lostFlags = np.ndarray(self.slots, dtype=bool, buffer=memory.buf, offset=offset)
+        offset += _aligned(self.slots)
+        self.frames = np.ndarray((self.slots, self.frameLength), dtype=np.int16, buffer=memory.buf, offset=offset)
+
+    @classmethod
+    def create(cls, slots, frameLength=cfg.RADAR_CONFIG.uint16_in_frame):
+        """
+        Allocate a new ring.
+
+        Args:
+            slots (int): Number of frames the ring holds.
+            frameLength (int): Number of int16 values per frame.
+
+        Returns:
+            SharedFrameRing: The ring; its name is passed to attach() in other processes.
+        """
+        size = (_aligned(RING_HEADER_DTYPE.itemsize) + 2 * _aligned(slots * 8) + _aligned(slots)
+                + slots * frameLength * 2)
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        # New shared memory is zero-filled, so the counters start at 0
+        header = np.ndarray((), dtype=RING_HEADER_DTYPE, buffer=memory.buf)
+        header['slots'] = slots
+        header['frame_length'] = frameLength
+        del header
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Map a ring created by another process.
+
+        Args:
+            name (str): SharedFrameRing.name of the ring.
+
+        Returns:
+            SharedFrameRing: The ring.
+        """
+        # Receiver processes are spawned by MultiRadarCapture and share its resource tracker,
+        # so the block is only removed by the creator's unlink (or the tracker at its exit)
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    def push(self, frames, frameNums, timestamps, lostFlags):
+        """
+        Append frames (producer side).
+
+        Args:
+            frames (ndarray): (n, frameLength) int16 frames.
+            frameNums: Frame numbers.
+            timestamps: Frame completion timestamps.
+            lostFlags: Lost packet flags.
+
+        Returns:
+            int: Number of frames stored; the others were dropped because the ring is full.
+        """
+        header = self.header
+        seq = int(header['write_seq'])
+        room = self.slots - (seq - int(header['read_seq']))
+        count = max(0, min(len(frames), room))
+        for i in range(count):
+            slot = (seq + i) % self.slots
+            self.frames[slot] = frames[i]
+            self.frameNums[slot] = frameNums[i]
+            self.timestamps[slot] = timestamps[i]
+            self.lostFlags[slot] = lostFlags[i]
+        header['write_seq'] = seq + count
+        header['dropped_frames'] += len(frames) - count
+        return count
+
+    def available(self):
+        """
+        Get the number of frames published but not yet released (consumer side).
+
+        Returns:
+            int: Number of frames.
+        """
+        return int(self.header['write_seq']) - int(self.header['read_seq'])
+
+    def head(self):
+        """
+        Get the slot of the oldest unreleased frame (consumer side).
+
+        Returns:
+            int: Slot index, or None if the ring is empty.
+        """
+        readSeq = int(self.header['read_seq'])
+        if int(self.header['write_seq']) <= readSeq:
+            return None
+        return readSeq % self.slots
+
+    def release(self, count=1):
+        """
+        Give the oldest frames back to the producer (consumer side).
+
+        Args:
+            count (int): Number of frames.
+        """
+        self.header['read_seq'] += count
+
+    def close(self):
+        """
+        Unmap the ring, and remove it if this process created it.
+        """
+        self.header = self.frameNums = self.timestamps = self.lostFlags = self.frames = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def _receiver_process(device, ringName, options, batchFrames=16):
+    """
+    Receiver process of one radar: an adcCapThread forwarding its frames into a SharedFrameRing.
+
+    Args:
+        device (RadarDevice): The radar.
+        ringName (str): Name of the ring to write to.
+        options (dict): Further adcCapThread arguments.
+        batchFrames (int): Maximum number of frames forwarded at once.
+    """
+    from steaming import adcCapThread
+
+    ring = SharedFrameRing.attach(ringName)
+    header = ring.header
+    header['pid'] = os.getpid()
+    if device.cpu is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {device.cpu})
+    try:
+        capThread = adcCapThread(1, device.name, static_ip=device.static_ip, adc_ip=device.adc_ip,
+                                 data_port=device.data_port, config_port=device.config_port,
+                                 clock=time.monotonic, **options)
+    except OSError:
+        header['status'] = RECEIVER_STATES.index('failed')
+        ring.close()
+        raise
+    # The receiver may block in recv for its socket timeout after stop()
+    capThread.daemon = True
+    capThread.start()
+    header['status'] = RECEIVER_STATES.index('running')
+
+    while not header['stop']:
+        frames, frameNums, lostFlags, timestamps = capThread.getFrames(batchFrames, 0.1)
+        if len(frames):
+            ring.push(frames, frameNums, timestamps, lostFlags)
+            capThread.releaseFrames()
+        stats = capThread.getStats()
+        for key in ('packets', 'frames', 'lost_packets', 'lost_frames', 'skipped_frames'):
+            header[key] = stats[key]
+        header['heartbeat'] = time.monotonic()
+        if not capThread.is_alive():
+            # e.g. the 'exit' lost packet policy ended the capture
+            header['status'] = RECEIVER_STATES.index('failed')
+            break
+    else:
+        header['status'] = RECEIVER_STATES.index('stopped')
+    capThread.stop()
+    del header
+    ring.close()
+
+
+class MultiRadarCapture:
+    """
+    Capture from several DCA1000s, one receiver process per radar.
+
+    Packet handling is bound by the GIL, so every radar gets its own process, optionally
+    pinned to a core, running an adcCapThread that forwards frames into a shared-memory
+    SharedFrameRing. The manager reads the rings and hands out frame sets aligned on
+    their completion timestamps (time.monotonic, shared by all processes): frames of
+    different radars completed within alignTolerance of each other form one set. A set
+    is handed out once every running radar has contributed, or already holds a newer frame,
+    or when its oldest frame has waited maxWait seconds, with the missing radars listed.
+    """
+    def __init__(self, devices, ringFrames=64, alignTolerance=None, maxWait=None, pinCores=True,
+                 staleAfter=1.0, **options):
+        """
+        Initialize the MultiRadarCapture.
+
+        Args:
+            devices (list): RadarDevice of every radar, with distinct names and ports.
+            ringFrames (int): Number of frames of every shared ring.
+            alignTolerance (float): Seconds between frames of one set (default: half the
+                                    frame periodicity).
+            maxWait (float): Seconds a frame waits for the other radars (default: two
+                             frame periodicities).
+            pinCores (bool): Pin receivers without a cpu to the available cores in turn.
+            staleAfter (float): Seconds without a new frame after which a running radar is
+                                reported unhealthy.
+            **options: Further adcCapThread arguments, e.g. receiver or lostPacketPolicy
+                       (default: 'recvmmsg' and 'zerofill').
+        """
+        names = [device.name for device in devices]
+        if len(set(names)) != len(names):
+            raise ValueError(f"device names must be distinct, got {names}")
+        period = cfg.RADAR_CONFIG.periodicity * 1e-3
+        self.ringFrames = ringFrames
+        self.alignTolerance = alignTolerance if alignTolerance is not None else period / 2
+        self.maxWait = maxWait if maxWait is not None else 2 * period
+        self.staleAfter = staleAfter
+        self.options = dict({'receiver': 'recvmmsg', 'lostPacketPolicy': 'zerofill'}, **options)
+
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+        self.devices = {}
+        for index, device in enumerate(devices):
+            if pinCores and device.cpu is None and cores:
+                device = dataclasses.replace(device, cpu=cores[index % len(cores)])
+            self.devices[device.name] = device
+
+        self._context = multiprocessing.get_context('spawn')
+        self._rings = {}
+        self._processes = {}
+        self._leased = []
+        self._lock = threading.Lock()
+        self.setsEmitted = 0
+        self.incompleteSets = 0
+
+    def start(self, name=None):
+        """
+        Start the receiver of one radar, or of all radars.
+
+        Args:
+            name (str): Device name, or None for all devices.
+        """
+        for device in self._select(name):
+            process = self._processes.get(device.name)
+            if process is not None and process.is_alive():
+                continue
+            ring = self._rings.get(device.name)
+            if ring is None:
+                ring = self._rings[device.name] = SharedFrameRing.create(self.ringFrames)
+            ring.header['stop'] = 0
+            ring.header['status'] = RECEIVER_STATES.index('starting')
+            ring.header['heartbeat'] = time.monotonic()
+            process = self._context.Process(target=_receiver_process, args=(device, ring.name, self.options),
+                                            name=f"receiver-{device.name}", daemon=True)
+            process.start()
+            self._processes[device.name] = process
+
+    def stop(self, name=None, timeout=2.0):
+        """
+        Stop the receiver of one radar, or of all radars. Frames already in its ring stay readable.
+
+        Args:
+            name (str): Device name, or None for all devices.
+            timeout (float): Seconds to wait for a receiver before terminating it.
+        """
+        devices = list(self._select(name))
+        for device in devices:
+            if device.name in self._rings:
+                self._rings[device.name].header['stop'] = 1
+        for device in devices:
+            process = self._processes.get(device.name)
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+                self._rings[device.name].header['status'] = RECEIVER_STATES.index('stopped')
+
+    def close(self):
+        """
+        Stop all receivers and free the shared rings.
+        """
+        self.stop()
+        self._leased = []
+        for ring in self._rings.values():
+            ring.close()
+        self._rings = {}
+
+    def health(self):
+        """
+        Get the state and counters of every radar.
+
+        Returns:
+            dict: Per device name, a dict with the following keys.
+                  - 'status': One of RECEIVER_STATES, or 'idle' if never started.
+                  - 'alive': Whether the receiver process is running.
+                  - 'pid', 'cpu': Receiver process and the core it is pinned to.
+                  - 'packets', 'frames', 'lost_packets', 'lost_frames', 'skipped_frames':
+                    Receiver counters, see adcCapThread.getStats().
+                  - 'dropped_frames': Frames dropped because the manager fell behind.
+                  - 'ring_occupancy': Frames waiting in the shared ring.
+                  - 'heartbeat_age': Seconds since the receiver last reported.
+                  - 'frame_age': Seconds since the newest frame was completed.
+                  - 'healthy': Running, reporting and receiving frames within staleAfter.
+        """
+        now = time.monotonic()
+        report = {}
+        for name, device in self.devices.items():
+            ring = self._rings.get(name)
+            process = self._processes.get(name)
+            if ring is None:
+                report[name] = {'status': 'idle', 'alive': False, 'healthy': False, 'cpu': device.cpu}
+                continue
+            header = ring.header[()]
+            status = RECEIVER_STATES[int(header['status'])]
+            alive = process is not None and process.is_alive()
+            if status in ('starting', 'running') and process is not None and not alive:
+                status = 'failed'
+            newest = int(header['write_seq']) - 1
+            frameAge = now - ring.timestamps[newest % ring.slots] if newest >= 0 else None
+            heartbeatAge = now - float(header['heartbeat'])
+            report[name] = {'status': status,
+                            'alive': alive,
+                            'pid': int(header['pid']),
+                            'cpu': device.cpu,
+                            'packets': int(header['packets']),
+                            'frames': int(header['frames']),
+                            'lost_packets': int(header['lost_packets']),
+                            'lost_frames': int(header['lost_frames']),
+                            'skipped_frames': int(header['skipped_frames']),
+                            'dropped_frames': int(header['dropped_frames']),
+                            'ring_occupancy': ring.available(),
+                            'heartbeat_age': heartbeatAge,
+                            'frame_age': frameAge,
+                            'healthy': bool(status == 'running' and heartbeatAge < self.staleAfter
+                                            and frameAge is not None and frameAge < self.staleAfter)}
+        return report
+
+    def getFrames(self, timeout=0.5):
+        """
+        Get the next set of timestamp-aligned frames.
+
+        The frames are views into the shared rings, valid until the next getFrames or
+        releaseFrames call.
+
+        Args:
+            timeout (float): Seconds to wait for a set; None waits until one is complete.
+
+        Returns:
+            dict: None if no set was ready in time, else a dict with the following keys.
+                  - 'timestamp': Completion time of the oldest frame of the set.
+                  - 'frames': Per device name, a dict with the 'frame' ((frameLength,) int16
+                    view), 'frame_num', 'timestamp' and 'lost' flag of its frame.
+                  - 'missing': Names of the running devices without a frame in the set.
+        """
+        self.releaseFrames()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frameSet = self._align()
+            if frameSet is not None:
+                return frameSet
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(min(0.002, self.alignTolerance / 4))
+
+    def releaseFrames(self):
+        """
+        Give the frames returned by the last getFrames call back to their receivers.
+        """
+        with self._lock:
+            for name in self._leased:
+                if name in self._rings:
+                    self._rings[name].release()
+            self._leased = []
+
+    def getTelemetry(self, name):
+        """
+        Get the counters and gauges of one radar, see telemetry.Telemetry.
+
+        Args:
+            name (str): Device name.
+
+        Returns:
+            dict: 'counters' and 'gauges' from health().
+        """
+        state = self.health()[name]
+        counters = {key: state[key] for key in ('packets', 'frames', 'lost_packets', 'lost_frames',
+                                                'skipped_frames', 'dropped_frames') if key in state}
+        gauges = {key: state.get(key) for key in ('ring_occupancy', 'heartbeat_age', 'frame_age')}
+        gauges['healthy'] = int(state['healthy'])
+        return {'counters': counters, 'gauges': gauges}
+
+    def registerTelemetry(self, telemetry, prefix='radar'):
+        """
+        Register every radar as a telemetry source named <prefix>.<device name>.
+
+        Args:
+            telemetry (Telemetry): The registry.
+            prefix (str): Prefix of the source names.
+        """
+        for name in self.devices:
+            telemetry.register(f"{prefix}.{name}", _DeviceTelemetry(self, name))
+
+    def _select(self, name):
+        if name is None:
+            return list(self.devices.values())
+        if name not in self.devices:
+            raise ValueError(f"name must be one of {tuple(self.devices)}, got {name!r}")
+        return [self.devices[name]]
+
+    def _running(self, name):
+        process = self._processes.get(name)
+        return process is not None and process.is_alive() and not self._rings[name].header['stop']
+
+    def _align(self):
+        """
+        Take the next frame set from the heads of the rings, if one is ready.
+        """
+        heads = {}
+        for name, ring in self._rings.items():
+            slot = ring.head()
+            if slot is not None:
+                heads[name] = (float(ring.timestamps[slot]), slot)
+        if not heads:
+            return None
+        oldest = min(timestamp for timestamp, _ in heads.values())
+        members = {name: head for name, head in heads.items() if head[0] <= oldest + self.alignTolerance}
+        missing = [name for name in self._rings if name not in members and self._running(name)]
+        # A radar whose oldest frame is already newer than the set can no longer contribute,
+        # only radars with an empty ring may still deliver their frame
+        waiting = [name for name in missing if name not in heads]
+        if waiting and time.monotonic() - oldest < self.maxWait:
+            return None
+
+        frames = {}
+        for name, (timestamp, slot) in members.items():
+            ring = self._rings[name]
+            frames[name] = {'frame': ring.frames[slot],
+                            'frame_num': int(ring.frameNums[slot]),
+                            'timestamp': timestamp,
+                            'lost': bool(ring.lostFlags[slot])}
+        with self._lock:
+            self._leased = list(members)
+        self.setsEmitted += 1
+        self.incompleteSets += bool(missing)
+        return {'timestamp': oldest, 'frames': frames, 'missing': missing}
+
+
+class _DeviceTelemetry:
+    """
+    Telemetry source of one radar of a MultiRadarCapture.
+    """
+    def __init__(self, capture, name):
+        self.capture = capture
+        self.name = name
+
+    def getTelemetry(self):
+        return self.capture.getTelemetry(self.name)
+
+
+def main():
+    # Usage: python multi_radar.py <filename.bin|segment.mmw> [num_radars] [packets_per_sec]
+    # Replays the capture to num_radars receivers on loopback ports 4098, 4108, ...
+    from dca1000_emulator import replay
+
+    path = sys.argv[1]
+    numRadars = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    packetsPerSec = float(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    devices = [RadarDevice(f"radar{i}", static_ip='127.0.0.1', data_port=4098 + 10 * i, config_port=4096 + 10 * i)
+               for i in range(numRadars)]
+    capture = MultiRadarCapture(devices)
+    capture.start()
+    # Give the receivers time to bind their sockets
+    deadline = time.monotonic() + 10
+    while (any(state['status'] == 'starting' for state in capture.health().values())
+           and time.monotonic() < deadline):
+        time.sleep(0.1)
+
+    # Every replayer reads the frames of the capture a few at a time as it sends them
+    replayers = [threading.Thread(target=replay, args=(path, device.static_ip, device.data_port),
+                                  kwargs={'packets_per_sec': packetsPerSec}, daemon=True) for device in devices]
+    for replayer in replayers:
+        replayer.start()
+
+    try:
+        lastReport = time.monotonic()
+        while True:
+            frameSet = capture.getFrames(timeout=1.0)
+            if frameSet is None:
+                if not any(replayer.is_alive() for replayer in replayers):
+                    break
+                continue
+            if time.monotonic() - lastReport >= 1.0:
+                lastReport = time.monotonic()
+                spread = [entry['timestamp'] for entry in frameSet['frames'].values()]
+                print(f"set {capture.setsEmitted}: frames "
+                      f"{ {name: entry['frame_num'] for name, entry in frameSet['frames'].items()} }, "
+                      f"spread {(max(spread) - min(spread)) * 1e3:.1f} ms, missing {frameSet['missing']}")
+    except KeyboardInterrupt:
+        pass
+    for name, state in capture.health().items():
+        print(name, state)
+    print(f"{capture.setsEmitted} frame sets, {capture.incompleteSets} incomplete")
+    capture.close()
+
+
+if __name__ == "__main__":
+    main()
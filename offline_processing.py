@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from plotData import RawDataReader, bin2np_frames
+from processing import RangeDopplerProcessor
+
+# Products written by process_capture, one <outputPrefix>_<name>.npy file each
+PRODUCTS = ('rangeDoppler', 'rangeChirp', 'rangeProfile')
+STAGES = ('read', 'convert', 'fft', 'write')
+"""
+- PRODUCTS: Names of the RangeDopplerProcessor outputs that can be saved.
+- STAGES: Names of the timed stages of a worker, as reported by process_capture.
+"""
+
+# Per-process state of a pool worker, set up once by _init_worker
+_worker = {}
+
+
+def product_path(outputPrefix, product):
+    """
+    Get the path of a product file written by process_capture.
+
+    Args:
+        outputPrefix (str): Output prefix given to process_capture.
+        product (str): One of PRODUCTS.
+
+    Returns:
+        str: Path of the .npy file.
+    """
+    return f"{outputPrefix}_{product}.npy"
+
+
+def product_shapes(frameconfig, numFrames, rangeBins=None):
+    """
+    Get the array shapes of the products of a frame range.
+
+    Args:
+        frameconfig (FrameConfig): Frame geometry of the capture.
+        numFrames (int): Number of frames.
+        rangeBins (tuple): (start, stop) range bins kept, see RangeDopplerProcessor.
+
+    Returns:
+        dict: Shape of every product of PRODUCTS; all products are float32.
+    """
+    numRangeBins = rangeBins[1] - rangeBins[0] if rangeBins is not None else frameconfig.numADCSamples
+    return {'rangeDoppler': (numFrames, frameconfig.numLoopsPerFrame, numRangeBins),
+            'rangeChirp': (numFrames, frameconfig.numLoopsPerFrame, numRangeBins),
+            'rangeProfile': (numFrames, numRangeBins)}
+
+
+def _init_worker(path, outputPrefix, products, batchFrames, rangeBins):
+    """
+    Map the capture and the output files and build the processor of a pool worker.
+    """
+    _worker['reader'] = RawDataReader(path)
+    config = _worker['reader'].frameconfig
+    _worker['outputs'] = {name: np.load(product_path(outputPrefix, name), mmap_mode='r+') for name in products}
+    # One FFT thread per worker, the pool already uses every core
+    _worker['processor'] = RangeDopplerProcessor(config, maxBatch=batchFrames, rangeBins=rangeBins, workers=1)
+    _worker['frames'] = np.empty((batchFrames, config.frameSize), dtype=np.complex64)
+    _worker['scratch'] = np.empty((2, batchFrames, config.frameSize // 2), dtype=np.uint64)
+
+
+def _process_shard(start, stop, outputStart):
+    """
+    Process a frame range of the capture and write its products.
+
+    Args:
+        start (int): First frame of the shard in the capture.
+        stop (int): End of the shard (exclusive).
+        outputStart (int): Row of the first frame in the output files.
+
+    Returns:
+        dict: Seconds spent in each of STAGES.
+    """
+    reader = _worker['reader']
+    processor = _worker['processor']
+    seconds = dict.fromkeys(STAGES, 0.0)
+    for first in range(start, stop, processor.maxBatch):
+        last = min(first + processor.maxBatch, stop)
+        n = last - first
+        row = outputStart + first - start
+
+        t0 = time.perf_counter()
+        # Touch the mapped pages here, so that page faults are not counted as conversion
+        raw = np.ascontiguousarray(reader[first:last])
+        t1 = time.perf_counter()
+        frames = bin2np_frames(raw, out=_worker['frames'][:n], scratch=_worker['scratch'][:, :n])
+        t2 = time.perf_counter()
+        results = processor.process(frames)
+        t3 = time.perf_counter()
+        for name, output in _worker['outputs'].items():
+            output[row:row + n] = results[name]
+        t4 = time.perf_counter()
+
+        seconds['read'] += t1 - t0
+        seconds['convert'] += t2 - t1
+        seconds['fft'] += t3 - t2
+        seconds['write'] += t4 - t3
+    for output in _worker['outputs'].values():
+        output.flush()
+    return seconds
+
+
+def process_capture(path, outputPrefix, startFrame=0, stopFrame=None, workers=None,
+                    shardFrames=256, batchFrames=16, products=PRODUCTS, rangeBins=None, mpContext=None):
+    """
+    Compute the range and range-Doppler products of a capture on a process pool.
+
+    The frame range is split into shards of consecutive frames. Every worker maps the
+    capture and the output files itself, so frames are read straight from the page cache
+    and results are written into their final place in frame order, without being sent
+    between processes.
+
+    Args:
+        path (str): Raw .bin capture or CaptureRecorder segment.
+        outputPrefix (str): Prefix of the output files, see product_path.
+        startFrame (int): First frame to process.
+        stopFrame (int): End of the frame range (default: the end of the capture).
+        workers (int): Number of worker processes (default: all cores).
+        shardFrames (int): Number of frames per task given to a worker.
+        batchFrames (int): Number of frames processed at once inside a worker.
+        products (tuple): Names from PRODUCTS to save.
+        rangeBins (tuple): (start, stop) range bins to keep, see RangeDopplerProcessor.
+        mpContext: Multiprocessing context of the pool, e.g. multiprocessing.get_context('spawn')
+                   when called from a thread of a process that must not be forked (default:
+                   the platform default).
+
+    Returns:
+        dict: Number of frames, wall-clock seconds, overall frames/sec and, for every stage,
+              the frames/sec of a single worker ('<stage>_fps').
+    """
+    for name in products:
+        if name not in PRODUCTS:
+            raise ValueError(f"products must be taken from {PRODUCTS}, got {name!r}")
+    workers = workers if workers is not None else os.cpu_count()
+
+    # The frame geometry comes from the capture header if it has one
+    reader = RawDataReader(path)
+    config = reader.frameconfig
+    stopFrame = len(reader) if stopFrame is None else min(stopFrame, len(reader))
+    reader.close()
+    numFrames = max(0, stopFrame - startFrame)
+
+    # Create the output files up front; workers open them again and fill their rows
+    shapes = product_shapes(config, numFrames, rangeBins)
+    for name in products:
+        output = np.lib.format.open_memmap(product_path(outputPrefix, name), mode='w+',
+                                           dtype=np.float32, shape=shapes[name])
+        del output
+
+    shards = [(first, min(first + shardFrames, stopFrame), first - startFrame)
+              for first in range(startFrame, stopFrame, shardFrames)]
+    seconds = dict.fromkeys(STAGES, 0.0)
+    start = time.perf_counter()
+    if shards:
+        initargs = (path, outputPrefix, tuple(products), batchFrames, rangeBins)
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=mpContext,
+                                 initializer=_init_worker, initargs=initargs) as pool:
+            for shardSeconds in pool.map(_process_shard, *zip(*shards)):
+                for stage in STAGES:
+                    seconds[stage] += shardSeconds[stage]
+    elapsed = time.perf_counter() - start
+
+    stats = {'frames': numFrames,
+             'seconds': elapsed,
+             'fps': numFrames / elapsed if elapsed else 0.0}
+    for stage in STAGES:
+        stats[f'{stage}_fps'] = numFrames / seconds[stage] if seconds[stage] else 0.0
+    return stats
+
+
+def main():
+    # Usage: python offline_processing.py <filename.bin> [output_prefix] [workers]
+    bin_filename = sys.argv[1]
+    outputPrefix = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(bin_filename)[0]
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    stats = process_capture(bin_filename, outputPrefix, workers=workers)
+    print(f"Processed {stats['frames']} frames in {stats['seconds']:.1f} s ({stats['fps']:.1f} frames/sec)")
+    for stage in STAGES:
+        print(f"  {stage}: {stats[f'{stage}_fps']:.1f} frames/sec per worker")
+    for name in PRODUCTS:
+        print(f"  {product_path(outputPrefix, name)}")
+
+
+if __name__ == "__main__":
+    main()
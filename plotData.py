@@ -3,7 +3,12 @@ import matplotlib.pyplot as plt
 import configuration as cfg
 import sys
 import os
+import multiprocessing
+import threading
 import cv2
+from radar_config import RadarConfig
+from recorder import read_header, read_index
+from viewer import RangeDopplerViewer
 
 
 def plot_doppler_range_power(reshapedFrame, config, frame_number, createPlotResultVideo):
@@ -108,13 +113,20 @@ class FrameConfig:
     """
     Configuration class for frame parameters.
     """
-    def __init__(self):
+    def __init__(self, radarConfig=None):
+        """
+        Initialize the FrameConfig.
+
+        Args:
+            radarConfig (RadarConfig): Radar configuration (default: configuration.RADAR_CONFIG).
+        """
         # Get configuration values from the configuration file (config)
-        self.numTxAntennas = cfg.NUM_TX
-        self.numRxAntennas = cfg.NUM_RX
-        self.numLoopsPerFrame = cfg.LOOPS_PER_FRAME
-        self.numADCSamples = cfg.ADC_SAMPLES
-        self.numAngleBins = cfg.NUM_ANGLE_BINS
+        self.radarConfig = radarConfig if radarConfig is not None else cfg.RADAR_CONFIG
+        self.numTxAntennas = self.radarConfig.num_tx
+        self.numRxAntennas = self.radarConfig.num_rx
+        self.numLoopsPerFrame = self.radarConfig.loops_per_frame
+        self.numADCSamples = self.radarConfig.adc_samples
+        self.numAngleBins = self.radarConfig.num_angle_bins
 
         # Calculate the number of chirps per frame
         self.numChirpsPerFrame = self.numTxAntennas * self.numLoopsPerFrame
@@ -138,30 +150,110 @@ class FrameConfig:
 class RawDataReader:
     """
     Class for reading raw data from a binary file.
+
+    The file is memory-mapped, so any frame or frame range can be accessed in O(1)
+    without reading the data before it, and without allocating per frame.
     """
-    def __init__(self, path):
+    def __init__(self, path, frameconfig=None):
+        """
+        Map a raw .bin capture or a CaptureRecorder segment.
+
+        Args:
+            path (str): Path of the capture file.
+            frameconfig (FrameConfig): Frame geometry of the capture (default: the radar configuration
+                                       embedded in the capture, or FrameConfig() for raw .bin files).
+
+        Raises:
+            ValueError: If frameconfig does not match the frame size recorded in the capture.
+        """
         self.path = path
-        self.ADCBinFile = open(path, 'rb')
+        self.nextFrame = 0
+
+        # Capture segments written by CaptureRecorder start with a header, raw .bin files do not
+        header = read_header(path)
+        self.dataOffset = header['data_offset'] if header is not None else 0
+        if frameconfig is None:
+            radarConfig = None
+            if header is not None and 'radar_config' in header:
+                radarConfig = RadarConfig.from_dict(header['radar_config'])
+            frameconfig = FrameConfig(radarConfig)
+        if header is not None and frameconfig.frameSize * 4 != header['BYTES_IN_FRAME']:
+            raise ValueError(f"{path} holds frames of {header['BYTES_IN_FRAME']} bytes, "
+                             f"but the frame configuration describes frames of {frameconfig.frameSize * 4} bytes")
+        self.frameconfig = frameconfig
+
+        # Frame count from the file size; a truncated trailing frame is left out
+        config = self.frameconfig
+        frameBytes = config.frameSize * 4
+        dataBytes = max(0, os.path.getsize(path) - self.dataOffset)
+        self.numFrames = dataBytes // frameBytes
+        if header is not None:
+            # Only frames listed in the index are known to have reached the disk; segments are
+            # preallocated, so a segment with an empty or missing index holds no known frame
+            self.numFrames = min(self.numFrames, len(read_index(path)))
+        self.truncatedBytes = dataBytes - self.numFrames * frameBytes
+
+        # Lazy (n_frames, loops, tx, rx, samples/2, IQ, 2) view of the LVDS layout, in which
+        # the I and Q values of two consecutive samples are stored as I0 I1 Q0 Q1
+        shape = (self.numFrames, config.numLoopsPerFrame, config.numTxAntennas,
+                 config.numRxAntennas, config.numADCSamples // 2, 2, 2)
+        if self.numFrames:
+            self.frames = np.memmap(path, dtype=np.int16, mode='r', offset=self.dataOffset, shape=shape)
+        else:
+            self.frames = np.zeros(shape, dtype=np.int16)
+
+    def __len__(self):
+        return self.numFrames
+
+    def __getitem__(self, index):
+        """
+        Get frames as flat int16 arrays, as returned by getNextFrame.
+
+        Args:
+            index (int or slice): Frame number or frame range.
+
+        Returns:
+            ndarray: Memory-mapped view of shape (frameSize * 2,) or (n, frameSize * 2).
+        """
+        frames = self.frames[index]
+        return frames.reshape(frames.shape[:-6] + (-1,))
+
+    def getFrames(self, start, stop):
+        """
+        Get a frame range with the samples de-interleaved.
+
+        Args:
+            start (int): First frame.
+            stop (int): End of the range (exclusive).
 
-    def getNextFrame(self, frameconfig):
+        Returns:
+            ndarray: int16 array of shape (n_frames, loops, tx, rx, samples, IQ).
+        """
+        frames = self.frames[start:stop]
+        return frames.swapaxes(-1, -2).reshape(frames.shape[:4] + (-1, 2))
+
+    def getNextFrame(self, frameconfig=None):
         """
         Read the next frame of data from the binary file.
         
         Args:
-            frameconfig (FrameConfig): Configuration object containing frame parameters.
+            frameconfig (FrameConfig): Unused, the geometry is given to the constructor.
         
         Returns:
-            ndarray: Frame data as a 1D numpy array of int16.
+            ndarray: Frame data as a 1D numpy array of int16, empty past the last frame.
         """
-        # Read one frame of data from the binary file
-        frame = np.frombuffer(self.ADCBinFile.read(frameconfig.frameSize * 4), dtype=np.int16)
+        if self.nextFrame >= self.numFrames:
+            return np.zeros(0, dtype=np.int16)
+        frame = self[self.nextFrame]
+        self.nextFrame += 1
         return frame
 
     def close(self):
         """
         Close the binary file.
         """
-        self.ADCBinFile.close()
+        # The mapping is released once no view of it is referenced any more
+        self.frames = None
 
 
 def bin2np_frame(bin_frame):
@@ -172,16 +264,64 @@ def bin2np_frame(bin_frame):
         bin_frame (ndarray): Binary frame data as a 1D numpy array of int16.
     
     Returns:
-        ndarray: Complex numpy array representing the frame data.
+        ndarray: Complex64 numpy array representing the frame data.
+    """
+    return bin2np_frames(bin_frame)
+
+
+# Masks for the little-endian 64-bit word holding one I0 I1 Q0 Q1 group
+LVDS_KEEP_MASK = np.uint64(0xFFFF00000000FFFF)
+LVDS_MIDDLE_MASK = np.uint64(0x00000000FFFF0000)
+LVDS_SHIFT = np.uint64(16)
+
+
+def bin2np_frames(bin_frames, out=None, scratch=None):
     """
-    # Create a complex numpy array of half the size of the binary frame
-    np_frame = np.zeros(shape=(len(bin_frame) // 2), dtype=np.complex_)
+    Convert binary frames to complex64 arrays without temporaries.
+
+    The LVDS layout stores two consecutive samples as I0 I1 Q0 Q1. Each group is one 64-bit
+    word, so swapping its middle 16-bit halves with in-place bit operations gives the
+    I0 Q0 I1 Q1 order of complex64, and a single contiguous cast fills the output.
+    Non-contiguous or big-endian input takes a slower strided copy.
     
-    # Assign real and imaginary parts alternately from the binary frame
-    np_frame[0::2] = bin_frame[0::4] + 1j * bin_frame[2::4]
-    np_frame[1::2] = bin_frame[1::4] + 1j * bin_frame[3::4]
+    Args:
+        bin_frames (ndarray): int16 frames of shape (..., frameSize * 2), e.g. a batch of frames.
+        out (ndarray): Optional complex64 array of shape (..., frameSize) to reuse across calls.
+        scratch (ndarray): Optional uint64 array of shape (2, ..., frameSize // 2) to reuse across calls.
     
-    return np_frame
+    Returns:
+        ndarray: Complex64 array of shape (..., frameSize), out if it was given.
+    """
+    bin_frames = np.asarray(bin_frames)
+    if out is None:
+        out = np.empty(bin_frames.shape[:-1] + (bin_frames.shape[-1] // 2,), dtype=np.complex64)
+
+    try:
+        words = bin_frames.view(np.uint64)
+    except ValueError:
+        words = None
+    if words is None or sys.byteorder != 'little':
+        groups = bin_frames.reshape(bin_frames.shape[:-1] + (-1, 2, 2))
+        outPairs = out.view(np.float32).reshape(groups.shape)
+        outPairs[..., 0] = groups[..., 0, :]
+        outPairs[..., 1] = groups[..., 1, :]
+        return out
+
+    if scratch is None:
+        scratch = np.empty((2,) + words.shape, dtype=np.uint64)
+    swapped, middle = scratch[0], scratch[1]
+
+    # I0 I1 Q0 Q1 -> I0 Q0 I1 Q1
+    np.bitwise_and(words, LVDS_KEEP_MASK, out=swapped)
+    np.bitwise_and(words, LVDS_MIDDLE_MASK, out=middle)
+    np.left_shift(middle, LVDS_SHIFT, out=middle)
+    np.bitwise_or(swapped, middle, out=swapped)
+    np.right_shift(words, LVDS_SHIFT, out=middle)
+    np.bitwise_and(middle, LVDS_MIDDLE_MASK, out=middle)
+    np.bitwise_or(swapped, middle, out=swapped)
+
+    np.copyto(out.view(np.float32), swapped.view(np.int16))
+    return out
 
 
 def frameReshape(frame, frameConfig):
@@ -307,7 +447,7 @@ def main():
 
     # Initialize the flag for creating a plot result video
     createPlotResultVideo = 0
-    NumOfFrames = 100
+    NumOfFrames = None
     
     # Get the binary file name from the command-line arguments
     bin_filename = sys.argv[1]
@@ -315,37 +455,67 @@ def main():
     # Check if a second command-line argument is provided for creating a plot result video
     if len(sys.argv) > 2:
         createPlotResultVideo = int(sys.argv[2])
-    
-    # Create the output directory for saving plot images if creating a plot result video
-    if createPlotResultVideo > 0:
-        os.makedirs('output_images', exist_ok=True)
 
-    # Create a RawDataReader object for reading the binary file
-    bin_reader = RawDataReader(bin_filename)
+    # Check if a third command-line argument limits the number of frames (default: all frames)
+    if len(sys.argv) > 3:
+        NumOfFrames = int(sys.argv[3])
     
-    # Create a FrameConfig object for storing frame parameters
-    config = FrameConfig()
-
-    # Process a specified number of frames (adjust the range as needed)
-    for frame in range(0, NumOfFrames):
-        # Read the next frame from the binary file
-        bin_frame = bin_reader.getNextFrame(config)
-        
-        # Convert the binary frame to a complex numpy array
-        np_frame = bin2np_frame(bin_frame)
-        
-        # Reshape the frame data into a 4D array
-        reshapedFrame = frameReshape(np_frame, config)
-        
+    # Render a video straight from the capture: 1 draws the plots, 2 only the colormapped maps
+    if createPlotResultVideo > 0:
+        # Imported here, video.py itself imports this module
+        from video import render_capture_video
+        mode = 'figure' if createPlotResultVideo == 1 else 'colormap'
+        render_capture_video(bin_filename, 'Plot_Results.mp4', mode=mode, fps=10, stopFrame=NumOfFrames,
+                             workers=os.cpu_count())
+        return
+
+    # The frame geometry comes from the capture header if it has one
+    reader = RawDataReader(bin_filename)
+    config = reader.frameconfig
+
+    # The products of every frame are computed once and cached, re-plotting only reads them.
+    # The cache is filled in the background, so the first frames are shown right away and are
+    # processed on the fly until it is ready. Its worker processes are spawned, as forking
+    # this threaded process with matplotlib running is not safe
+    from product_cache import ProductCache
+    from processing import RangeDopplerProcessor
+    cached = []
+
+    def build_cache():
+        try:
+            cached.append(ProductCache().get(bin_filename, mpContext=multiprocessing.get_context('spawn')))
+        except ValueError as error:
+            print(f"Not caching the products: {error}")
+
+    builder = threading.Thread(target=build_cache, daemon=True)
+    builder.start()
+    processor = RangeDopplerProcessor(config, maxBatch=1)
+    frames = np.empty((1, config.frameSize), dtype=np.complex64)
+    scratch = np.empty((2, 1, config.frameSize // 2), dtype=np.uint64)
+
+    def frame_products(frame):
+        if cached:
+            products = cached[0]
+            return products['rangeDoppler'][frame], products['rangeChirp'][frame], products['rangeProfile'][frame]
+        results = processor.process(bin2np_frames(reader[frame:frame + 1], out=frames, scratch=scratch))
+        return results['rangeDoppler'][0], results['rangeChirp'][0], results['rangeProfile'][0]
+
+    # Frames are shown in one persistent window that is updated in place
+    viewer = RangeDopplerViewer(config.numDopplerBins)
+
+    # Show the requested number of frames, or the whole capture
+    if NumOfFrames is None:
+        NumOfFrames = len(reader)
+    numFrames = min(NumOfFrames, len(reader))
+    for frame in range(0, numFrames):
         # Plot the range-Doppler map, range FFT, and relative power vs. range for the current frame
-        plot_doppler_range_power(reshapedFrame, config, frame, createPlotResultVideo)
-
-    # Create a video from the plot images if specified
-    if createPlotResultVideo != 0:
-        create_video('output_images', 'Plot_Results.mp4', fps=10)
+        viewer.update(*frame_products(frame), frame)
 
-    # Close the binary file reader
-    bin_reader.close()
+    # Keep the last frame on screen
+    if 0 < numFrames and viewer.framesShown < numFrames:
+        frame = numFrames - 1
+        viewer.update(*frame_products(frame), frame, force=True)
+    plt.show()
 
 
 if __name__ == "__main__":
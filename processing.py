@@ -0,0 +1,394 @@
+import inspect
+import os
+import numpy as np
+
+# Optional FFT backends
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+FFT_BACKENDS = ('pyfftw', 'scipy', 'numpy')
+NUMPY_FFT_HAS_OUT = 'out' in inspect.signature(np.fft.fft).parameters
+"""
+- FFT_BACKENDS: FFT implementations of RangeDopplerProcessor. 'pyfftw', and 'numpy' where
+  np.fft.fft takes out= (NUMPY_FFT_HAS_OUT, numpy >= 2.0), transform into the preallocated
+  buffers; 'scipy' returns a new array that is copied into them, so it allocates a
+  temporary of the size of the transformed block on every call.
+- NUMPY_FFT_HAS_OUT: Whether np.fft.fft writes into an out= array.
+"""
+
+
+class RangeDopplerProcessor:
+    """
+    Batched range FFT, clutter removal and Doppler FFT with precomputed windows and buffers.
+
+    Frames are processed in their native (loops, tx, rx, samples) layout, so the range FFT
+    runs along contiguous memory. Everything stays complex64/float32 and is written into
+    buffers allocated once for maxBatch frames. Clutter removal and the Doppler FFT act on
+    each range bin independently, so only the range bins of interest are carried past the
+    range FFT. For an even number of loops the fftshift is folded into the Doppler window.
+    """
+    def __init__(self, frameConfig, maxBatch=16, rangeBins=None, rangeWindow=None,
+                 dopplerWindow=np.hamming, clutterRemoval=True, backend=None, workers=None):
+        """
+        Initialize the RangeDopplerProcessor.
+
+        Args:
+            frameConfig (FrameConfig): Frame geometry.
+            maxBatch (int): Maximum number of frames per process() call.
+            rangeBins (tuple): (start, stop) range bins kept after the range FFT (default: all).
+            rangeWindow (callable): Window function applied along the samples, e.g. np.hanning,
+                                    or None for no window as in rangeFFT.
+            dopplerWindow (callable): Window function applied along the loops, as in dopplerFFT.
+            clutterRemoval (bool or ClutterFilter): Subtract the mean over the loops from every
+                                                    range bin, or the background estimated across
+                                                    frames by a clutter.ClutterFilter.
+            backend (str): One of FFT_BACKENDS, or None for the first of pyfftw, numpy with
+                           out= and scipy that is available.
+            workers (int): Threads used by the FFT (default: all cores).
+        """
+        self.numLoops = frameConfig.numLoopsPerFrame
+        self.numTx = frameConfig.numTxAntennas
+        self.numRx = frameConfig.numRxAntennas
+        self.numSamples = frameConfig.numADCSamples
+        self.frameSize = frameConfig.frameSize
+        self.maxBatch = maxBatch
+        self.clutterRemoval = clutterRemoval
+        self.workers = workers if workers is not None else os.cpu_count()
+
+        start, stop = rangeBins if rangeBins is not None else (0, self.numSamples)
+        self.rangeBins = slice(start, stop)
+        self.numRangeBins = stop - start
+
+        if backend is None:
+            if pyfftw is not None:
+                backend = 'pyfftw'
+            elif NUMPY_FFT_HAS_OUT or scipy_fft is None:
+                backend = 'numpy'
+            else:
+                backend = 'scipy'
+        if backend not in FFT_BACKENDS:
+            raise ValueError(f"backend must be one of {FFT_BACKENDS}, got {backend!r}")
+        if (backend == 'pyfftw' and pyfftw is None) or (backend == 'scipy' and scipy_fft is None):
+            raise ImportError(f"FFT backend {backend!r} is not installed")
+        self.backend = backend
+        self._plans = {}
+
+        # Windows, computed once and shaped to broadcast over (n, loops, tx, rx, samples)
+        self.rangeWindow = None
+        if rangeWindow is not None:
+            self.rangeWindow = rangeWindow(self.numSamples).astype(np.float32)
+        window = dopplerWindow(self.numLoops).astype(np.float32)
+        self._foldShift = self.numLoops % 2 == 0
+        if self._foldShift:
+            # Multiplying by (-1)^m moves the zero-frequency bin to the centre, like fftshift
+            window = window * np.where(np.arange(self.numLoops) % 2, -1, 1).astype(np.float32)
+        self.dopplerWindow = window.reshape(1, -1, 1, 1, 1)
+
+        self._allocate(self.numSamples, self.numLoops)
+
+    def _allocate(self, rangeLength, numDopplerBins):
+        """
+        Allocate the buffers for the largest batch; process() works on their first n frames.
+
+        Args:
+            rangeLength (int): Number of values computed per range FFT.
+            numDopplerBins (int): Number of Doppler bins computed per range bin.
+        """
+        fullShape = (self.maxBatch, self.numLoops, self.numTx, self.numRx, rangeLength)
+        cropShape = fullShape[:4] + (self.numRangeBins,)
+        dopplerShape = (self.maxBatch, numDopplerBins) + cropShape[2:]
+        self._rangeFFT = self._empty(fullShape, np.complex64)
+        self._doppler = self._empty(dopplerShape, np.complex64)
+        self._magnitude = np.empty(cropShape, dtype=np.float32)
+        self._dopplerMagnitude = np.empty(dopplerShape, dtype=np.float32)
+        self._clutter = np.empty((self.maxBatch, 1, self.numTx, self.numRx, self.numRangeBins), dtype=np.complex64)
+        self.rangeDoppler = np.empty((self.maxBatch, numDopplerBins, self.numRangeBins), dtype=np.float32)
+        self.rangeChirp = np.empty((self.maxBatch, self.numLoops, self.numRangeBins), dtype=np.float32)
+        self.rangeProfile = np.empty((self.maxBatch, self.numRangeBins), dtype=np.float32)
+
+    def process(self, frames):
+        """
+        Compute the range and range-Doppler products of a batch of frames.
+
+        Args:
+            frames (ndarray): Complex frames of shape (n, frameSize), e.g. from bin2np_frames,
+                              or (n, loops, tx, rx, samples), with n <= maxBatch.
+
+        Returns:
+            dict: Views into the output buffers, valid until the next call:
+                  - 'rangeDoppler': (n, doppler bins, range bins) magnitude summed over TX and RX,
+                    zero velocity in the centre row.
+                  - 'rangeChirp': (n, loops, range bins) range FFT magnitude averaged over TX and RX.
+                  - 'rangeProfile': (n, range bins) range FFT magnitude averaged over TX, RX and loops.
+        """
+        n = self.rangeStage(frames)
+        self.clutterStage(n)
+        self.dopplerStage(n)
+        return self.results(n)
+
+    def rangeStage(self, frames):
+        """
+        Range FFT of a batch of frames, the first step of process().
+
+        Args:
+            frames (ndarray): Complex frames, see process().
+
+        Returns:
+            int: Number of frames in the batch, to be passed to the next stages.
+        """
+        frames = np.asarray(frames)
+        n = frames.shape[0]
+        if n > self.maxBatch:
+            raise ValueError(f"batch of {n} frames exceeds maxBatch={self.maxBatch}")
+        frames = frames.reshape(n, self.numLoops, self.numTx, self.numRx, self.numSamples)
+
+        rangeFFT = self._rangeFFT[:n]
+        if self.rangeWindow is not None:
+            np.multiply(frames, self.rangeWindow, out=rangeFFT)
+            self._fft(rangeFFT, rangeFFT, axis=-1)
+        else:
+            self._fft(frames, rangeFFT, axis=-1)
+        return n
+
+    def clutterStage(self, n):
+        """
+        Static clutter removal and range magnitudes of the batch given to rangeStage().
+
+        Args:
+            n (int): Number of frames in the batch.
+        """
+        # Only for the range bins that are kept
+        cropped = self._rangeFFT[:n, ..., self.rangeBins]
+        if hasattr(self.clutterRemoval, 'apply'):
+            self.clutterRemoval.apply(cropped)
+        elif self.clutterRemoval:
+            np.mean(cropped, axis=1, keepdims=True, out=self._clutter[:n])
+            np.subtract(cropped, self._clutter[:n], out=cropped)
+
+        magnitude = self._magnitude[:n]
+        np.abs(cropped, out=magnitude)
+        np.mean(magnitude, axis=(2, 3), out=self.rangeChirp[:n])
+        np.mean(self.rangeChirp[:n], axis=1, out=self.rangeProfile[:n])
+
+    def dopplerStage(self, n):
+        """
+        Windowed (and shifted) Doppler FFT of the batch given to clutterStage().
+
+        Args:
+            n (int): Number of frames in the batch.
+        """
+        cropped = self._rangeFFT[:n, ..., self.rangeBins]
+        doppler = self._doppler[:n]
+        np.multiply(cropped, self.dopplerWindow, out=doppler)
+        self._fft(doppler, doppler, axis=1)
+        if not self._foldShift:
+            doppler[...] = np.fft.fftshift(doppler, axes=1)
+        magnitude = self._dopplerMagnitude[:n]
+        np.abs(doppler, out=magnitude)
+        np.sum(magnitude, axis=(2, 3), out=self.rangeDoppler[:n])
+
+    def results(self, n):
+        """
+        Get the products of the last batch, see process().
+
+        Args:
+            n (int): Number of frames in the batch.
+
+        Returns:
+            dict: Views into the output buffers, valid until the next batch.
+        """
+        return {'rangeDoppler': self.rangeDoppler[:n],
+                'rangeChirp': self.rangeChirp[:n],
+                'rangeProfile': self.rangeProfile[:n]}
+
+    def rangeCube(self, n):
+        """
+        Get the range FFT of the last batch per antenna, e.g. for angle processing.
+
+        Args:
+            n (int): Number of frames in the batch.
+
+        Returns:
+            ndarray: (n, loops, tx, rx, range bins) complex64 view of the kept range bins,
+                     after clutter removal, valid until the next batch.
+        """
+        return self._rangeFFT[:n, ..., self.rangeBins]
+
+    def _empty(self, shape, dtype):
+        """
+        Allocate a buffer, SIMD-aligned when pyFFTW is used.
+        """
+        if self.backend == 'pyfftw':
+            return pyfftw.empty_aligned(shape, dtype=dtype)
+        return np.empty(shape, dtype=dtype)
+
+    def _fft(self, src, dst, axis):
+        """
+        Forward FFT of src along axis into dst with the selected backend.
+
+        Args:
+            src (ndarray): Input array.
+            dst (ndarray): Output array of the same shape, may be src.
+            axis (int): Axis of the transform.
+        """
+        if self.backend == 'pyfftw':
+            # FFTW plans are bound to their arrays, so keep one per distinct call
+            key = (src.ctypes.data, dst.ctypes.data, src.shape, src.strides, axis)
+            plan = self._plans.get(key)
+            if plan is None:
+                plan = pyfftw.FFTW(src, dst, axes=(axis,), threads=self.workers,
+                                   flags=('FFTW_MEASURE', 'FFTW_DESTROY_INPUT'))
+                self._plans[key] = plan
+            plan(src, dst)
+        elif self.backend == 'scipy':
+            # Not allocation-free: scipy.fft has no out= and returns a new array
+            dst[...] = scipy_fft.fft(src, axis=axis, workers=self.workers, overwrite_x=src is dst)
+        elif NUMPY_FFT_HAS_OUT:
+            # The default norm runs complex64 input through the complex128 loop with temporaries;
+            # 'ortho' keeps it in single precision, and the 1/sqrt(n) scale is undone in place
+            np.fft.fft(src, axis=axis, out=dst, norm='ortho')
+            np.multiply(dst, dst.real.dtype.type(np.sqrt(src.shape[axis])), out=dst)
+        else:
+            dst[...] = np.fft.fft(src, axis=axis)
+
+
+def roi_bins(radarConfig, ranges=None, velocities=None):
+    """
+    Convert a range and velocity window to range and Doppler bins.
+
+    Args:
+        radarConfig (RadarConfig): Radar configuration, for the range and Doppler resolutions
+                                   (configuration.RANGE_RESOLUTION and DOPPLER_RESOLUTION).
+        ranges (tuple): (min, max) range in metres (default: all range bins).
+        velocities (tuple): (min, max) radial velocity in m/s (default: all Doppler bins).
+
+    Returns:
+        tuple: (start, stop) range bins and (start, stop) Doppler bins, the latter counted
+               from the zero-velocity bin, so negative for approaching targets.
+    """
+    numSamples, numLoops = radarConfig.adc_samples, radarConfig.loops_per_frame
+    if ranges is None:
+        rangeBins = (0, numSamples)
+    else:
+        rangeBins = (max(0, int(np.floor(ranges[0] / radarConfig.range_resolution))),
+                     min(numSamples, int(np.floor(ranges[1] / radarConfig.range_resolution)) + 1))
+    if velocities is None:
+        dopplerBins = (-(numLoops // 2), numLoops - numLoops // 2)
+    else:
+        dopplerBins = (max(-(numLoops // 2), int(np.ceil(velocities[0] / radarConfig.doppler_resolution))),
+                       min(numLoops - numLoops // 2, int(np.floor(velocities[1] / radarConfig.doppler_resolution)) + 1))
+    if rangeBins[0] >= rangeBins[1] or dopplerBins[0] >= dopplerBins[1]:
+        raise ValueError(f"the window {ranges} m, {velocities} m/s contains no range or Doppler bin")
+    return rangeBins, dopplerBins
+
+
+class RoiProcessor(RangeDopplerProcessor):
+    """
+    RangeDopplerProcessor computing only the range and Doppler bins of a region of interest.
+
+    Instead of full FFTs that are cropped afterwards, the range and Doppler spectra are
+    evaluated only at the bins inside the window, as products with precomputed DFT
+    matrices that also hold the windows. For a window of a few dozen bins this is cheaper
+    than the FFT, and the magnitudes and sums only touch the kept bins. With zoom > 1 the
+    range spectrum is evaluated on a grid `zoom` times finer than the FFT bins (a zoom
+    DFT, the chirp-z transform restricted to the window), which interpolates the peak
+    positions of close targets.
+
+    Results have the layout of RangeDopplerProcessor.process(), with rangeAxis and
+    velocityAxis giving the range and velocity of every column and row.
+    """
+    def __init__(self, frameConfig, ranges=(0.0, 3.0), velocities=None, zoom=1, maxBatch=16,
+                 rangeWindow=None, dopplerWindow=np.hamming, clutterRemoval=True, backend=None, workers=None):
+        """
+        Initialize the RoiProcessor.
+
+        Args:
+            frameConfig (FrameConfig): Frame geometry.
+            ranges (tuple): (min, max) range in metres, or None for all range bins.
+            velocities (tuple): (min, max) radial velocity in m/s, or None for all Doppler
+                                bins, computed with the FFT.
+            zoom (int): Range values computed per range bin inside the window.
+            maxBatch (int): Maximum number of frames per process() call.
+            rangeWindow (callable): Window function along the samples, see RangeDopplerProcessor.
+            dopplerWindow (callable): Window function along the loops, see RangeDopplerProcessor.
+            clutterRemoval (bool or ClutterFilter): See RangeDopplerProcessor.
+            backend (str): FFT backend, see RangeDopplerProcessor.
+            workers (int): FFT threads, see RangeDopplerProcessor.
+        """
+        if zoom < 1:
+            raise ValueError(f"zoom must be at least 1, got {zoom!r}")
+        radarConfig = frameConfig.radarConfig
+        (rangeStart, rangeStop), (dopplerStart, dopplerStop) = roi_bins(radarConfig, ranges, velocities)
+        self.zoom = zoom
+        self.rangeFrequencies = np.arange(rangeStart * zoom, (rangeStop - 1) * zoom + 1) / zoom
+        self.rangeAxis = self.rangeFrequencies * radarConfig.range_resolution
+        self.dopplerBins = np.arange(dopplerStart, dopplerStop) if velocities is not None else None
+        self.velocityAxis = np.arange(dopplerStart, dopplerStop) * radarConfig.doppler_resolution
+        # Without zoom the range FFT is cheaper than any DFT of the window, so only the later
+        # stages are restricted; with zoom the range spectrum comes from a DFT matrix
+        rangeBins = (rangeStart, rangeStop) if zoom == 1 else (0, len(self.rangeFrequencies))
+        super().__init__(frameConfig, maxBatch=maxBatch, rangeBins=rangeBins, rangeWindow=rangeWindow,
+                         dopplerWindow=dopplerWindow, clutterRemoval=clutterRemoval, backend=backend,
+                         workers=workers)
+
+        # DFT matrices with the windows folded in
+        if zoom > 1:
+            samples = np.arange(self.numSamples)
+            window = self.rangeWindow if self.rangeWindow is not None else np.ones(self.numSamples, np.float32)
+            self._rangeMatrix = (window[:, None] * np.exp(-2j * np.pi * np.outer(samples, self.rangeFrequencies)
+                                                          / self.numSamples)).astype(np.complex64)
+        if self.dopplerBins is not None:
+            loops = np.arange(self.numLoops)
+            self._dopplerMatrix = (dopplerWindow(self.numLoops)[None, :] * np.exp(
+                -2j * np.pi * np.outer(self.dopplerBins, loops) / self.numLoops)).astype(np.complex64)
+
+    def _allocate(self, rangeLength, numDopplerBins):
+        """
+        Allocate the buffers for the bins of the window only.
+        """
+        numDopplerBins = len(self.dopplerBins) if self.dopplerBins is not None else self.numLoops
+        super()._allocate(rangeLength if self.zoom == 1 else self.numRangeBins, numDopplerBins)
+
+    def rangeStage(self, frames):
+        """
+        Range spectrum of a batch of frames at the range values of the window.
+
+        Args:
+            frames (ndarray): Complex frames, see RangeDopplerProcessor.process().
+
+        Returns:
+            int: Number of frames in the batch, to be passed to the next stages.
+        """
+        if self.zoom == 1:
+            return super().rangeStage(frames)
+        frames = np.asarray(frames)
+        n = frames.shape[0]
+        if n > self.maxBatch:
+            raise ValueError(f"batch of {n} frames exceeds maxBatch={self.maxBatch}")
+        frames = frames.reshape(n, self.numLoops, self.numTx, self.numRx, self.numSamples)
+        np.matmul(frames, self._rangeMatrix, out=self._rangeFFT[:n])
+        return n
+
+    def dopplerStage(self, n):
+        """
+        Doppler spectrum of the batch given to clutterStage() at the Doppler bins of the window.
+
+        Args:
+            n (int): Number of frames in the batch.
+        """
+        if self.dopplerBins is None:
+            super().dopplerStage(n)
+            return
+        # (bins, loops) @ (loops, range) for every frame and antenna, on views of the kept range bins
+        cropped = self._rangeFFT[:n, ..., self.rangeBins]
+        doppler = self._doppler[:n]
+        np.matmul(self._dopplerMatrix, cropped.transpose(0, 2, 3, 1, 4), out=doppler.transpose(0, 2, 3, 1, 4))
+        magnitude = self._dopplerMagnitude[:n]
+        np.abs(doppler, out=magnitude)
+        np.sum(magnitude, axis=(2, 3), out=self.rangeDoppler[:n])
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import numpy as np
+from offline_processing import PRODUCTS, process_capture, product_path, product_shapes
+from plotData import RawDataReader
+
+# Bump when the processing chain changes, so that older cache entries are not reused
+PROCESSING_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get('MMWAVE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'mmwave_products'))
+META_FILE = 'meta.json'
+"""
+- PROCESSING_VERSION: Version of the processing chain, part of every cache key.
+- DEFAULT_CACHE_DIR: Cache location, overridden by the MMWAVE_CACHE_DIR environment variable.
+- META_FILE: File marking a complete cache entry, written last.
+"""
+
+
+def file_digest(path, chunkBytes=2**24):
+    """
+    Hash the contents of a file.
+
+    Args:
+        path (str): Path of the file.
+        chunkBytes (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hex BLAKE2b digest.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunkBytes), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CachedProducts:
+    """
+    Lazily loaded products of one cache entry.
+
+    Each product is memory-mapped read-only the first time it is accessed, e.g.
+    products['rangeDoppler'][1000] only reads the pages of frame 1000.
+    """
+    def __init__(self, entryPath):
+        self.entryPath = entryPath
+        with open(os.path.join(entryPath, META_FILE)) as f:
+            self.meta = json.load(f)
+        self._arrays = {}
+
+    def __getitem__(self, name):
+        """
+        Get a product.
+
+        Args:
+            name (str): One of offline_processing.PRODUCTS.
+
+        Returns:
+            ndarray: Read-only memory-mapped array with one row per frame.
+        """
+        if name not in self._arrays:
+            if name not in self.meta['products']:
+                raise KeyError(name)
+            self._arrays[name] = np.load(product_path(os.path.join(self.entryPath, 'products'), name), mmap_mode='r')
+        return self._arrays[name]
+
+    def __len__(self):
+        return self.meta['frames']
+
+
+class ProductCache:
+    """
+    Content-addressed on-disk cache of the range and range-Doppler products of captures.
+
+    An entry is keyed on the capture (its size and modification time, or the hash of its
+    contents), its radar configuration and the processing options, so a capture is
+    only processed again when one of them changes. Entries are built with
+    offline_processing.process_capture into a temporary directory and renamed into place,
+    and the least recently used entries are deleted when the cache exceeds its budget. A
+    capture whose products alone exceed the budget is refused instead of being processed.
+    """
+    def __init__(self, root=DEFAULT_CACHE_DIR, budgetBytes=8 * 2**30, hashContent=False):
+        """
+        Initialize the ProductCache.
+
+        Args:
+            root (str): Directory holding the cache entries.
+            budgetBytes (int): Maximum total size of the entries in bytes.
+            hashContent (bool): Key captures on the hash of their contents instead of their
+                                path, size and modification time.
+        """
+        self.root = root
+        self.budgetBytes = budgetBytes
+        self.hashContent = hashContent
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, path, options=None):
+        """
+        Compute the cache key of a capture.
+
+        Args:
+            path (str): Raw .bin capture or CaptureRecorder segment.
+            options (dict): Processing options, see get().
+
+        Returns:
+            str: Hex key.
+        """
+        stat = os.stat(path)
+        if self.hashContent:
+            source = {'digest': file_digest(path)}
+        else:
+            source = {'path': os.path.realpath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        description = {'version': PROCESSING_VERSION,
+                       'source': source,
+                       'radarConfig': RawDataReader(path).frameconfig.radarConfig.to_dict(),
+                       'options': options or {}}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:32]
+
+    def get(self, path, rangeBins=None, products=PRODUCTS, workers=None, mpContext=None):
+        """
+        Get the products of a capture, processing it first if it is not cached.
+
+        Args:
+            path (str): Raw .bin capture or CaptureRecorder segment.
+            rangeBins (tuple): (start, stop) range bins to keep, see RangeDopplerProcessor.
+            products (tuple): Names from offline_processing.PRODUCTS.
+            workers (int): Number of processes used on a cache miss (default: all cores).
+            mpContext: Multiprocessing context of the pool used on a cache miss, see
+                       offline_processing.process_capture.
+
+        Returns:
+            CachedProducts: The cached products.
+
+        Raises:
+            ValueError: If the capture is not cached and its products are larger than the
+                        budget, so that the entry would be evicted as soon as it is built.
+        """
+        options = {'rangeBins': list(rangeBins) if rangeBins is not None else None,
+                   'products': sorted(products)}
+        key = self.key(path, options)
+        entryPath = os.path.join(self.root, key)
+        metaPath = os.path.join(entryPath, META_FILE)
+        if os.path.exists(metaPath):
+            self.hits += 1
+        else:
+            size = self.entryBytes(path, rangeBins, products)
+            if size > self.budgetBytes:
+                raise ValueError(f"the products of {path} take {size} bytes, "
+                                 f"more than the cache budget of {self.budgetBytes} bytes")
+            self.misses += 1
+            self._build(path, entryPath, options, workers, mpContext)
+            self.evict(keep=key)
+        # The modification time of the meta file orders the entries for eviction
+        os.utime(metaPath)
+        return CachedProducts(entryPath)
+
+    def entryBytes(self, path, rangeBins=None, products=PRODUCTS):
+        """
+        Get the size of the cache entry of a capture, without processing it.
+
+        Args:
+            path (str): Raw .bin capture or CaptureRecorder segment.
+            rangeBins (tuple): (start, stop) range bins to keep, see get().
+            products (tuple): Names from offline_processing.PRODUCTS.
+
+        Returns:
+            int: Size of the product arrays in bytes.
+        """
+        reader = RawDataReader(path)
+        shapes = product_shapes(reader.frameconfig, len(reader), rangeBins)
+        reader.close()
+        return sum(int(np.prod(shapes[name])) * np.dtype(np.float32).itemsize for name in products)
+
+    def entries(self):
+        """
+        List the complete cache entries.
+
+        Returns:
+            list: (last use time, size in bytes, key) of every entry, least recently used first.
+        """
+        entries = []
+        for key in os.listdir(self.root):
+            metaPath = os.path.join(self.root, key, META_FILE)
+            if not os.path.exists(metaPath):
+                continue
+            with open(metaPath) as f:
+                size = json.load(f)['bytes']
+            entries.append((os.path.getmtime(metaPath), size, key))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used entries until the cache fits its budget.
+
+        Args:
+            keep (str): Key of an entry that must not be deleted.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, key in entries:
+            if total - freed <= self.budgetBytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            freed += size
+        return freed
+
+    def clear(self):
+        """
+        Delete all entries.
+        """
+        for key in os.listdir(self.root):
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def _build(self, path, entryPath, options, workers, mpContext):
+        """
+        Process a capture into a new cache entry.
+        """
+        tmpPath = f"{entryPath}.tmp-{os.getpid()}"
+        os.makedirs(tmpPath)
+        try:
+            stats = process_capture(path, os.path.join(tmpPath, 'products'), workers=workers,
+                                    products=tuple(options['products']),
+                                    rangeBins=options['rangeBins'], mpContext=mpContext)
+            size = sum(os.path.getsize(os.path.join(tmpPath, name)) for name in os.listdir(tmpPath))
+            meta = {'source': os.path.realpath(path),
+                    'frames': stats['frames'],
+                    'products': options['products'],
+                    'options': options,
+                    'bytes': size,
+                    'created': time.time()}
+            with open(os.path.join(tmpPath, META_FILE), 'w') as f:
+                json.dump(meta, f)
+            try:
+                os.rename(tmpPath, entryPath)
+            except OSError:
+                # Another process built the same entry in the meantime
+                shutil.rmtree(tmpPath, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmpPath, ignore_errors=True)
+            raise
+
+
+def main():
+    # Usage: python product_cache.py <filename.bin> [budget_gb]
+    bin_filename = sys.argv[1]
+    budgetBytes = int(float(sys.argv[2]) * 2**30) if len(sys.argv) > 2 else 8 * 2**30
+
+    cache = ProductCache(budgetBytes=budgetBytes)
+    start = time.perf_counter()
+    products = cache.get(bin_filename)
+    print(f"{len(products)} frames {'loaded from' if cache.hits else 'processed into'} "
+          f"{products.entryPath} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import dataclasses
+import functools
+import re
+import sys
+
+# Names of the settings in dataCaptureScript.lua, by RadarConfig field
+LUA_NAMES = {'num_tx': 'NUM_TX',
+             'num_rx': 'NUM_RX',
+             'start_freq': 'START_FREQ',
+             'adc_start_time': 'ADC_START_TIME',
+             'freq_slope': 'FREQ_SLOPE',
+             'adc_samples': 'ADC_SAMPLES',
+             'sample_rate': 'SAMPLE_RATE',
+             'rx_gain': 'RX_GAIN',
+             'idle_time': 'IDLE_TIME',
+             'ramp_end_time': 'RAMP_END_TIME',
+             'loops_per_frame': 'CHIRP_LOOPS',
+             'periodicity': 'PERIODICITY',
+             'num_frames': 'NumOfFrame'}
+LUA_ASSIGNMENT = re.compile(r'^\s*(\w+)\s*=\s*(-?[\d.]+)\s*(?:--.*)?$')
+
+
+@dataclasses.dataclass(frozen=True)
+class RadarConfig:
+    """
+    Validated radar configuration from which all frame geometry and resolutions are derived.
+
+    The configuration is immutable, so every derived value is computed once and cached.
+    Capture, DSP and tools all take their frame sizes from one RadarConfig (see
+    configuration.RADAR_CONFIG), and CaptureRecorder embeds it in every capture segment.
+
+    Times are in microseconds, frequencies in GHz, the frequency slope in MHz/us, the
+    sample rate in ksps and the periodicity in milliseconds, as in mmWave Studio.
+    """
+    num_tx: int
+    num_rx: int
+    start_freq: float
+    adc_start_time: float
+    freq_slope: float
+    adc_samples: int
+    sample_rate: float
+    rx_gain: int
+    idle_time: float
+    ramp_end_time: float
+    loops_per_frame: int
+    periodicity: float
+    num_frames: int = 0
+    num_angle_bins: int = 64
+    bytes_in_packet: int = 1456
+    iq: int = 2
+    bytes_per_component: int = 2
+
+    def __post_init__(self):
+        for name in ('num_tx', 'num_rx', 'adc_samples', 'loops_per_frame', 'num_angle_bins',
+                     'bytes_in_packet', 'iq', 'bytes_per_component', 'num_frames'):
+            value = getattr(self, name)
+            if not isinstance(value, int) or isinstance(value, bool) or value < (0 if name == 'num_frames' else 1):
+                raise ValueError(f"{name} must be a positive integer, got {value!r}")
+        for name in ('start_freq', 'freq_slope', 'sample_rate', 'ramp_end_time', 'periodicity'):
+            if not getattr(self, name) > 0:
+                raise ValueError(f"{name} must be positive, got {getattr(self, name)!r}")
+        if not 1 <= self.num_tx <= 3:
+            raise ValueError(f"num_tx must be between 1 and 3, got {self.num_tx}")
+        if not 1 <= self.num_rx <= 4:
+            raise ValueError(f"num_rx must be between 1 and 4, got {self.num_rx}")
+        if self.adc_samples % 2:
+            raise ValueError(f"adc_samples must be even for the LVDS sample layout, got {self.adc_samples}")
+        if self.adc_start_time + self.sampling_time > self.ramp_end_time:
+            raise ValueError(f"ADC sampling ends at {self.adc_start_time + self.sampling_time:.1f} us, "
+                             f"after the ramp end time of {self.ramp_end_time} us")
+        if self.frame_active_time > self.periodicity:
+            raise ValueError(f"the chirps of a frame take {self.frame_active_time:.2f} ms, "
+                             f"longer than the periodicity of {self.periodicity} ms")
+
+    # Frame geometry
+
+    @functools.cached_property
+    def chirps_per_frame(self):
+        return self.num_tx * self.loops_per_frame
+
+    @functools.cached_property
+    def frame_size(self):
+        """
+        Number of complex samples in a frame.
+        """
+        return self.loops_per_frame * self.num_tx * self.num_rx * self.adc_samples
+
+    @functools.cached_property
+    def bytes_in_frame(self):
+        return self.frame_size * self.iq * self.bytes_per_component
+
+    @functools.cached_property
+    def uint16_in_frame(self):
+        return self.bytes_in_frame // 2
+
+    @functools.cached_property
+    def packets_in_frame(self):
+        """
+        Number of DCA1000 packets needed for a frame, including a partly filled last one.
+        """
+        return -(-self.bytes_in_frame // self.bytes_in_packet)
+
+    # Timing
+
+    @functools.cached_property
+    def sampling_time(self):
+        """
+        ADC sampling time of a chirp in microseconds.
+        """
+        return self.adc_samples / self.sample_rate * 1e3
+
+    @functools.cached_property
+    def chirp_time(self):
+        """
+        Duration of a chirp including its idle time, in microseconds.
+        """
+        return self.idle_time + self.ramp_end_time
+
+    @functools.cached_property
+    def frame_active_time(self):
+        """
+        Time taken by the chirps of a frame, in milliseconds.
+        """
+        return self.chirps_per_frame * self.chirp_time * 1e-3
+
+    @functools.cached_property
+    def frame_rate(self):
+        return 1e3 / self.periodicity
+
+    @functools.cached_property
+    def bytes_per_second(self):
+        return self.bytes_in_frame * self.frame_rate
+
+    def buffer_frames(self, seconds):
+        """
+        Number of frames captured in a time span, e.g. to size a capture ring.
+
+        Args:
+            seconds (float): Time span in seconds.
+
+        Returns:
+            int: Number of frames, at least 1.
+        """
+        return max(1, int(-(-seconds * self.frame_rate // 1)))
+
+    # Resolutions
+
+    @functools.cached_property
+    def range_resolution(self):
+        return (3e8 * self.sample_rate * 1e3) / (2 * self.freq_slope * 1e12 * self.adc_samples)
+
+    @functools.cached_property
+    def max_range(self):
+        return (300 * self.sample_rate) / (2 * self.freq_slope * 1e3)
+
+    @functools.cached_property
+    def doppler_resolution(self):
+        return 3e8 / (2 * self.start_freq * 1e9 * self.chirp_time * 1e-6 * self.loops_per_frame * self.num_tx)
+
+    @functools.cached_property
+    def max_doppler(self):
+        return 3e8 / (4 * self.start_freq * 1e9 * self.chirp_time * 1e-6 * self.num_tx)
+
+    # Conversions
+
+    def adc_params(self):
+        """
+        Get the frame layout in the ADC_PARAMS format of steaming.py.
+
+        Returns:
+            dict: Chirp loops, antennas, samples, IQ components and bytes per component.
+        """
+        return {'chirps': self.loops_per_frame,
+                'rx': self.num_rx,
+                'tx': self.num_tx,
+                'samples': self.adc_samples,
+                'IQ': self.iq,
+                'bytes': self.bytes_per_component}
+
+    def to_dict(self):
+        """
+        Get the settings, e.g. to embed them in a capture header.
+
+        Returns:
+            dict: Field values, accepted by from_dict.
+        """
+        return dataclasses.asdict(self)
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        Create a RadarConfig from the output of to_dict.
+
+        Args:
+            values (dict): Field values.
+
+        Returns:
+            RadarConfig: The validated configuration.
+        """
+        return cls(**values)
+
+    @classmethod
+    def from_lua(cls, path, **defaults):
+        """
+        Read the settings of a mmWave Studio Lua script such as dataCaptureScript.lua.
+
+        Args:
+            path (str): Path of the Lua script.
+            **defaults: Values of fields the script does not set.
+
+        Returns:
+            RadarConfig: The validated configuration.
+        """
+        values = read_lua_settings(path)
+        fields = dict(defaults)
+        for field, name in LUA_NAMES.items():
+            if name in values:
+                fields[field] = values[name]
+        return cls(**fields)
+
+    def check_lua(self, path):
+        """
+        Compare this configuration with the settings of a mmWave Studio Lua script.
+
+        Args:
+            path (str): Path of the Lua script.
+
+        Returns:
+            dict: (this value, Lua value) of every setting that differs; empty if they agree.
+        """
+        values = read_lua_settings(path)
+        mismatches = {}
+        for field, name in LUA_NAMES.items():
+            if name in values and values[name] != getattr(self, field):
+                mismatches[field] = (getattr(self, field), values[name])
+        # Every TX antenna is one chirp of a loop
+        if 'NumOfChirpInLoop' in values and values['NumOfChirpInLoop'] != self.num_tx:
+            mismatches['chirps_per_loop'] = (self.num_tx, values['NumOfChirpInLoop'])
+        return mismatches
+
+    def c_defines(self):
+        """
+        Get the frame geometry as C preprocessor definitions, as used by main.c.
+
+        Returns:
+            str: #define lines.
+        """
+        return '\n'.join([f"#define NUM_LOOPS {self.loops_per_frame}",
+                          f"#define NUM_TX {self.num_tx}",
+                          f"#define NUM_RX {self.num_rx}",
+                          f"#define ADC_SAMPLES {self.adc_samples}",
+                          "#define FRAME_SIZE (NUM_LOOPS * NUM_TX * NUM_RX * ADC_SAMPLES * 4)"])
+
+
+def read_lua_settings(path):
+    """
+    Read the numeric top-level assignments of a Lua script.
+
+    Args:
+        path (str): Path of the Lua script.
+
+    Returns:
+        dict: Values by name, int where the value has no decimal point.
+    """
+    values = {}
+    with open(path) as f:
+        for line in f:
+            match = LUA_ASSIGNMENT.match(line)
+            if match:
+                name, value = match.groups()
+                values[name] = float(value) if '.' in value else int(value)
+    return values
+
+
+def main():
+    # Usage: python radar_config.py [dataCaptureScript.lua]
+    from configuration import RADAR_CONFIG
+
+    print(RADAR_CONFIG)
+    for name in ('frame_size', 'bytes_in_frame', 'packets_in_frame', 'frame_rate', 'bytes_per_second',
+                 'range_resolution', 'max_range', 'doppler_resolution', 'max_doppler'):
+        print(f"  {name}: {getattr(RADAR_CONFIG, name)}")
+    if len(sys.argv) > 1:
+        mismatches = RADAR_CONFIG.check_lua(sys.argv[1])
+        for field, (value, luaValue) in mismatches.items():
+            print(f"  {field}: {value} in configuration.py, {luaValue} in {sys.argv[1]}")
+        if not mismatches:
+            print(f"  {sys.argv[1]} agrees with configuration.py")
+
+
+if __name__ == "__main__":
+    main()
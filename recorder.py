@@ -0,0 +1,298 @@
+import json
+import os
+import struct
+import threading
+import time
+import numpy as np
+import configuration as cfg
+from steaming import ADC_PARAMS, BYTES_IN_FRAME
+from telemetry import LatencyHistogram
+
+# Capture segment layout: magic, uint32 header length, JSON header, zero padding up to
+# data_offset (a multiple of HEADER_ALIGN), then raw frames exactly as received.
+CAPTURE_MAGIC = b'MMWCAP01'
+HEADER_ALIGN = 4096
+CAPTURE_EXTENSION = '.mmw'
+INDEX_EXTENSION = '.idx'
+"""
+- CAPTURE_MAGIC: First bytes of every capture segment.
+- HEADER_ALIGN: Alignment of the frame data, so segments can be memory-mapped page aligned.
+- CAPTURE_EXTENSION: File extension of capture segments.
+- INDEX_EXTENSION: File extension of the frame index stored next to each segment.
+"""
+
+# One index record per frame, appended to the .idx file once the frame is on disk
+INDEX_DTYPE = np.dtype([('frame_num', '<i8'), ('timestamp', '<f8'), ('lost', '<u4')])
+
+
+def radar_config():
+    """
+    Collect the radar configuration embedded in capture headers.
+
+    Returns:
+        dict: The validated radar configuration ('radar_config', see RadarConfig.to_dict), the
+              upper-case values of configuration.py, ADC_PARAMS and the frame size in bytes.
+    """
+    configuration = {name: getattr(cfg, name) for name in dir(cfg) if name.isupper() and name != 'RADAR_CONFIG'}
+    return {'radar_config': cfg.RADAR_CONFIG.to_dict(),
+            'configuration': configuration,
+            'ADC_PARAMS': dict(ADC_PARAMS),
+            'BYTES_IN_FRAME': BYTES_IN_FRAME}
+
+
+def write_header(fd, header):
+    """
+    Write a capture header at the current position of a file descriptor.
+
+    Args:
+        fd (int): File descriptor of a new, empty capture segment.
+        header (dict): JSON-serializable header; 'data_offset' is added to it.
+
+    Returns:
+        int: Offset of the first frame in the file.
+    """
+    # data_offset is part of the header, so size the header with a placeholder first
+    header = dict(header, data_offset=0)
+    body_size = len(json.dumps(header).encode()) + 32
+    header['data_offset'] = -(-(len(CAPTURE_MAGIC) + 4 + body_size) // HEADER_ALIGN) * HEADER_ALIGN
+    body = json.dumps(header).encode()
+    os.write(fd, CAPTURE_MAGIC + struct.pack('<I', len(body)) + body)
+    os.write(fd, bytes(header['data_offset'] - len(CAPTURE_MAGIC) - 4 - len(body)))
+    return header['data_offset']
+
+
+def read_header(path):
+    """
+    Read the header of a capture segment.
+
+    Args:
+        path (str): Path of the capture segment.
+
+    Returns:
+        dict: The header, or None if the file is a headerless raw .bin capture.
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(len(CAPTURE_MAGIC) + 4)
+        if len(prefix) < len(CAPTURE_MAGIC) + 4 or prefix[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            return None
+        body_size = struct.unpack('<I', prefix[len(CAPTURE_MAGIC):])[0]
+        return json.loads(f.read(body_size).decode())
+
+
+def read_index(path):
+    """
+    Read the frame index stored next to a capture segment.
+
+    Args:
+        path (str): Path of the capture segment.
+
+    Returns:
+        ndarray: Index records with INDEX_DTYPE; a trailing partial record is ignored.
+    """
+    index_path = os.path.splitext(path)[0] + INDEX_EXTENSION
+    if not os.path.exists(index_path):
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    raw = np.fromfile(index_path, dtype=np.uint8)
+    return raw[:len(raw) // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+
+
+class CaptureRecorder(threading.Thread):
+    """
+    A thread class writing the frames of an adcCapThread to self-describing capture segments.
+
+    The recorder is the consumer of the capture ring: it takes batches of frames with
+    getFrames, writes them straight from the ring memory and releases them, so the receive
+    thread never waits for the disk. Segments are preallocated, rotated by size or time,
+    and fsynced periodically; index records are only written for frames already synced,
+    so after a crash the index never points at frames that did not reach the disk.
+    """
+    def __init__(self, capThread, basePath, segmentBytes=2**32, segmentSeconds=None,
+                 batchFrames=32, fsyncInterval=1.0):
+        """
+        Initialize the CaptureRecorder.
+
+        Args:
+            capThread: The adcCapThread to record from.
+            basePath: Path prefix of the segments, written as <basePath>_<n>.mmw and <basePath>_<n>.idx.
+            segmentBytes: Maximum size of one segment in bytes.
+            segmentSeconds: Maximum duration of one segment in seconds, or None for no limit.
+            batchFrames: Maximum number of frames taken from the ring per write.
+            fsyncInterval: Seconds between fsyncs of the segment being written.
+        """
+        threading.Thread.__init__(self)
+        self.whileSign = True
+        self.capThread = capThread
+        self.basePath = basePath
+        self.segmentBytes = segmentBytes
+        self.segmentSeconds = segmentSeconds
+        self.batchFrames = batchFrames
+        self.fsyncInterval = fsyncInterval
+
+        self.segmentPaths = []
+        self.framesWritten = 0
+        self.bytesWritten = 0
+        self.writeSeconds = 0.0
+        self.writeLatency = LatencyHistogram()
+
+        self._dataFd = None
+        self._indexFd = None
+        self._segmentFrames = 0
+        self._segmentCapacity = 0
+        self._segmentStart = 0.0
+        self._dataOffset = 0
+        self._pendingIndex = []
+        self._lastSync = 0.0
+
+    def run(self):
+        """
+        Run the thread.
+        """
+        while True:
+            timeout = 0.5 if self.whileSign else 0
+            frames, itemNums, lostFlags, timestamps = self.capThread.getFrames(self.batchFrames, timeout)
+            if len(frames) == 0:
+                # Once stopped, drain the ring before closing the last segment
+                if not self.whileSign:
+                    break
+                continue
+            self._write_batch(frames, itemNums, lostFlags, timestamps)
+            self.capThread.releaseFrames()
+            if time.monotonic() - self._lastSync >= self.fsyncInterval:
+                self._sync()
+        self._close_segment()
+
+    def stop(self):
+        """
+        Stop recording once the frames already in the ring are written.
+        """
+        self.whileSign = False
+
+    def getStats(self):
+        """
+        Get the recorder counters.
+
+        Returns:
+            dict: Frames and bytes written, number of segments and write throughput in bytes/sec.
+        """
+        return {'frames': self.framesWritten,
+                'bytes': self.bytesWritten,
+                'segments': len(self.segmentPaths),
+                'bytes_per_sec': self.bytesWritten / self.writeSeconds if self.writeSeconds else 0.0}
+
+    def getTelemetry(self):
+        """
+        Get the counters and write latency histogram of the recorder, see telemetry.Telemetry.
+
+        Returns:
+            dict: 'counters' (frames and bytes written, segments) and 'histograms' ('write',
+                  per batch of frames taken from the ring).
+        """
+        return {'counters': {'frames_written': self.framesWritten,
+                             'bytes_written': self.bytesWritten,
+                             'segments': len(self.segmentPaths)},
+                'histograms': {'write': self.writeLatency}}
+
+    def _write_batch(self, frames, itemNums, lostFlags, timestamps):
+        """
+        Write a batch of frames, rotating segments as needed.
+
+        Args:
+            frames: (n, UINT16_IN_FRAME) int16 view into the capture ring.
+            itemNums: Frame numbers.
+            lostFlags: Lost packet flags.
+            timestamps: Frame completion timestamps.
+        """
+        start = time.perf_counter()
+        written = 0
+        while written < len(frames):
+            if self._segment_full():
+                self._close_segment()
+                self._open_segment()
+            count = min(len(frames) - written, self._segmentCapacity - self._segmentFrames)
+            self._write_all(memoryview(frames[written:written + count]).cast('B'))
+
+            records = np.zeros(count, dtype=INDEX_DTYPE)
+            records['frame_num'] = itemNums[written:written + count]
+            records['timestamp'] = timestamps[written:written + count]
+            records['lost'] = lostFlags[written:written + count]
+            self._pendingIndex.append(records)
+
+            self._segmentFrames += count
+            written += count
+        self.framesWritten += written
+        self.bytesWritten += written * BYTES_IN_FRAME
+        elapsed = time.perf_counter() - start
+        self.writeSeconds += elapsed
+        self.writeLatency.record(elapsed)
+
+    def _write_all(self, buffer):
+        """
+        Write a whole buffer to the current segment, retrying short writes.
+
+        Args:
+            buffer (memoryview): Bytes to write.
+        """
+        while len(buffer):
+            buffer = buffer[os.write(self._dataFd, buffer):]
+
+    def _segment_full(self):
+        """
+        Check whether a new segment has to be started.
+
+        Returns:
+            bool: True if there is no open segment or the current one is full or too old.
+        """
+        if self._dataFd is None or self._segmentFrames >= self._segmentCapacity:
+            return True
+        return self.segmentSeconds is not None and time.monotonic() - self._segmentStart >= self.segmentSeconds
+
+    def _open_segment(self):
+        """
+        Create the next segment, write its header and preallocate its frame area.
+        """
+        path = f"{self.basePath}_{len(self.segmentPaths):04d}"
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+        self._dataFd = os.open(path + CAPTURE_EXTENSION, flags, 0o644)
+        self._indexFd = os.open(path + INDEX_EXTENSION, flags, 0o644)
+
+        header = radar_config()
+        header.update({'segment': len(self.segmentPaths),
+                       'created': time.time(),
+                       'index_dtype': INDEX_DTYPE.descr})
+        self._dataOffset = write_header(self._dataFd, header)
+        self._segmentCapacity = max(1, (self.segmentBytes - self._dataOffset) // BYTES_IN_FRAME)
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(self._dataFd, self._dataOffset, self._segmentCapacity * BYTES_IN_FRAME)
+            except OSError:
+                pass
+
+        self.segmentPaths.append(path + CAPTURE_EXTENSION)
+        self._segmentFrames = 0
+        self._segmentStart = time.monotonic()
+
+    def _sync(self):
+        """
+        Flush the frames written so far, then append their index records.
+        """
+        self._lastSync = time.monotonic()
+        if self._dataFd is None:
+            return
+        os.fsync(self._dataFd)
+        if self._pendingIndex:
+            os.write(self._indexFd, np.concatenate(self._pendingIndex).tobytes())
+            os.fsync(self._indexFd)
+            self._pendingIndex = []
+
+    def _close_segment(self):
+        """
+        Sync the current segment, trim its unused preallocated space and close it.
+        """
+        if self._dataFd is None:
+            return
+        self._sync()
+        os.ftruncate(self._dataFd, self._dataOffset + self._segmentFrames * BYTES_IN_FRAME)
+        os.close(self._dataFd)
+        os.close(self._indexFd)
+        self._dataFd = None
+        self._indexFd = None
@@ -1,17 +1,19 @@
+import ctypes
+import ctypes.util
+import errno
+import select
 import socket
 import struct
+import sys
 import threading
 import time
 import array as arr
 import numpy as np
+import configuration as cfg
+from telemetry import LatencyHistogram, udp_socket_stats
 
-# Adjust as per the config file used in plotData.py
-ADC_PARAMS = {'chirps': 128,
-              'rx': 4,
-              'tx': 3,
-              'samples': 256,
-              'IQ': 2,
-              'bytes': 2}
+# Derived from configuration.RADAR_CONFIG, the same geometry plotData.py uses
+ADC_PARAMS = cfg.RADAR_CONFIG.adc_params()
 """
 ADC_PARAMS is a dictionary that stores the configuration parameters for the ADC (Analog-to-Digital Converter).
 - 'chirps': Number of chirps per frame.
@@ -24,20 +26,71 @@ ADC_PARAMS is a dictionary that stores the configuration parameters for the ADC
 
 # STATIC
 MAX_PACKET_SIZE = 4096
-BYTES_IN_PACKET = 1456
+BYTES_IN_PACKET = cfg.RADAR_CONFIG.bytes_in_packet
 """
 - MAX_PACKET_SIZE: Maximum size of a packet in bytes.
 - BYTES_IN_PACKET: Number of bytes in each packet.
 """
 
+# DCA1000 packet header: 4-byte packet number, 6-byte little-endian byte count (low 32 + high 16 bits)
+PACKET_HEADER = struct.Struct('<IIH')
+RECEIVER_MODES = ('python', 'zerocopy', 'recvmmsg')
+LOST_PACKET_POLICIES = ('exit', 'zerofill')
+OVERFLOW_POLICIES = ('drop_oldest', 'block')
+
+# Header layout of one batched receive slot, padded to 16 bytes
+BATCH_HEADER_DTYPE = np.dtype([('packet_num', '<u4'), ('byte_count_low', '<u4'),
+                               ('byte_count_high', '<u2'), ('pad', 'V6')])
+MSG_WAITFORONE = 0x10000
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.c_void_p), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+def _load_recvmmsg():
+    """
+    Look up recvmmsg in the C library.
+
+    ctypes releases the GIL for the duration of the call, so a whole batch of packets is
+    received without touching the interpreter.
+
+    Returns:
+        The recvmmsg function, or None if the platform does not provide it.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _load_recvmmsg()
+
 # DYNAMIC
-BYTES_IN_FRAME = (ADC_PARAMS['chirps'] * ADC_PARAMS['rx'] * ADC_PARAMS['tx'] *
-                  ADC_PARAMS['IQ'] * ADC_PARAMS['samples'] * ADC_PARAMS['bytes'])
+BYTES_IN_FRAME = cfg.RADAR_CONFIG.bytes_in_frame
 BYTES_IN_FRAME_CLIPPED = (BYTES_IN_FRAME // BYTES_IN_PACKET) * BYTES_IN_PACKET
 PACKETS_IN_FRAME = BYTES_IN_FRAME / BYTES_IN_PACKET
 PACKETS_IN_FRAME_CLIPPED = BYTES_IN_FRAME // BYTES_IN_PACKET
 UINT16_IN_PACKET = BYTES_IN_PACKET // 2
 UINT16_IN_FRAME = BYTES_IN_FRAME // 2
+SPANS_IN_FRAME = cfg.RADAR_CONFIG.packets_in_frame
 """
 - BYTES_IN_FRAME: Total number of bytes in a frame.
 - BYTES_IN_FRAME_CLIPPED: Number of bytes in a frame after clipping to a multiple of BYTES_IN_PACKET.
@@ -45,6 +98,7 @@ UINT16_IN_FRAME = BYTES_IN_FRAME // 2
 - PACKETS_IN_FRAME_CLIPPED: Number of packets in a frame after clipping.
 - UINT16_IN_PACKET: Number of 16-bit unsigned integers in a packet.
 - UINT16_IN_FRAME: Number of 16-bit unsigned integers in a frame.
+- SPANS_IN_FRAME: Number of BYTES_IN_PACKET-sized spans covering a frame, the granularity of the loss mask.
 """
 
 class adcCapThread(threading.Thread):
@@ -52,7 +106,8 @@ class adcCapThread(threading.Thread):
     A thread class for capturing ADC data.
     """
     def __init__(self, threadID, name, static_ip='192.168.33.30', adc_ip='192.168.33.180',
-                 data_port=4098, config_port=4096, bufferSize=1500):
+                 data_port=4098, config_port=4096, bufferSize=1500, receiver='python', batchSize=64,
+                 lostPacketPolicy='exit', overflowPolicy='drop_oldest', clock=time.time, instrument=False):
         """
         Initialize the adcCapThread.
 
@@ -64,7 +119,32 @@ class adcCapThread(threading.Thread):
             data_port: Port number for receiving data.
             config_port: Port number for configuration.
             bufferSize: Size of the buffer for storing frames.
+            receiver: Packet receive path, one of RECEIVER_MODES.
+                      - 'python': recvfrom per packet, frame assembled in a temporary array.
+                      - 'zerocopy': payload received directly into its slot of bufferArray.
+                      - 'recvmmsg': like 'zerocopy', but up to batchSize packets per syscall with
+                        the GIL released. Falls back to 'zerocopy' where recvmmsg is unavailable.
+            batchSize: Maximum number of packets per recvmmsg call.
+            lostPacketPolicy: What to do when a packet is missing, one of LOST_PACKET_POLICIES.
+                              - 'exit': stop capturing, the data must be discarded.
+                              - 'zerofill': place every packet at the offset given by its byte
+                                count, zero-fill the missing spans and flag the frame as lost.
+            overflowPolicy: What to do when the consumer falls bufferSize frames behind, one of OVERFLOW_POLICIES.
+                            - 'drop_oldest': discard the oldest unread frame (or the new frame if the
+                              oldest one is still held by the consumer) and keep receiving.
+                            - 'block': stop receiving until the consumer releases a slot; the socket
+                              receive buffer absorbs the backlog.
+            clock: Function returning the time in seconds at which a frame is completed, e.g.
+                   time.monotonic to share a clock with other recorders.
+            instrument: Time every receive call and the receiver work per frame, see
+                        getTelemetry(). Off by default, as it adds two clock reads per packet.
         """
+        if receiver not in RECEIVER_MODES:
+            raise ValueError(f"receiver must be one of {RECEIVER_MODES}, got {receiver!r}")
+        if lostPacketPolicy not in LOST_PACKET_POLICIES:
+            raise ValueError(f"lostPacketPolicy must be one of {LOST_PACKET_POLICIES}, got {lostPacketPolicy!r}")
+        if overflowPolicy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflowPolicy must be one of {OVERFLOW_POLICIES}, got {overflowPolicy!r}")
         threading.Thread.__init__(self)
         self.whileSign = True
         self.threadID = threadID
@@ -73,9 +153,14 @@ class adcCapThread(threading.Thread):
         self.latestReadNum = 0
         self.nextReadBufferPosition = 0
         self.nextCapBufferPosition = 0
-        self.bufferOverWritten = True
         self.bufferSize = bufferSize
-    
+        self.receiver = receiver
+        self.batchSize = batchSize
+        self.lostPacketPolicy = lostPacketPolicy
+        self.overflowPolicy = overflowPolicy
+        self.clock = clock
+        self.instrument = instrument
+
         # Create configuration and data destinations
         self.cfg_dest = (adc_ip, config_port)
         self.cfg_recv = (static_ip, config_port)
@@ -92,15 +177,155 @@ class adcCapThread(threading.Thread):
         # Bind config socket to fpga
         self.config_socket.bind(self.cfg_recv)
 
-        self.bufferArray = np.zeros((self.bufferSize, BYTES_IN_FRAME//2), dtype=np.int16)
+        # One extra row after the ring receives frames that are dropped on overflow
+        self._scratchSlot = self.bufferSize
+        self._frameStorage = np.zeros((self.bufferSize + 1, BYTES_IN_FRAME//2), dtype=np.int16)
+        self._lostMaskStorage = np.zeros((self.bufferSize + 1, SPANS_IN_FRAME), dtype=bool)
+        self.bufferArray = self._frameStorage[:self.bufferSize]
         self.itemNumArray = np.zeros(self.bufferSize, dtype=np.int32)
         self.lostPackeFlagtArray = np.zeros(self.bufferSize, dtype=bool)
+        # Per frame: which BYTES_IN_PACKET-sized spans were zero-filled, and how many
+        self.lostPacketMaskArray = self._lostMaskStorage[:self.bufferSize]
+        self.lostPacketCountArray = np.zeros(self.bufferSize, dtype=np.int32)
+        # Time at which each frame was completed, read from clock
+        self.timestampArray = np.zeros(self.bufferSize, dtype=np.float64)
+
+        # Single-producer/single-consumer ring state. Frame sequence number k lives in slot
+        # k % bufferSize. Each counter has exactly one writer:
+        # - _writeSeq (producer): frames published.
+        # - _dropSeq (producer): frames below it were dropped by the drop_oldest policy.
+        # - _readSeq (consumer): frames released, their slots may be reused.
+        # - _leaseSeq (consumer): frames handed out, valid until the next getFrame(s) call.
+        # The packet path never locks; the condition is only used to sleep and wake up.
+        self._writeSeq = 0
+        self._dropSeq = 0
+        self._readSeq = 0
+        self._leaseSeq = 0
+        self._nextSlot = None
+        self._ringCondition = threading.Condition()
+        self.droppedFrames = 0
+
+        # Byte view over the whole ring so packets can be received straight into their slot
+        self._ringArray = self._frameStorage.reshape(-1).view(np.uint8)
+        self._ringBytes = memoryview(self._ringArray)
+        self._headerScratch = bytearray(PACKET_HEADER.size)
+        self._packetScratch = bytearray(MAX_PACKET_SIZE)
+
+        # Throughput counters, see getStats()
+        self.packetsReceived = 0
+        self.framesCaptured = 0
+        self.bytesCopied = 0
+        # bytesCopied when the last frame was completed, without the bytes of the frames after it
+        self._completedBytesCopied = 0
+        self._firstPacketTime = None
+
+        # Cumulative loss counters, see getStats()
+        self.lostPackets = 0
+        self.latePackets = 0
+        self.lostFrames = 0
+        # Zero-filled (start, stop) byte spans of the frame being assembled, for late packets
+        self._gaps = []
+        self.skippedFrames = 0
+
+        # Latency histograms, see getTelemetry(); receive and assembly only with instrument
+        self.receiveLatency = LatencyHistogram()
+        self.assemblyLatency = LatencyHistogram()
+        self.ringWaitLatency = LatencyHistogram()
+        self.overflowWaitLatency = LatencyHistogram()
+        self._assemblySeconds = 0.0
+        self._lastReceiveEnd = None
 
     def run(self):
         """
         Run the thread.
         """
-        self._frame_receiver()
+        if self.receiver == 'recvmmsg' and _recvmmsg is None:
+            print("recvmmsg is not available on this platform, using the zerocopy receiver.")
+            self.receiver = 'zerocopy'
+        try:
+            if self.receiver == 'recvmmsg':
+                self._batched_receiver()
+            elif self.receiver == 'zerocopy':
+                self._zero_copy_receiver()
+            else:
+                self._frame_receiver()
+        except socket.timeout:
+            # Waiting for the next packet after stop() is not an error
+            if self.whileSign:
+                raise
+
+    def getStats(self):
+        """
+        Get the receiver throughput counters.
+
+        Returns:
+            dict: Counters with the following keys.
+                  - 'packets': Number of packets received.
+                  - 'frames': Number of frames stored in the buffer.
+                  - 'packets_per_sec': Packet rate since the first packet arrived.
+                  - 'copies_per_frame': Payload bytes copied into the stored frames per stored frame,
+                    in units of BYTES_IN_FRAME; the frame being assembled is not counted.
+                  - 'lost_packets': Number of packets that never arrived and were zero-filled.
+                  - 'late_packets': Number of duplicate packets and packets of frames already handed
+                    out, which were dropped. Out-of-order packets of the frame being assembled fill
+                    their zero-filled span and are not counted as lost.
+                  - 'lost_frames': Number of stored frames with at least one zero-filled span.
+                  - 'skipped_frames': Number of frames that fell entirely into a gap and were not stored.
+                  - 'dropped_frames': Number of frames discarded because the consumer fell behind.
+                  - 'ring_occupancy': Number of frames published but not yet released by the consumer.
+        """
+        elapsed = 0.0
+        if self._firstPacketTime is not None:
+            elapsed = time.perf_counter() - self._firstPacketTime
+        return {'packets': self.packetsReceived,
+                'frames': self.framesCaptured,
+                'packets_per_sec': self.packetsReceived / elapsed if elapsed > 0 else 0.0,
+                'copies_per_frame': (self._completedBytesCopied / (self.framesCaptured * BYTES_IN_FRAME)
+                                     if self.framesCaptured else 0.0),
+                'lost_packets': self.lostPackets,
+                'late_packets': self.latePackets,
+                'lost_frames': self.lostFrames,
+                'skipped_frames': self.skippedFrames,
+                'dropped_frames': self.droppedFrames,
+                'ring_occupancy': self._writeSeq - max(self._readSeq, self._dropSeq)}
+
+    def getTelemetry(self):
+        """
+        Get the counters, gauges and latency histograms of the receiver, see telemetry.Telemetry.
+
+        Returns:
+            dict: Entries with the following keys.
+                  - 'counters': Packets, frames, lost, late, skipped and dropped totals of getStats().
+                  - 'gauges': 'ring_occupancy' in frames, 'consumer_lag' (age in seconds of the
+                    oldest frame not released by the consumer), and the 'socket_rx_queue_bytes'
+                    and 'socket_drops' of the data socket where the kernel reports them.
+                  - 'histograms': 'receive' (each receive call, including the wait for packets),
+                    'assembly' (receiver work per frame outside the receive calls), 'ring_wait'
+                    (consumer waits for a frame) and 'overflow_wait' (producer waits for a free
+                    slot with the 'block' policy).
+        """
+        stats = self.getStats()
+        start = max(self._readSeq, self._dropSeq)
+        lag = 0.0
+        if self._writeSeq > start:
+            lag = max(0.0, self.clock() - self.timestampArray[start % self.bufferSize])
+        socketStats = udp_socket_stats(self.data_socket) or {}
+        return {'counters': {'packets': stats['packets'],
+                             'frames': stats['frames'],
+                             'lost_packets': stats['lost_packets'],
+                             'late_packets': stats['late_packets'],
+                             'lost_frames': stats['lost_frames'],
+                             'skipped_frames': stats['skipped_frames'],
+                             'dropped_frames': stats['dropped_frames'],
+                             'bytes_copied': self.bytesCopied},
+                'gauges': {'ring_occupancy': stats['ring_occupancy'],
+                           'consumer_lag': lag,
+                           'socket_rx_queue_bytes': socketStats.get('rx_queue_bytes'),
+                           'socket_drops': socketStats.get('drops')},
+                'histograms': {'receive': self.receiveLatency,
+                               'assembly': self.assemblyLatency,
+                               'ring_wait': self.ringWaitLatency,
+                               'overflow_wait': self.overflowWaitLatency}}
     
     def _frame_receiver(self):
         """
@@ -117,6 +342,7 @@ class adcCapThread(threading.Thread):
             # The recent Frame begins at the middle of this packet
             if after_packet_count < BYTES_IN_PACKET:
                 recentframe[0:after_packet_count//2] = packet_data[(BYTES_IN_PACKET-after_packet_count)//2:]
+                self.bytesCopied += after_packet_count
                 self.recentCapNum = (byte_count + BYTES_IN_PACKET) // BYTES_IN_FRAME
                 recentframe_collect_count = after_packet_count
                 last_packet_num = packet_num
@@ -127,7 +353,28 @@ class adcCapThread(threading.Thread):
         while self.whileSign:
             packet_num, byte_count, packet_data = self._read_data_packet()
             # Fix up the lost packets
-            if last_packet_num < packet_num - 1:                
+            if self.lostPacketPolicy == 'zerofill' and packet_num != last_packet_num + 1:
+                expected = self.recentCapNum * BYTES_IN_FRAME + recentframe_collect_count
+                if byte_count < expected:
+                    frameBytes = recentframe.view(np.uint8)
+                    payloadBytes = packet_data.view(np.uint8)
+                    for start, stop, source in self._recover_packet(byte_count):
+                        frameBytes[start:stop] = payloadBytes[source:source + stop - start]
+                    continue
+                lost_packets = True
+                self.lostPackets += (byte_count - expected) // BYTES_IN_PACKET
+                frame_num, offset = divmod(byte_count, BYTES_IN_FRAME)
+                # The gap runs past the end of the recent frame, whose tail stays zero
+                if frame_num > self.recentCapNum:
+                    self._mark_lost(recentframe_collect_count, BYTES_IN_FRAME)
+                    self._store_frame(recentframe)
+                    self.skippedFrames += frame_num - self.recentCapNum - 1
+                    self.recentCapNum = frame_num
+                    recentframe = np.zeros(UINT16_IN_FRAME, dtype=np.int16)
+                    recentframe_collect_count = 0
+                self._mark_lost(recentframe_collect_count, offset)
+                recentframe_collect_count = offset
+            elif last_packet_num < packet_num - 1:                
                 lost_packets = True
                 print('\a')
                 print("Packet Lost! Please discard this data.")
@@ -137,57 +384,584 @@ class adcCapThread(threading.Thread):
             # If the frame finished when this packet is collected
             if recentframe_collect_count + BYTES_IN_PACKET >= BYTES_IN_FRAME:                
                 recentframe[recentframe_collect_count//2:] = packet_data[:(BYTES_IN_FRAME-recentframe_collect_count)//2]
-                self._store_frame(recentframe)                
-                self.lostPackeFlagtArray[self.nextCapBufferPosition] = False
+                self.bytesCopied += BYTES_IN_FRAME - recentframe_collect_count
+                after_packet_count = (recentframe_collect_count + BYTES_IN_PACKET) % BYTES_IN_FRAME
+                # The received packet already counted its bytes of the next frame
+                self._store_frame(recentframe, after_packet_count)
                 self.recentCapNum = (byte_count + BYTES_IN_PACKET) // BYTES_IN_FRAME
                 recentframe = np.zeros(UINT16_IN_FRAME, dtype=np.int16)
-                after_packet_count = (recentframe_collect_count + BYTES_IN_PACKET) % BYTES_IN_FRAME
                 recentframe[0:after_packet_count//2] = packet_data[(BYTES_IN_PACKET-after_packet_count)//2:]
                 recentframe_collect_count = after_packet_count
+                self.bytesCopied += after_packet_count
                 lost_packets = False
             else:
                 after_packet_count = (recentframe_collect_count + BYTES_IN_PACKET) % BYTES_IN_FRAME
                 recentframe[recentframe_collect_count//2:after_packet_count//2] = packet_data
-                recentframe_collect_count = after_packet_count                
+                recentframe_collect_count = after_packet_count
+                self.bytesCopied += BYTES_IN_PACKET
             last_packet_num = packet_num
     
-    def getFrame(self):
+    def _zero_copy_receiver(self):
+        """
+        Receive frames from the ADC device directly into bufferArray.
+
+        Each packet is scattered by recvmsg_into into the header scratch buffer and the
+        slot of bufferArray its payload belongs to, so the payload is copied exactly once
+        (kernel to ring) and no per-packet or per-frame arrays are allocated. A packet
+        straddling two frames is scattered across the tail and head of both slots.
+        """
+        self.data_socket.settimeout(10)
+        header = self._headerScratch
+        last_packet_num, recentframe_collect_count = self._sync_to_frame_start()
+
+        while self.whileSign:
+            buffers = self._payload_destinations(recentframe_collect_count)
+            nbytes = self._recv_scattered(buffers)
+            packet_num, byte_count_low, byte_count_high = PACKET_HEADER.unpack_from(header)
+            self.bytesCopied += nbytes - PACKET_HEADER.size
+
+            if packet_num != last_packet_num + 1:
+                if self.lostPacketPolicy == 'exit' and packet_num > last_packet_num + 1:
+                    print('\a')
+                    print("Packet Lost! Please discard this data.")
+                    exit(0)
+                if self.lostPacketPolicy == 'zerofill':
+                    # The payload landed at the expected offset, move it to where it belongs
+                    payload = self._gather_payload(buffers[1:])
+                    recentframe_collect_count, last_packet_num = self._place_packet(
+                        recentframe_collect_count, last_packet_num, packet_num,
+                        byte_count_low | (byte_count_high << 32), payload)
+                    continue
+
+            recentframe_collect_count = self._advance(recentframe_collect_count, BYTES_IN_PACKET)
+            last_packet_num = packet_num
+
+    def _sync_to_frame_start(self):
+        """
+        Discard packets until one contains a frame boundary, and store its tail in the ring.
+
+        Returns:
+            tuple: The packet number of the boundary packet and the number of bytes of the
+                   new frame already stored.
+        """
+        # First capture -- find the beginning of a Frame
+        while self.whileSign:
+            packet_num, byte_count, payload = self._read_packet_into_scratch()
+            after_packet_count = (byte_count + BYTES_IN_PACKET) % BYTES_IN_FRAME
+
+            # The recent Frame begins at the middle of this packet
+            if after_packet_count < BYTES_IN_PACKET:
+                start = self.nextCapBufferPosition * BYTES_IN_FRAME
+                self._ringBytes[start:start + after_packet_count] = payload[BYTES_IN_PACKET - after_packet_count:]
+                self.bytesCopied += after_packet_count
+                self.recentCapNum = (byte_count + BYTES_IN_PACKET) // BYTES_IN_FRAME
+                return packet_num, after_packet_count
+        return 0, 0
+
+    def _batched_receiver(self):
+        """
+        Receive frames from the ADC device in batches with recvmmsg.
+
+        Payloads of consecutive packets are contiguous in bufferArray, so the scatter lists
+        for a whole batch are precomputed with numpy and a single recvmmsg call (which runs
+        without the GIL) receives up to batchSize packets straight into the ring. Python only
+        inspects the batch headers and publishes completed frames. A packet straddling the
+        last slot and the first slot of the ring is received on its own with recvmsg_into.
+        """
+        self.data_socket.settimeout(10)
+        last_packet_num, recentframe_collect_count = self._sync_to_frame_start()
+
+        batch = self.batchSize
+        headers = np.zeros(batch, dtype=BATCH_HEADER_DTYPE)
+        iovecs = (_IOVec * (2 * batch))()
+        messages = (_MMsgHdr * batch)()
+        iovecArray = np.frombuffer(iovecs, dtype=np.uintp).reshape(batch, 2, 2)
+        lengths = np.frombuffer(messages, dtype=np.uint32).reshape(batch, -1)[:, _MMsgHdr.msg_len.offset // 4]
+
+        # Headers land in the scratch array, payloads go to addresses filled in per batch
+        iovecArray[:, 0, 0] = headers.ctypes.data + np.arange(batch) * BATCH_HEADER_DTYPE.itemsize
+        iovecArray[:, 0, 1] = PACKET_HEADER.size
+        iovecArray[:, 1, 1] = BYTES_IN_PACKET
+        for i in range(batch):
+            messages[i].msg_hdr.msg_iov = ctypes.addressof(iovecs) + i * 2 * ctypes.sizeof(_IOVec)
+            messages[i].msg_hdr.msg_iovlen = 2
+        payloadIndex = np.arange(batch)
+        payloadOffsets = payloadIndex.astype(np.uintp) * BYTES_IN_PACKET
+        ringAddress = self.bufferArray.ctypes.data
+        fd = self.data_socket.fileno()
+
+        while self.whileSign:
+            # Contiguous room from the write position: this slot plus the next one unless it wraps
+            window = BYTES_IN_FRAME - recentframe_collect_count
+            if window < batch * BYTES_IN_PACKET and self._reserve_next_slot() == self.nextCapBufferPosition + 1:
+                window += BYTES_IN_FRAME
+            count = min(batch, window // BYTES_IN_PACKET)
+
+            if count == 0:
+                buffers = self._payload_destinations(recentframe_collect_count)
+                nbytes = self._recv_scattered(buffers)
+                headers[0] = np.frombuffer(self._headerScratch + bytes(6), dtype=BATCH_HEADER_DTYPE)[0]
+                received = 1
+                self.bytesCopied += nbytes - PACKET_HEADER.size
+            else:
+                start = self.nextCapBufferPosition * BYTES_IN_FRAME + recentframe_collect_count
+                iovecArray[:count, 1, 0] = ringAddress + start + payloadOffsets[:count]
+                received = self._recv_batch(fd, messages, count)
+                self.bytesCopied += int(lengths[:received].sum()) - received * PACKET_HEADER.size
+
+            packet_nums = headers['packet_num'][:received]
+            in_order = packet_nums == last_packet_num + 1 + payloadIndex[:received]
+            in_order_count = received if in_order.all() else int(np.argmin(in_order))
+            if in_order_count < received and self.lostPacketPolicy == 'exit':
+                if packet_nums[in_order_count] > last_packet_num + 1 + in_order_count:
+                    print('\a')
+                    print("Packet Lost! Please discard this data.")
+                    exit(0)
+                in_order_count = received
+
+            # Packets up to the first out-of-order one landed where they belong
+            if in_order_count:
+                recentframe_collect_count = self._advance(recentframe_collect_count, in_order_count * BYTES_IN_PACKET)
+                last_packet_num = int(packet_nums[in_order_count - 1])
+            if in_order_count < received:
+                # Save the misplaced payloads before the gap is zero-filled over them
+                if count == 0:
+                    payloads = [self._gather_payload(buffers[1:])]
+                else:
+                    misplaced = self._ringArray[start + in_order_count * BYTES_IN_PACKET:start + received * BYTES_IN_PACKET]
+                    payloads = misplaced.reshape(-1, BYTES_IN_PACKET).copy()
+                    self.bytesCopied += payloads.nbytes
+                byte_counts = (headers['byte_count_low'][in_order_count:received].astype(np.int64) |
+                               (headers['byte_count_high'][in_order_count:received].astype(np.int64) << 32))
+                for packet_num, byte_count, payload in zip(packet_nums[in_order_count:], byte_counts, payloads):
+                    recentframe_collect_count, last_packet_num = self._place_packet(
+                        recentframe_collect_count, last_packet_num, int(packet_num), int(byte_count), payload)
+
+
+    def _recv_batch(self, fd, messages, count):
+        """
+        Receive up to count packets with one recvmmsg call.
+
+        The data socket has a timeout and therefore a non-blocking descriptor; when no
+        packet is queued, wait for one with select and honour the same timeout.
+
+        Args:
+            fd: File descriptor of the data socket.
+            messages: ctypes array of mmsghdr with the scatter lists filled in.
+            count: Number of messages to receive at most.
+
+        Returns:
+            int: Number of packets received.
+        """
+        start = self._receive_start() if self.instrument else 0.0
+        while True:
+            received = _recvmmsg(fd, messages, count, MSG_WAITFORONE, None)
+            if received > 0:
+                if self.instrument:
+                    self._receive_end(start)
+                self._count_packet(received)
+                return received
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if err not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise OSError(err, "recvmmsg failed")
+            readable, _, _ = select.select([fd], [], [], self.data_socket.gettimeout())
+            if not readable:
+                raise socket.timeout("timed out")
+
+    def _advance(self, collect_count, nbytes):
+        """
+        Account for payload bytes already in place in the ring and publish completed frames.
+
+        Args:
+            collect_count: Number of bytes of the current frame already received.
+            nbytes: Number of bytes just received at that position.
+
+        Returns:
+            int: The new number of bytes of the current frame received.
+        """
+        collect_count += nbytes
+        while collect_count >= BYTES_IN_FRAME:
+            self._publish_frame(collect_count - BYTES_IN_FRAME)
+            self.recentCapNum += 1
+            collect_count -= BYTES_IN_FRAME
+        return collect_count
+
+    def _place_packet(self, collect_count, last_packet_num, packet_num, byte_count, payload):
+        """
+        Store an out-of-order packet at the offset given by its byte count.
+
+        A late packet fills the parts of the frame being assembled that were zero-filled in
+        its place; late packets of published frames and duplicates are dropped. A packet after
+        a gap zero-fills the missing span, publishes the recent frame if the gap runs past its end, skips frames lying
+        entirely inside the gap and resumes assembly at the packet's own frame and offset.
+
+        Args:
+            collect_count: Number of bytes of the current frame already received.
+            last_packet_num: Packet number of the last stored packet.
+            packet_num: Packet number of this packet.
+            byte_count: DCA1000 byte count of this packet.
+            payload: The packet payload, outside of the ring.
+
+        Returns:
+            tuple: The new number of bytes of the current frame received and the new last packet number.
+        """
+        expected = self.recentCapNum * BYTES_IN_FRAME + collect_count
+        if byte_count < expected:
+            payload = memoryview(payload).cast('B')
+            base = self.nextCapBufferPosition * BYTES_IN_FRAME
+            for start, stop, source in self._recover_packet(byte_count):
+                self._ringBytes[base + start:base + stop] = payload[source:source + stop - start]
+                self.bytesCopied += stop - start
+            return collect_count, last_packet_num
+        self.lostPackets += (byte_count - expected) // BYTES_IN_PACKET
+
+        frame_num, offset = divmod(byte_count, BYTES_IN_FRAME)
+        # The gap runs past the end of the recent frame
+        if frame_num > self.recentCapNum:
+            self._zero_fill(collect_count, BYTES_IN_FRAME)
+            self._publish_frame()
+            self.skippedFrames += frame_num - self.recentCapNum - 1
+            self.recentCapNum = frame_num
+            collect_count = 0
+        self._zero_fill(collect_count, offset)
+
+        # Copy the payload in, across the frame boundary if it straddles one
+        payload = memoryview(payload).cast('B')
+        copied = 0
+        for buffer in self._payload_destinations(offset)[1:]:
+            buffer[:] = payload[copied:copied + len(buffer)]
+            copied += len(buffer)
+        self.bytesCopied += copied
+        return self._advance(offset, BYTES_IN_PACKET), packet_num
+
+    def _zero_fill(self, start, stop):
+        """
+        Zero a span of the frame being assembled and mark it as lost.
+
+        Args:
+            start: First byte of the span within the frame.
+            stop: End of the span within the frame.
+        """
+        if stop <= start:
+            return
+        base = self.nextCapBufferPosition * BYTES_IN_FRAME
+        self._ringArray[base + start:base + stop] = 0
+        self._mark_lost(start, stop)
+
+    def _mark_lost(self, start, stop):
+        """
+        Mark a span of the frame being assembled as lost in the loss mask.
+
+        Args:
+            start: First byte of the span within the frame.
+            stop: End of the span within the frame.
+        """
+        if stop <= start:
+            return
+        self._lostMaskStorage[self.nextCapBufferPosition, start // BYTES_IN_PACKET:(stop - 1) // BYTES_IN_PACKET + 1] = True
+        self._gaps.append((start, stop))
+
+    def _recover_packet(self, byte_count):
+        """
+        Take a late packet back into the zero-filled spans of the frame being assembled.
+
+        The spans the packet covers are removed from the gaps and their loss mask bits are
+        cleared unless another gap still overlaps them. A packet that covers no gap belongs
+        to a frame already handed out, or is a duplicate, and is counted as late.
+
+        Args:
+            byte_count: DCA1000 byte count of the packet.
+
+        Returns:
+            list: (start, stop, source) tuples: bytes start:stop of the frame are to be copied
+                  from bytes source:source + stop - start of the payload.
+        """
+        first = byte_count - self.recentCapNum * BYTES_IN_FRAME
+        last = first + BYTES_IN_PACKET
+        recovered = []
+        gaps = []
+        for start, stop in self._gaps:
+            low, high = max(start, first), min(stop, last)
+            if low >= high:
+                gaps.append((start, stop))
+                continue
+            recovered.append((low, high, low - first))
+            if start < low:
+                gaps.append((start, low))
+            if high < stop:
+                gaps.append((high, stop))
+        if not recovered:
+            self.latePackets += 1
+            return recovered
+
+        self._gaps = gaps
+        self.lostPackets -= 1
+        mask = self._lostMaskStorage[self.nextCapBufferPosition]
+        lowSpan = max(first, 0) // BYTES_IN_PACKET
+        highSpan = (min(last, BYTES_IN_FRAME) - 1) // BYTES_IN_PACKET + 1
+        mask[lowSpan:highSpan] = False
+        for start, stop in gaps:
+            mask[max(start // BYTES_IN_PACKET, lowSpan):min((stop - 1) // BYTES_IN_PACKET + 1, highSpan)] = True
+        return recovered
+
+    def _gather_payload(self, buffers):
+        """
+        Copy a payload scattered over ring buffers into the packet scratch buffer.
+
+        Args:
+            buffers: The payload destinations the packet was received into.
+
+        Returns:
+            memoryview: The payload, in the packet scratch buffer.
+        """
+        copied = 0
+        for buffer in buffers:
+            self._packetScratch[copied:copied + len(buffer)] = buffer
+            copied += len(buffer)
+        self.bytesCopied += copied
+        return memoryview(self._packetScratch)[:copied]
+
+    def _payload_destinations(self, collect_count):
+        """
+        Build the scatter list for the next in-order packet.
+
+        Args:
+            collect_count: Number of bytes of the current frame already received.
+
+        Returns:
+            list: The header scratch buffer followed by one or two memoryviews into bufferArray.
+        """
+        start = self.nextCapBufferPosition * BYTES_IN_FRAME + collect_count
+        remaining = BYTES_IN_FRAME - collect_count
+        if remaining >= BYTES_IN_PACKET:
+            return [self._headerScratch, self._ringBytes[start:start + BYTES_IN_PACKET]]
+        # The packet straddles the end of this slot and the start of the next one
+        next_start = self._reserve_next_slot() * BYTES_IN_FRAME
+        return [self._headerScratch, self._ringBytes[start:start + remaining],
+                self._ringBytes[next_start:next_start + BYTES_IN_PACKET - remaining]]
+
+    def _recv_scattered(self, buffers):
+        """
+        Receive one datagram into a list of buffers.
+
+        Falls back to a single recv_into plus one copy on platforms without recvmsg_into.
+
+        Args:
+            buffers: Header scratch buffer followed by the payload destinations.
+
+        Returns:
+            int: Number of bytes received, including the header.
+        """
+        start = self._receive_start() if self.instrument else 0.0
+        if hasattr(self.data_socket, 'recvmsg_into'):
+            nbytes = self.data_socket.recvmsg_into(buffers)[0]
+        else:
+            nbytes = self.data_socket.recv_into(self._packetScratch)
+            packet = memoryview(self._packetScratch)
+            offset = 0
+            for buffer in buffers:
+                buffer[:] = packet[offset:offset + len(buffer)]
+                offset += len(buffer)
+            self.bytesCopied += nbytes - PACKET_HEADER.size
+        if self.instrument:
+            self._receive_end(start)
+        self._count_packet()
+        return nbytes
+
+    def _read_packet_into_scratch(self):
+        """
+        Read a data packet into the reusable packet scratch buffer.
+
+        Returns:
+            tuple: A tuple containing the packet number, byte count, and a memoryview of the payload.
+        """
+        start = self._receive_start() if self.instrument else 0.0
+        nbytes = self.data_socket.recv_into(self._packetScratch)
+        if self.instrument:
+            self._receive_end(start)
+        self._count_packet()
+        packet_num, byte_count_low, byte_count_high = PACKET_HEADER.unpack_from(self._packetScratch)
+        payload = memoryview(self._packetScratch)[PACKET_HEADER.size:nbytes]
+        return packet_num, byte_count_low | (byte_count_high << 32), payload
+
+    def getFrame(self, timeout=0):
         """
         Get the next frame from the buffer.
 
+        The returned frame is a view into bufferArray. Its slot stays reserved for the
+        consumer until the next getFrame/getFrames/releaseFrames call, so the producer
+        never overwrites a frame while it is being used.
+
+        Args:
+            timeout: Seconds to wait for a new frame; 0 returns immediately and None waits
+                     until a frame arrives or the thread is stopped.
+
         Returns:
             tuple: A tuple containing the frame data, frame number, and lost packet flag.
-                   - If the buffer is overwritten, returns ("bufferOverWritten", -1, False).
+                   - If frames were dropped since the last call, returns ("bufferOverWritten", -1, False) once.
                    - If waiting for a new frame, returns ("wait new frame", -2, False).
         """
-        if self.latestReadNum != 0:
-            if self.bufferOverWritten:
-                return "bufferOverWritten", -1, False
-        else: 
-            self.bufferOverWritten = False
-        nextReadPosition = (self.nextReadBufferPosition + 1) % self.bufferSize 
-        if self.nextReadBufferPosition == self.nextCapBufferPosition:
+        self.releaseFrames()
+        if self._dropSeq > self._readSeq:
+            self._readSeq = self._dropSeq
+            return "bufferOverWritten", -1, False
+        frames, itemNums, lostFlags, _ = self.getFrames(1, timeout)
+        if len(frames) == 0:
             return "wait new frame", -2, False
-        else:
-            readframe = self.bufferArray[self.nextReadBufferPosition]
-            self.latestReadNum = self.itemNumArray[self.nextReadBufferPosition]            
-            lostPacketFlag = self.lostPackeFlagtArray[self.nextReadBufferPosition]
-            self.nextReadBufferPosition = nextReadPosition
-        return readframe, self.latestReadNum, lostPacketFlag
-    
-    def _store_frame(self, recentframe):
+        return frames[0], itemNums[0], lostFlags[0]
+
+    def getFrames(self, max_n, timeout=0):
+        """
+        Get a contiguous batch of the next frames from the buffer.
+
+        The batch never wraps around the end of the ring, so it may hold fewer than max_n
+        frames even when more are available. The views stay valid until the next
+        getFrame/getFrames/releaseFrames call.
+
+        Args:
+            max_n: Maximum number of frames to return.
+            timeout: Seconds to wait for at least one frame; 0 returns immediately and None
+                     waits until a frame arrives or the thread is stopped.
+
+        Returns:
+            tuple: Frames as an (n, UINT16_IN_FRAME) int16 view, their frame numbers, their
+                   lost packet flags and their completion timestamps. n is 0 if no frame
+                   arrived in time.
+        """
+        self.releaseFrames()
+        if self._writeSeq <= max(self._readSeq, self._dropSeq) and timeout != 0:
+            start = time.perf_counter()
+            with self._ringCondition:
+                self._ringCondition.wait_for(
+                    lambda: self._writeSeq > max(self._readSeq, self._dropSeq) or not self.whileSign, timeout)
+            self.ringWaitLatency.record(time.perf_counter() - start)
+
+        # Claim the frames first, then read _dropSeq: the producer publishes _dropSeq before
+        # checking the claim, so a slot is either skipped here or left alone by the producer
+        end = self._writeSeq
+        self._leaseSeq = end
+        start = max(self._readSeq, self._dropSeq)
+        self._readSeq = start
+
+        first = start % self.bufferSize
+        n = max(0, min(max_n, end - start, self.bufferSize - first))
+        self._leaseSeq = start + n
+        self.nextReadBufferPosition = (first + n) % self.bufferSize
+        if n:
+            self.latestReadNum = self.itemNumArray[first + n - 1]
+        return (self.bufferArray[first:first + n], self.itemNumArray[first:first + n],
+                self.lostPackeFlagtArray[first:first + n], self.timestampArray[first:first + n])
+
+    def releaseFrames(self):
+        """
+        Give the frames returned by the last getFrame/getFrames call back to the producer.
+        """
+        if self._leaseSeq > self._readSeq:
+            self._readSeq = self._leaseSeq
+            if self.overflowPolicy == 'block':
+                with self._ringCondition:
+                    self._ringCondition.notify_all()
+
+    def stop(self):
+        """
+        Stop capturing and wake up a consumer waiting in getFrame/getFrames.
+        """
+        self.whileSign = False
+        with self._ringCondition:
+            self._ringCondition.notify_all()
+
+    def _store_frame(self, recentframe, pendingBytes=0):
         """
         Store the recent frame in the buffer.
 
         Args:
             recentframe: The recent frame data.
+            pendingBytes (int): Bytes already counted in bytesCopied that belong to the next frames.
+        """
+        self._frameStorage[self.nextCapBufferPosition] = recentframe                    
+        self.bytesCopied += BYTES_IN_FRAME
+        self._publish_frame(pendingBytes)
+
+    def _publish_frame(self, pendingBytes=0):
         """
-        self.bufferArray[self.nextCapBufferPosition] = recentframe                    
-        self.itemNumArray[self.nextCapBufferPosition] = self.recentCapNum
-        if (self.nextReadBufferPosition - 1 + self.bufferSize) % self.bufferSize == self.nextCapBufferPosition:
-            self.bufferOverWritten = True
-        self.nextCapBufferPosition += 1
-        self.nextCapBufferPosition %= self.bufferSize
+        Hand the frame at nextCapBufferPosition to the consumer and move to the next slot.
+
+        A frame assembled in the scratch slot was dropped on overflow and is not published.
+
+        Args:
+            pendingBytes (int): Bytes already counted in bytesCopied that belong to the next frames.
+        """
+        self._completedBytesCopied = self.bytesCopied - pendingBytes
+        slot = self.nextCapBufferPosition
+        if slot == self._scratchSlot:
+            self.droppedFrames += 1
+        else:
+            self.itemNumArray[slot] = self.recentCapNum
+            self.timestampArray[slot] = self.clock()
+            lost_count = np.count_nonzero(self.lostPacketMaskArray[slot])
+            self.lostPacketCountArray[slot] = lost_count
+            self.lostPackeFlagtArray[slot] = lost_count > 0
+            self.lostFrames += int(lost_count > 0)
+            self.framesCaptured += 1
+            if self.instrument and self._lastReceiveEnd is not None:
+                now = time.perf_counter()
+                self.assemblyLatency.record(self._assemblySeconds + now - self._lastReceiveEnd)
+                self._assemblySeconds = 0.0
+                self._lastReceiveEnd = now
+            self._writeSeq += 1
+            with self._ringCondition:
+                self._ringCondition.notify_all()
+
+        if self._nextSlot is None:
+            self._nextSlot = self._reserve_slot(self._writeSeq)
+        self.nextCapBufferPosition = self._nextSlot
+        self._nextSlot = None
+        self._lostMaskStorage[self.nextCapBufferPosition] = False
+        self._gaps = []
+
+    def _reserve_next_slot(self):
+        """
+        Reserve the slot the frame after the one being assembled will be written to.
+
+        Returns:
+            int: Index of the reserved slot, or of the scratch slot if the new frame is dropped.
+        """
+        if self._nextSlot is None:
+            # A frame assembled in the scratch slot will not take up a sequence number
+            seq = self._writeSeq + (self.nextCapBufferPosition != self._scratchSlot)
+            self._nextSlot = self._reserve_slot(seq)
+        return self._nextSlot
+
+    def _reserve_slot(self, seq):
+        """
+        Make the slot for frame sequence number seq available to the producer.
+
+        Args:
+            seq: Sequence number of the frame to be written.
+
+        Returns:
+            int: Index of the slot, or of the scratch slot if the frame has to be dropped.
+        """
+        previous = seq - self.bufferSize
+        if previous < self._readSeq:
+            return seq % self.bufferSize
+
+        if self.overflowPolicy == 'block':
+            start = time.perf_counter()
+            with self._ringCondition:
+                while previous >= self._readSeq and self.whileSign:
+                    self._ringCondition.wait(0.1)
+            self.overflowWaitLatency.record(time.perf_counter() - start)
+            return seq % self.bufferSize
+
+        # drop_oldest: publish the drop first, then check the consumer has not claimed the frame
+        self._dropSeq = max(self._dropSeq, previous + 1)
+        if self._leaseSeq <= previous:
+            self.droppedFrames += 1
+            return seq % self.bufferSize
+        return self._scratchSlot
 
     def _read_data_packet(self):
         """
@@ -196,9 +970,47 @@ class adcCapThread(threading.Thread):
         Returns:
             tuple: A tuple containing the packet number, byte count, and packet data.
         """
+        start = self._receive_start() if self.instrument else 0.0
         data, addr = self.data_socket.recvfrom(MAX_PACKET_SIZE)
+        if self.instrument:
+            self._receive_end(start)
+        self._count_packet()
         packet_num = struct.unpack('<1l', data[:4])[0]
 
         byte_count = struct.unpack('>Q', b'\x00\x00' + data[4:10][::-1])[0]
         packet_data = np.frombuffer(data[10:], dtype=np.uint16)
-        return packet_num, byte_count, packet_data
\ No newline at end of file
+        self.bytesCopied += len(data) - PACKET_HEADER.size
+        return packet_num, byte_count, packet_data
+
+    def _count_packet(self, count=1):
+        """
+        Update the packet counter, starting the rate clock on the first packet.
+
+        Args:
+            count: Number of packets received.
+        """
+        if self._firstPacketTime is None:
+            self._firstPacketTime = time.perf_counter()
+        self.packetsReceived += count
+
+    def _receive_start(self):
+        """
+        Account the receiver work since the last receive call to the frame being assembled.
+
+        Returns:
+            float: perf_counter() value at the start of the receive call.
+        """
+        now = time.perf_counter()
+        if self._lastReceiveEnd is not None:
+            self._assemblySeconds += now - self._lastReceiveEnd
+        return now
+
+    def _receive_end(self, start):
+        """
+        Record the duration of a receive call started at start.
+
+        Args:
+            start: Value returned by _receive_start().
+        """
+        self._lastReceiveEnd = time.perf_counter()
+        self.receiveLatency.record(self._lastReceiveEnd - start)
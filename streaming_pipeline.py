@@ -0,0 +1,339 @@
+import queue
+import sys
+import threading
+import time
+import numpy as np
+from plotData import FrameConfig, bin2np_frames
+from processing import RangeDopplerProcessor
+from telemetry import LatencyHistogram
+
+STALE_POLICIES = ('skip_stale', 'process_all')
+PIPELINE_STAGES = ('convert', 'range', 'clutter', 'doppler', 'publish')
+"""
+- STALE_POLICIES: What StreamingPipeline does with frames older than maxLatency.
+- PIPELINE_STAGES: Names of the timed stages, in processing order.
+"""
+
+
+class Subscription:
+    """
+    Bounded queue of pipeline results for one subscriber.
+
+    The pipeline never waits for a subscriber: when the queue is full, the oldest result
+    is discarded to make room for the new one.
+    """
+    def __init__(self, pipeline, maxsize):
+        """
+        Initialize the Subscription.
+
+        Args:
+            pipeline (StreamingPipeline): The pipeline publishing to this subscription.
+            maxsize (int): Maximum number of results waiting in the queue.
+        """
+        self.pipeline = pipeline
+        self.droppedResults = 0
+        self._queue = queue.Queue(maxsize)
+
+    def get(self, timeout=None):
+        """
+        Get the next result.
+
+        Args:
+            timeout (float): Seconds to wait, or None to wait until a result arrives.
+
+        Returns:
+            dict: The result, see StreamingPipeline, or None if none arrived in time.
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self):
+        """
+        Iterate over the results until the pipeline has stopped and the queue is empty.
+        """
+        while True:
+            result = self.get(timeout=0.5)
+            if result is not None:
+                yield result
+            elif not self.pipeline.is_alive():
+                return
+
+    def _offer(self, result):
+        """
+        Queue a result, discarding the oldest one if the queue is full.
+        """
+        while True:
+            try:
+                self._queue.put_nowait(result)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.droppedResults += 1
+                except queue.Empty:
+                    pass
+
+
+class StreamingPipeline(threading.Thread):
+    """
+    A thread class computing range-Doppler products live from the frames of an adcCapThread.
+
+    The pipeline is the consumer of the capture ring. Each batch is converted straight out
+    of the ring and released right away, so the receiver only waits for the conversion.
+    The batch then goes through the range FFT, clutter removal and Doppler FFT in buffers
+    allocated once. Every frame is published to all subscribers.
+
+    With the 'skip_stale' policy, frames completed more than maxLatency seconds ago are
+    released without being processed. When the DSP falls behind, the output then jumps
+    to the newest frames and does not lag further and further behind the radar.
+    """
+    def __init__(self, capThread, frameConfig=None, maxBatch=4, maxLatency=0.5, stalePolicy='skip_stale',
+                 rangeBins=None, backend=None, workers=None, clutterRemoval=True):
+        """
+        Initialize the StreamingPipeline.
+
+        Args:
+            capThread: The adcCapThread to consume frames from.
+            frameConfig (FrameConfig): Frame geometry of the captured frames (default: FrameConfig()).
+            maxBatch (int): Maximum number of frames processed at once.
+            maxLatency (float): Age in seconds after which a frame is stale.
+            stalePolicy (str): One of STALE_POLICIES.
+            rangeBins (tuple): (start, stop) range bins to keep, see RangeDopplerProcessor.
+            backend (str): FFT backend, see RangeDopplerProcessor.
+            workers (int): FFT threads, see RangeDopplerProcessor.
+            clutterRemoval (bool or ClutterFilter): Clutter removal, see RangeDopplerProcessor; a
+                                                    ClutterFilter keeps its background across batches.
+        """
+        if stalePolicy not in STALE_POLICIES:
+            raise ValueError(f"stalePolicy must be one of {STALE_POLICIES}, got {stalePolicy!r}")
+        frameConfig = frameConfig if frameConfig is not None else FrameConfig()
+        if frameConfig.frameSize * 2 != capThread.bufferArray.shape[1]:
+            raise ValueError(f"frameConfig describes frames of {frameConfig.frameSize * 4} bytes but the "
+                             f"capture thread receives frames of {capThread.bufferArray.shape[1] * 2} bytes")
+        threading.Thread.__init__(self)
+        self.whileSign = True
+        self.capThread = capThread
+        self.maxBatch = maxBatch
+        self.maxLatency = maxLatency
+        self.stalePolicy = stalePolicy
+
+        self.processor = RangeDopplerProcessor(frameConfig, maxBatch=maxBatch, rangeBins=rangeBins,
+                                               backend=backend, workers=workers, clutterRemoval=clutterRemoval)
+        self._frames = np.empty((maxBatch, frameConfig.frameSize), dtype=np.complex64)
+        self._scratch = np.empty((2, maxBatch, frameConfig.frameSize // 2), dtype=np.uint64)
+
+        self._subscriptions = []
+        self._subscriptionLock = threading.Lock()
+
+        # Counters and histograms, see getStats()
+        self.framesProcessed = 0
+        self.staleFrames = 0
+        self.stageLatency = {stage: LatencyHistogram() for stage in PIPELINE_STAGES}
+        self.frameLatency = LatencyHistogram()
+
+    def subscribe(self, maxsize=8):
+        """
+        Register a new subscriber.
+
+        Args:
+            maxsize (int): Maximum number of results waiting for this subscriber.
+
+        Returns:
+            Subscription: Queue of results, each a dict with the following keys.
+                          - 'frame': Frame number.
+                          - 'timestamp': Time at which the capture thread completed the frame.
+                          - 'lost': Lost packet flag of the frame.
+                          - 'rangeDoppler', 'rangeChirp', 'rangeProfile': Read-only products of
+                            the frame, see RangeDopplerProcessor.process.
+        """
+        subscription = Subscription(self, maxsize)
+        with self._subscriptionLock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Stop publishing to a subscriber.
+
+        Args:
+            subscription (Subscription): Value returned by subscribe().
+        """
+        with self._subscriptionLock:
+            self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def run(self):
+        """
+        Run the thread.
+        """
+        capThread = self.capThread
+        while True:
+            timeout = 0.5 if self.whileSign else 0
+            frames, itemNums, lostFlags, timestamps = capThread.getFrames(self.maxBatch, timeout)
+            n = len(frames)
+            if n == 0:
+                # Once stopped, drain the ring before returning
+                if not self.whileSign:
+                    break
+                continue
+
+            first = 0
+            if self.stalePolicy == 'skip_stale':
+                # Timestamps increase along the ring, so the stale frames come first
+                first = int(np.searchsorted(timestamps, self.capThread.clock() - self.maxLatency))
+                self.staleFrames += first
+                if first == n:
+                    continue
+            n -= first
+            itemNums = itemNums[first:].copy()
+            lostFlags = lostFlags[first:].copy()
+            timestamps = timestamps[first:].copy()
+
+            start = time.perf_counter()
+            bin2np_frames(frames[first:], out=self._frames[:n], scratch=self._scratch[:, :n])
+            capThread.releaseFrames()
+            self._process(n, itemNums, lostFlags, timestamps, start)
+
+    def _process(self, n, itemNums, lostFlags, timestamps, start):
+        """
+        Run the DSP stages on the converted batch and publish the results.
+
+        Args:
+            n (int): Number of frames in the batch.
+            itemNums: Frame numbers.
+            lostFlags: Lost packet flags.
+            timestamps: Frame completion timestamps.
+            start (float): perf_counter() value at which the conversion started.
+        """
+        processor = self.processor
+        times = [start, time.perf_counter()]
+        processor.rangeStage(self._frames[:n])
+        times.append(time.perf_counter())
+        processor.clutterStage(n)
+        times.append(time.perf_counter())
+        processor.dopplerStage(n)
+        times.append(time.perf_counter())
+
+        products = {name: value.copy() for name, value in processor.results(n).items()}
+        for value in products.values():
+            value.flags.writeable = False
+        subscriptions = self._subscriptions
+        for i in range(n):
+            result = {'frame': int(itemNums[i]),
+                      'timestamp': float(timestamps[i]),
+                      'lost': bool(lostFlags[i])}
+            for name, value in products.items():
+                result[name] = value[i]
+            for subscription in subscriptions:
+                subscription._offer(result)
+        times.append(time.perf_counter())
+
+        for stage, begin, end in zip(PIPELINE_STAGES, times, times[1:]):
+            self.stageLatency[stage].record(end - begin)
+        now = self.capThread.clock()
+        for timestamp in timestamps:
+            self.frameLatency.record(now - timestamp)
+        self.framesProcessed += n
+
+    def stop(self):
+        """
+        Stop the pipeline once the frames already in the ring are processed.
+        """
+        self.whileSign = False
+
+    def getStats(self):
+        """
+        Get the pipeline counters.
+
+        Returns:
+            dict: Counters with the following keys.
+                  - 'frames': Number of frames processed and published.
+                  - 'stale_frames': Number of frames skipped because they were older than maxLatency.
+                  - 'dropped_results': Number of results discarded because a subscriber fell behind.
+                  - 'stage_latency': Per-batch latency summary of each of PIPELINE_STAGES.
+                  - 'frame_latency': Latency summary from frame completion to publication.
+        """
+        return {'frames': self.framesProcessed,
+                'stale_frames': self.staleFrames,
+                'dropped_results': sum(s.droppedResults for s in self._subscriptions),
+                'stage_latency': {stage: h.snapshot() for stage, h in self.stageLatency.items()},
+                'frame_latency': self.frameLatency.snapshot()}
+
+    def getTelemetry(self):
+        """
+        Get the counters and latency histograms of the pipeline, see telemetry.Telemetry.
+
+        Returns:
+            dict: 'counters' (frames, stale frames and dropped results of getStats()) and
+                  'histograms' (one per PIPELINE_STAGES entry, per batch, and 'frame_latency'
+                  from frame completion to publication).
+        """
+        stats = self.getStats()
+        histograms = dict(self.stageLatency)
+        histograms['frame_latency'] = self.frameLatency
+        return {'counters': {'frames_processed': stats['frames'],
+                             'stale_frames': stats['stale_frames'],
+                             'dropped_results': stats['dropped_results']},
+                'histograms': histograms}
+
+
+def main():
+    # Usage: python streaming_pipeline.py [filename.bin|-] [packets_per_sec] [telemetry.jsonl|telemetry.prom|udp://host:port]
+    # With a .bin capture or .mmw segment, it is replayed over loopback instead of listening to the DCA1000.
+    from steaming import adcCapThread
+    from dca1000_emulator import replay
+    from telemetry import Telemetry, TelemetryExporter
+
+    bin_filename = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != '-' else None
+    packets_per_sec = float(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    telemetry_destination = sys.argv[3] if len(sys.argv) > 3 else None
+
+    instrument = telemetry_destination is not None
+    if bin_filename is None:
+        capThread = adcCapThread(1, "adc", instrument=instrument)
+    else:
+        capThread = adcCapThread(1, "adc", static_ip='127.0.0.1', instrument=instrument)
+    pipeline = StreamingPipeline(capThread)
+    subscription = pipeline.subscribe()
+    exporter = None
+    if telemetry_destination is not None:
+        telemetry = Telemetry()
+        telemetry.register('capture', capThread)
+        telemetry.register('pipeline', pipeline)
+        exporter = TelemetryExporter(telemetry, telemetry_destination,
+                                     format='prometheus' if telemetry_destination.endswith('.prom') else 'json')
+        exporter.start()
+    capThread.start()
+    pipeline.start()
+
+    if bin_filename is not None:
+        # Frames are read from the capture a few at a time as they are sent
+        replayer = threading.Thread(target=replay, args=(bin_filename, '127.0.0.1', capThread.data_recv[1]),
+                                    kwargs={'packets_per_sec': packets_per_sec}, daemon=True)
+        replayer.start()
+
+    try:
+        lastReport = time.monotonic()
+        for result in subscription:
+            if time.monotonic() - lastReport >= 1.0:
+                lastReport = time.monotonic()
+                latency = pipeline.getStats()['frame_latency']
+                print(f"frame {result['frame']}: peak range bin {int(np.argmax(result['rangeProfile']))}, "
+                      f"latency p50 {latency['p50'] * 1e3:.1f} ms, p99 {latency['p99'] * 1e3:.1f} ms")
+            if bin_filename is not None and not replayer.is_alive() and capThread.getStats()['ring_occupancy'] == 0:
+                break
+    except KeyboardInterrupt:
+        pass
+    capThread.stop()
+    pipeline.stop()
+    pipeline.join()
+    if exporter is not None:
+        exporter.stop()
+        exporter.join()
+    print(capThread.getStats())
+    print(pipeline.getStats())
+
+
+if __name__ == "__main__":
+    main()
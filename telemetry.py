@@ -0,0 +1,317 @@
+import bisect
+import json
+import os
+import socket
+import threading
+import time
+import numpy as np
+
+# Latency bucket upper edges in seconds: 1 us to 10 s, 10 buckets per decade
+LATENCY_BUCKETS = tuple(np.logspace(-6, 1, 71))
+TELEMETRY_FORMATS = ('json', 'prometheus')
+METRIC_PREFIX = 'mmwave'
+"""
+- LATENCY_BUCKETS: Bucket upper edges of LatencyHistogram.
+- TELEMETRY_FORMATS: Output formats of TelemetryExporter.
+  - 'json': one JSON snapshot per line.
+  - 'prometheus': Prometheus text exposition format, one metric per line.
+- METRIC_PREFIX: Prefix of the Prometheus metric names.
+"""
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of latencies in seconds.
+
+    Recording is a binary search over the bucket edges and an integer increment, cheap
+    enough to be done for every frame. Percentiles are resolved to the upper edge of the
+    bucket they fall in.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Initialize the LatencyHistogram.
+
+        Args:
+            buckets (tuple): Increasing bucket upper edges in seconds; larger values are
+                             counted in an extra overflow bucket.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """
+        Add one latency.
+
+        Args:
+            seconds (float): Latency in seconds.
+        """
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """
+        Get a latency percentile.
+
+        Args:
+            p (float): Percentile between 0 and 100.
+
+        Returns:
+            float: Upper edge of the bucket holding the percentile (the maximum for the
+                   overflow bucket), or 0.0 if nothing was recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(np.ceil(p / 100 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self):
+        """
+        Summarize the histogram.
+
+        Returns:
+            dict: Count, mean, max, p50, p90 and p99 in seconds.
+        """
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+    def reset(self):
+        """
+        Forget all recorded latencies.
+        """
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+def udp_socket_stats(sock):
+    """
+    Get the kernel receive queue of a UDP socket, from /proc/net/udp (Linux only).
+
+    The queue shows how close the socket receive buffer (SO_RCVBUF) is to overflowing,
+    and the drop count how many datagrams were discarded because it did.
+
+    Args:
+        sock (socket.socket): The socket.
+
+    Returns:
+        dict: 'rx_queue_bytes' and 'drops', or None if they are not available.
+    """
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+        for path in ('/proc/net/udp', '/proc/net/udp6'):
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if fields[9] == inode:
+                        return {'rx_queue_bytes': int(fields[4].split(':')[1], 16), 'drops': int(fields[-1])}
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class Telemetry:
+    """
+    Registry of the counters, gauges and latency histograms of the capture and processing threads.
+
+    Components keep their own counters and LatencyHistograms and expose them with a
+    getTelemetry() method; the registry only reads them when a snapshot is taken, so
+    nothing is added to the packet or frame paths.
+    """
+    def __init__(self):
+        """
+        Initialize an empty Telemetry registry.
+        """
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, source):
+        """
+        Add a component.
+
+        Args:
+            name (str): Name of the component in the snapshots, e.g. 'capture'.
+            source: Object with a getTelemetry() method returning a dict with optional
+                    'counters' (monotonic totals), 'gauges' (current values) and
+                    'histograms' (LatencyHistogram by name) entries.
+        """
+        with self._lock:
+            self._sources = dict(self._sources, **{name: source})
+
+    def unregister(self, name):
+        """
+        Remove a component.
+
+        Args:
+            name (str): Name given to register().
+        """
+        with self._lock:
+            self._sources = {key: value for key, value in self._sources.items() if key != name}
+
+    def snapshot(self):
+        """
+        Read every registered component.
+
+        Returns:
+            dict: 'time' (time.time()) and, per component name, its 'counters', 'gauges' and
+                  'histograms' (LatencyHistogram.snapshot() summaries in seconds).
+        """
+        snapshot = {'time': time.time(), 'sources': {}}
+        for name, source in self._sources.items():
+            values = source.getTelemetry()
+            snapshot['sources'][name] = {
+                'counters': dict(values.get('counters', {})),
+                'gauges': {key: value for key, value in values.get('gauges', {}).items() if value is not None},
+                'histograms': {key: h.snapshot() for key, h in values.get('histograms', {}).items()}}
+        return snapshot
+
+
+def to_prometheus(snapshot, prefix=METRIC_PREFIX):
+    """
+    Format a snapshot in the Prometheus text exposition format.
+
+    Counters become <prefix>_<name>_total, gauges <prefix>_<name> and histograms summaries
+    <prefix>_<name>_seconds with 0.5, 0.9 and 0.99 quantiles, all labelled with the
+    component name.
+
+    Args:
+        snapshot (dict): Value returned by Telemetry.snapshot().
+        prefix (str): Metric name prefix.
+
+    Returns:
+        str: The metrics, one per line.
+    """
+    # (name, type) -> [(suffix, labels, value)], so every metric is written under one TYPE line
+    metrics = {}
+    for source, values in snapshot['sources'].items():
+        label = f'source="{source}"'
+        for name, value in values['counters'].items():
+            metrics.setdefault((f"{prefix}_{name}_total", 'counter'), []).append(('', label, value))
+        for name, value in values['gauges'].items():
+            metrics.setdefault((f"{prefix}_{name}", 'gauge'), []).append(('', label, value))
+        for name, summary in values['histograms'].items():
+            lines = metrics.setdefault((f"{prefix}_{name}_seconds", 'summary'), [])
+            for quantile in (50, 90, 99):
+                lines.append(('', f'{label},quantile="{quantile / 100}"', summary[f'p{quantile}']))
+            lines.append(('_sum', label, summary['mean'] * summary['count']))
+            lines.append(('_count', label, summary['count']))
+    output = []
+    for (name, kind), lines in metrics.items():
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(f"{name}{suffix}{{{labels}}} {value:.9g}" for suffix, labels, value in lines)
+    return "\n".join(output) + "\n"
+
+
+class TelemetryExporter(threading.Thread):
+    """
+    A thread class dumping Telemetry snapshots periodically to a file or socket.
+
+    A file receives one JSON snapshot per line, or is atomically replaced by the latest
+    Prometheus text (as read by the node_exporter textfile collector). 'udp://host:port'
+    sends every dump as one datagram and 'tcp://host:port' over a connection that is
+    reopened when it fails. Failed dumps are counted, never raised.
+    """
+    def __init__(self, telemetry, destination, interval=1.0, format='json'):
+        """
+        Initialize the TelemetryExporter.
+
+        Args:
+            telemetry (Telemetry): The registry to dump.
+            destination (str): File path, 'udp://host:port' or 'tcp://host:port'.
+            interval (float): Seconds between dumps.
+            format (str): One of TELEMETRY_FORMATS.
+        """
+        if format not in TELEMETRY_FORMATS:
+            raise ValueError(f"format must be one of {TELEMETRY_FORMATS}, got {format!r}")
+        threading.Thread.__init__(self, daemon=True)
+        self.whileSign = True
+        self.telemetry = telemetry
+        self.destination = destination
+        self.interval = interval
+        self.format = format
+        self.dumps = 0
+        self.errors = 0
+        self._wake = threading.Event()
+        self._socket = None
+
+    def run(self):
+        """
+        Run the thread.
+        """
+        while self.whileSign:
+            self._wake.wait(self.interval)
+            self.dump()
+        if self._socket is not None:
+            self._socket.close()
+
+    def stop(self):
+        """
+        Stop the thread after a last dump.
+        """
+        self.whileSign = False
+        self._wake.set()
+
+    def getStats(self):
+        """
+        Get the exporter counters.
+
+        Returns:
+            dict: Number of dumps written and of dumps that failed.
+        """
+        return {'dumps': self.dumps, 'errors': self.errors}
+
+    def dump(self):
+        """
+        Write one snapshot to the destination.
+        """
+        snapshot = self.telemetry.snapshot()
+        text = to_prometheus(snapshot) if self.format == 'prometheus' else json.dumps(snapshot) + "\n"
+        try:
+            scheme, _, address = self.destination.partition('://')
+            if address and scheme in ('udp', 'tcp'):
+                self._send(scheme, address, text.encode())
+            elif self.format == 'prometheus':
+                temporary = self.destination + '.tmp'
+                with open(temporary, 'w') as f:
+                    f.write(text)
+                os.replace(temporary, self.destination)
+            else:
+                with open(self.destination, 'a') as f:
+                    f.write(text)
+            self.dumps += 1
+        except OSError:
+            self.errors += 1
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    def _send(self, scheme, address, data):
+        """
+        Send a dump over UDP or TCP, connecting on first use.
+        """
+        host, port = address.rsplit(':', 1)
+        if self._socket is None:
+            if scheme == 'udp':
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            else:
+                self._socket = socket.create_connection((host, int(port)), timeout=self.interval)
+        if scheme == 'udp':
+            self._socket.sendto(data, (host, int(port)))
+        else:
+            self._socket.sendall(data)
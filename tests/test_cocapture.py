@@ -0,0 +1,64 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cocapture import AudioCapture
+
+
+class InterleavedCapture(AudioCapture):
+    """
+    AudioCapture running read() inside the callback, at the moment the callback publishes
+    the block counter, i.e. after it has written everything else about the block.
+    """
+    def __init__(self, *args, **kwargs):
+        self.reads = []
+        self._blocks = 0
+        self._interleave = False
+        AudioCapture.__init__(self, *args, **kwargs)
+        self._interleave = True
+
+    @property
+    def _writeBlocks(self):
+        return self._blocks
+
+    @_writeBlocks.setter
+    def _writeBlocks(self, value):
+        if self._interleave:
+            self.reads.append(self.read(timeout=0))
+        self._blocks = value
+
+
+def test_read_interleaved_with_callback():
+    blockSize = 64
+    blocks = 50
+    capture = InterleavedCapture(sampleRate=48000, channels=2, blockSize=blockSize, bufferSeconds=1)
+    ramp = np.arange(blocks * blockSize * 2, dtype=np.float32).reshape(-1, 2)
+    for i in range(blocks):
+        capture.callback(ramp[i * blockSize:(i + 1) * blockSize], blockSize, None, None)
+        capture.reads.append(capture.read(timeout=0))
+
+    sampleChunks = []
+    for samples, records in capture.reads:
+        assert len(samples) == int(records['count'].sum())
+        if len(records):
+            np.testing.assert_array_equal(samples[0], ramp[records['sample'][0]])
+        sampleChunks.append(samples)
+    recordChunks = np.concatenate([records for _, records in capture.reads])
+    np.testing.assert_array_equal(recordChunks['sample'], np.arange(blocks) * blockSize)
+    assert capture.droppedSamples == 0
+    np.testing.assert_array_equal(np.concatenate(sampleChunks), ramp)
+
+
+def test_read_drops_overwritten_samples():
+    blockSize = 100
+    capture = AudioCapture(sampleRate=1000, channels=1, blockSize=blockSize, bufferSeconds=1)
+    ramp = np.arange(25 * blockSize, dtype=np.float32).reshape(-1, 1)
+    for i in range(25):
+        capture.callback(ramp[i * blockSize:(i + 1) * blockSize], blockSize, None, None)
+    samples, records = capture.read(timeout=0)
+    assert len(samples) == capture.capacity
+    assert capture.droppedSamples == len(ramp) - capture.capacity
+    assert records['dropped'][0] == capture.droppedSamples
+    np.testing.assert_array_equal(samples, ramp[-capture.capacity:])
@@ -0,0 +1,100 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import configuration as cfg
+from compressed_capture import (CompressedCaptureReader, CompressedCaptureWriter, decode_chunk, encode_chunk,
+                                lz4_frame, zstandard)
+from recorder import INDEX_DTYPE
+
+NUM_FRAMES = 10
+CHUNK_FRAMES = 4
+INSTALLED_CODECS = [codec for codec, module in (('zstd', zstandard), ('lz4', lz4_frame), ('zlib', True))
+                    if module is not None]
+
+
+def _frames(numFrames, length):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(-300, 300, size=(numFrames, length), dtype=np.int16)
+    # Deltas between the extremes wrap around in int16 and must still decode exactly
+    frames[0, :8] = (-32768, 32767, -32768, 32767, 32767, -32768, 32767, -32768)
+    return frames
+
+
+def _records(numFrames):
+    records = np.zeros(numFrames, dtype=INDEX_DTYPE)
+    records['frame_num'] = np.arange(1, numFrames + 1)
+    records['timestamp'] = records['frame_num'] * 0.1
+    records['lost'] = records['frame_num'] % 3 == 0
+    return records
+
+
+@pytest.mark.parametrize('codec', INSTALLED_CODECS)
+@pytest.mark.parametrize('lag', [0, 4])
+def test_chunk_round_trip(codec, lag):
+    frames = _frames(3, 4096)
+    out = np.empty_like(frames)
+    assert decode_chunk(encode_chunk(frames, codec, lag=lag), codec, out, lag=lag) is out
+    np.testing.assert_array_equal(out, frames)
+
+
+@pytest.fixture
+def capture(tmp_path):
+    frames = _frames(NUM_FRAMES, cfg.RADAR_CONFIG.uint16_in_frame)
+    records = _records(NUM_FRAMES)
+    path = str(tmp_path / 'capture.mmwz')
+    with CompressedCaptureWriter(path, cfg.RADAR_CONFIG, chunkFrames=CHUNK_FRAMES, codec='zlib') as writer:
+        # Batches that do not line up with the chunks
+        for start, stop in ((0, 3), (3, 8), (8, NUM_FRAMES)):
+            writer.write(frames[start:stop], records[start:stop])
+    return path, frames, records
+
+
+def test_capture_round_trip(capture):
+    path, frames, records = capture
+    reader = CompressedCaptureReader(path, workers=2)
+
+    assert not reader.recovered
+    assert len(reader) == NUM_FRAMES
+    assert reader.chunks['frames'].tolist() == [4, 4, 2]
+    np.testing.assert_array_equal(reader.index, records)
+    np.testing.assert_array_equal(reader[:], frames)
+    # Ranges starting and ending inside chunks, and single frames
+    np.testing.assert_array_equal(reader.read(2, 9), frames[2:9])
+    np.testing.assert_array_equal(reader[5], frames[5])
+    np.testing.assert_array_equal(reader[-1], frames[-1])
+    out = np.empty((4, frames.shape[1]), dtype=np.int16)
+    assert reader.read(4, 8, out=out) is out
+    np.testing.assert_array_equal(out, frames[4:8])
+    reader.close()
+
+
+def test_recovery_without_footer(capture):
+    path, frames, records = capture
+    reader = CompressedCaptureReader(path)
+    chunks = reader.chunks.copy()
+    reader.close()
+
+    # A crash in the middle of the last chunk: no table or footer and a partial chunk
+    lastEnd = int(chunks[-1]['offset'] + chunks[-1]['size'])
+    os.truncate(path, lastEnd - 100)
+    reader = CompressedCaptureReader(path)
+    assert reader.recovered
+    assert len(reader) == 2 * CHUNK_FRAMES
+    np.testing.assert_array_equal(reader.index, records[:2 * CHUNK_FRAMES])
+    np.testing.assert_array_equal(reader[:], frames[:2 * CHUNK_FRAMES])
+    reader.close()
+
+    # A corrupted chunk ends the recovery before it
+    with open(path, 'r+b') as f:
+        f.seek(int(chunks[1]['offset']) + 10)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    reader = CompressedCaptureReader(path)
+    assert reader.recovered and len(reader) == CHUNK_FRAMES
+    np.testing.assert_array_equal(reader[:], frames[:CHUNK_FRAMES])
+    reader.close()
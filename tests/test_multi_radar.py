@@ -0,0 +1,117 @@
+import os
+import socket
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dca1000_emulator import packetize, synthesize_frames
+from multi_radar import MultiRadarCapture, RadarDevice
+from steaming import BYTES_IN_FRAME, BYTES_IN_PACKET
+
+NUM_FRAMES = 8
+
+
+class LockstepSender:
+    """
+    Send the frames of one stream to several loopback receivers, frame by frame.
+    """
+    def __init__(self, frames, ports):
+        # A leading partial frame lets the receivers find the start of frame 1
+        self.datagrams = list(packetize(bytes(1000) + frames.tobytes(), BYTES_IN_FRAME - 1000))
+        self.ports = ports
+        self.next = dict.fromkeys(ports, 0)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, frame, port, resume=False):
+        # Frame (counted from 1) is published when the packet starting the next frame arrives;
+        # resume skips the frames before it, as after a receiver restart
+        first = self._packet_index(frame, 0) if resume else self.next[port]
+        stop = self._packet_index(frame + 1, 0) + 1
+        for i, datagram in enumerate(self.datagrams[first:stop]):
+            self.socket.sendto(datagram, ('127.0.0.1', port))
+            if i % 64 == 63:
+                time.sleep(0.002)
+        self.next[port] = stop
+
+    def close(self):
+        self.socket.close()
+
+    @staticmethod
+    def _packet_index(frame, offset):
+        return (1000 + (frame - 1) * BYTES_IN_FRAME + offset) // BYTES_IN_PACKET
+
+
+def _wait_running(capture, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(state['status'] == 'running' for state in capture.health().values()):
+            return
+        time.sleep(0.05)
+    raise TimeoutError(capture.health())
+
+
+def test_aligned_sets_missing_and_restart():
+    frames = synthesize_frames(NUM_FRAMES, [{'range': 1.0, 'velocity': 0.5}], seed=0)
+    ports = {'a': 47900, 'b': 47910}
+    devices = [RadarDevice(name, static_ip='127.0.0.1', data_port=port, config_port=port + 1)
+               for name, port in ports.items()]
+    capture = MultiRadarCapture(devices, ringFrames=8, alignTolerance=0.1, maxWait=3.0, pinCores=False,
+                                staleAfter=30.0)
+    sender = LockstepSender(frames, list(ports.values()))
+    try:
+        capture.start()
+        _wait_running(capture)
+
+        # Frames 1-3 reach both radars together, frame 4 reaches b late
+        for frame in range(1, 4):
+            for port in ports.values():
+                sender.send(frame, port)
+            time.sleep(0.3)
+        sender.send(4, ports['a'])
+        time.sleep(0.3)
+        sender.send(4, ports['b'])
+        for frame in range(1, 4):
+            frameSet = capture.getFrames(timeout=5)
+            assert frameSet['missing'] == []
+            for name in ports:
+                assert frameSet['frames'][name]['frame_num'] == frame
+                np.testing.assert_array_equal(frameSet['frames'][name]['frame'], frames[frame - 1])
+
+        # b already holds a newer frame, so the set of a's frame 4 does not wait for it
+        began = time.monotonic()
+        frameSet = capture.getFrames(timeout=5)
+        assert time.monotonic() - began < 1.0
+        assert list(frameSet['frames']) == ['a'] and frameSet['missing'] == ['b']
+        # a's ring is empty and a is running, so b's frame 4 waits maxWait for it
+        frameSet = capture.getFrames(timeout=5)
+        assert list(frameSet['frames']) == ['b'] and frameSet['missing'] == ['a']
+        assert frameSet['frames']['b']['frame_num'] == 4
+        assert capture.incompleteSets == 2
+
+        # A stopped radar is not waited for and not listed as missing
+        capture.stop('b')
+        health = capture.health()
+        assert health['b']['status'] == 'stopped' and not health['b']['alive']
+        assert health['a']['status'] == 'running' and health['a']['healthy']
+        assert health['a']['frames'] == 4 and health['a']['lost_packets'] == 0
+        sender.send(5, ports['a'])
+        frameSet = capture.getFrames(timeout=2)
+        assert list(frameSet['frames']) == ['a'] and frameSet['missing'] == []
+
+        # Restarted, b picks up the stream again and joins the sets
+        capture.start('b')
+        _wait_running(capture)
+        for frame in (6, 7):
+            sender.send(frame, ports['a'])
+            sender.send(frame, ports['b'], resume=frame == 6)
+            time.sleep(0.3)
+        for frame in (6, 7):
+            frameSet = capture.getFrames(timeout=5)
+            assert frameSet['missing'] == []
+            assert {name: entry['frame_num'] for name, entry in frameSet['frames'].items()} == {'a': frame, 'b': frame}
+        assert capture.health()['b']['healthy']
+    finally:
+        sender.close()
+        capture.close()
@@ -0,0 +1,58 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plotData import bin2np_frame, bin2np_frames
+
+FRAME_LENGTH = 4096
+
+
+def _baseline_bin2np_frame(bin_frame):
+    # The original per-frame conversion: I0 I1 Q0 Q1 groups to complex samples
+    np_frame = np.zeros(shape=(len(bin_frame) // 2), dtype=np.complex128)
+    np_frame[0::2] = bin_frame[0::4] + 1j * bin_frame[2::4]
+    np_frame[1::2] = bin_frame[1::4] + 1j * bin_frame[3::4]
+    return np_frame
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    frames = rng.integers(-32768, 32768, size=(5, FRAME_LENGTH), dtype=np.int16)
+    # The extremes of int16 must survive the conversion too
+    frames[0, :4] = (-32768, 32767, -1, 0)
+    return frames
+
+
+def test_batch_matches_baseline(frames):
+    out = np.empty((len(frames), FRAME_LENGTH // 2), dtype=np.complex64)
+    scratch = np.empty((2, len(frames), FRAME_LENGTH // 4), dtype=np.uint64)
+    # out and scratch are reused, so a second batch must not see the first
+    bin2np_frames(frames[::-1], out=out, scratch=scratch)
+    result = bin2np_frames(frames, out=out, scratch=scratch)
+
+    assert result is out
+    for frame, converted in zip(frames, result):
+        expected = _baseline_bin2np_frame(frame)
+        np.testing.assert_array_equal(converted.view(np.float32), expected.astype(np.complex64).view(np.float32))
+        # int16 values are exact in float32, so nothing was rounded
+        np.testing.assert_array_equal(converted.astype(np.complex128), expected)
+
+
+def test_single_frame_matches_baseline(frames):
+    np.testing.assert_array_equal(bin2np_frame(frames[1]), _baseline_bin2np_frame(frames[1]))
+
+
+def test_strided_input_matches_baseline(frames):
+    # Samples that are not adjacent in memory cannot be viewed as 64-bit words and take the strided copy
+    interleaved = np.zeros((len(frames), 2 * FRAME_LENGTH), dtype=np.int16)
+    interleaved[:, ::2] = frames
+    strided = interleaved[:, ::2]
+    with pytest.raises(ValueError):
+        strided.view(np.uint64)
+    result = bin2np_frames(strided)
+    for frame, converted in zip(strided, result):
+        np.testing.assert_array_equal(converted, _baseline_bin2np_frame(frame))
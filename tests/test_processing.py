@@ -0,0 +1,89 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plotData import FrameConfig
+from processing import RangeDopplerProcessor, RoiProcessor, roi_bins
+
+RANGES = (0.0, 3.0)
+VELOCITIES = (-1.0, 1.0)
+
+
+@pytest.fixture(scope='module')
+def config():
+    return FrameConfig()
+
+
+@pytest.fixture(scope='module')
+def frames(config):
+    rng = np.random.default_rng(0)
+    shape = (2, config.numLoopsPerFrame, config.numTxAntennas, config.numRxAntennas, config.numADCSamples)
+    frames = (rng.standard_normal(shape) + 1j * rng.standard_normal(shape)).astype(np.complex64)
+    # Moving targets inside and outside the window, so the kept bins are not just noise
+    loops = np.arange(config.numLoopsPerFrame)[:, None, None, None]
+    samples = np.arange(config.numADCSamples)
+    for rangeBin, dopplerBin in ((20, 5), (33.5, -12), (120, 3)):
+        frames += 50 * np.exp(2j * np.pi * (rangeBin * samples / config.numADCSamples
+                                            + dopplerBin * loops / config.numLoopsPerFrame)).astype(np.complex64)
+    return frames.reshape(2, -1)
+
+
+@pytest.fixture(scope='module')
+def full(config, frames):
+    processor = RangeDopplerProcessor(config, maxBatch=2, backend='numpy')
+    return {name: product.copy() for name, product in processor.process(frames).items()}
+
+
+def test_roi_bins(config):
+    radarConfig = config.radarConfig
+    (rangeStart, rangeStop), (dopplerStart, dopplerStop) = roi_bins(radarConfig, RANGES, VELOCITIES)
+    assert rangeStart == 0 and rangeStop == int(RANGES[1] // radarConfig.range_resolution) + 1
+    assert dopplerStart * radarConfig.doppler_resolution >= VELOCITIES[0]
+    assert (dopplerStart - 1) * radarConfig.doppler_resolution < VELOCITIES[0]
+    assert (dopplerStop - 1) * radarConfig.doppler_resolution <= VELOCITIES[1]
+    assert dopplerStop * radarConfig.doppler_resolution > VELOCITIES[1]
+    numLoops = radarConfig.loops_per_frame
+    assert roi_bins(radarConfig) == ((0, radarConfig.adc_samples), (-(numLoops // 2), numLoops - numLoops // 2))
+    with pytest.raises(ValueError):
+        roi_bins(radarConfig, ranges=(1.0, 1.01), velocities=(0.01, 0.02))
+
+
+@pytest.mark.parametrize('velocities', [VELOCITIES, None])
+def test_roi_matches_cropped_full_processing(config, frames, full, velocities):
+    processor = RoiProcessor(config, ranges=RANGES, velocities=velocities, maxBatch=2, backend='numpy')
+    roi = processor.process(frames)
+    (rangeStart, rangeStop), (dopplerStart, dopplerStop) = roi_bins(config.radarConfig, RANGES, velocities)
+    rangeCrop = slice(rangeStart, rangeStop)
+    # Full processing has the zero-velocity row in the centre
+    centre = config.numLoopsPerFrame // 2
+    dopplerCrop = slice(centre + dopplerStart, centre + dopplerStop)
+
+    rangeResolution = config.radarConfig.range_resolution
+    np.testing.assert_allclose(processor.rangeAxis, np.arange(rangeStart, rangeStop) * rangeResolution)
+    assert len(processor.velocityAxis) == roi['rangeDoppler'].shape[1]
+    np.testing.assert_allclose(roi['rangeProfile'], full['rangeProfile'][:, rangeCrop], rtol=1e-5)
+    np.testing.assert_allclose(roi['rangeChirp'], full['rangeChirp'][:, :, rangeCrop], rtol=1e-5)
+    np.testing.assert_allclose(roi['rangeDoppler'], full['rangeDoppler'][:, dopplerCrop, rangeCrop],
+                               rtol=1e-3, atol=1e-3 * full['rangeDoppler'].max())
+
+
+def test_zoom_interpolates_cropped_full_processing(config, frames, full):
+    zoom = 4
+    processor = RoiProcessor(config, ranges=RANGES, velocities=VELOCITIES, zoom=zoom, maxBatch=2, backend='numpy')
+    roi = processor.process(frames)
+    (rangeStart, rangeStop), (dopplerStart, dopplerStop) = roi_bins(config.radarConfig, RANGES, VELOCITIES)
+    centre = config.numLoopsPerFrame // 2
+    rangeResolution = config.radarConfig.range_resolution
+
+    assert roi['rangeDoppler'].shape[-1] == (rangeStop - rangeStart - 1) * zoom + 1
+    np.testing.assert_allclose(processor.rangeAxis[::zoom], np.arange(rangeStart, rangeStop) * rangeResolution)
+    # Every zoom-th value falls on a range bin of the full FFT
+    cropped = full['rangeDoppler'][:, centre + dopplerStart:centre + dopplerStop, rangeStart:rangeStop]
+    np.testing.assert_allclose(roi['rangeDoppler'][..., ::zoom], cropped,
+                               rtol=1e-3, atol=1e-3 * full['rangeDoppler'].max())
+    # The target between two range bins peaks on the finer grid in between
+    profile = roi['rangeProfile'][0]
+    assert processor.rangeFrequencies[np.argmax(profile * (processor.rangeFrequencies > 30))] == 33.5
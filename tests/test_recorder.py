@@ -0,0 +1,90 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plotData import RawDataReader
+from recorder import CaptureRecorder, read_header, read_index
+from steaming import BYTES_IN_FRAME, adcCapThread
+
+NUM_FRAMES = 8
+LOST_FRAME = 5
+_ports = iter(range(48000, 49000, 2))
+
+
+@pytest.fixture
+def capThread():
+    # A ring filled the way the receivers do, without sockets: every value of frame k is k
+    port = next(_ports)
+    capThread = adcCapThread(1, "adc", static_ip='127.0.0.1', data_port=port, config_port=port + 1,
+                             bufferSize=16)
+    for number in range(1, NUM_FRAMES + 1):
+        slot = capThread.nextCapBufferPosition
+        capThread._frameStorage[slot] = number
+        capThread._lostMaskStorage[slot, 0] = number == LOST_FRAME
+        capThread.recentCapNum = number
+        capThread._publish_frame()
+    yield capThread
+    capThread.stop()
+    capThread.data_socket.close()
+    capThread.config_socket.close()
+
+
+def _record(capThread, basePath, **options):
+    recorder = CaptureRecorder(capThread, str(basePath), **options)
+    recorder.start()
+    recorder.stop()
+    recorder.join()
+    return recorder
+
+
+def _check_segments(paths):
+    numbers = []
+    for path in paths:
+        header = read_header(path)
+        index = read_index(path)
+        reader = RawDataReader(path)
+        # Unused preallocated space is trimmed and every frame on disk is indexed
+        assert os.path.getsize(path) == header['data_offset'] + len(index) * BYTES_IN_FRAME
+        assert len(reader) == len(index)
+        for frame, record in zip(reader[:], index):
+            assert (frame == record['frame_num']).all()
+            assert record['lost'] == (record['frame_num'] == LOST_FRAME)
+        numbers.extend(index['frame_num'].tolist())
+    return numbers
+
+
+def test_rotation_by_size(capThread, tmp_path):
+    # Room for the header and three frames per segment
+    recorder = _record(capThread, tmp_path / 'capture', segmentBytes=4096 * 4 + 3 * BYTES_IN_FRAME)
+
+    assert recorder.segmentPaths == [str(tmp_path / f'capture_{n:04d}.mmw') for n in range(3)]
+    assert [len(read_index(path)) for path in recorder.segmentPaths] == [3, 3, 2]
+    assert _check_segments(recorder.segmentPaths) == list(range(1, NUM_FRAMES + 1))
+    assert recorder.getStats()['frames'] == NUM_FRAMES
+
+
+def test_rotation_by_time(capThread, tmp_path):
+    # Every batch is older than segmentSeconds=0 by the time the next one is written
+    recorder = _record(capThread, tmp_path / 'capture', segmentSeconds=0, batchFrames=3)
+
+    assert [len(read_index(path)) for path in recorder.segmentPaths] == [3, 3, 2]
+    assert _check_segments(recorder.segmentPaths) == list(range(1, NUM_FRAMES + 1))
+
+
+def test_index_lists_only_synced_frames(capThread, tmp_path):
+    recorder = CaptureRecorder(capThread, str(tmp_path / 'capture'))
+    frames, numbers, lostFlags, timestamps = capThread.getFrames(NUM_FRAMES)
+    recorder._write_batch(frames, numbers, lostFlags, timestamps)
+    path = recorder.segmentPaths[0]
+
+    # Frames written but not synced, as after a crash: the preallocated segment holds no known frame
+    assert os.path.getsize(path) >= read_header(path)['data_offset'] + NUM_FRAMES * BYTES_IN_FRAME
+    assert len(read_index(path)) == 0 and len(RawDataReader(path)) == 0
+
+    recorder._sync()
+    assert len(RawDataReader(path)) == NUM_FRAMES
+    recorder._close_segment()
+    assert _check_segments([path]) == list(range(1, NUM_FRAMES + 1))
@@ -0,0 +1,195 @@
+import os
+import socket
+import sys
+import threading
+import time
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dca1000_emulator import packetize
+from steaming import BYTES_IN_FRAME, BYTES_IN_PACKET, RECEIVER_MODES, adcCapThread
+
+NUM_FRAMES = 4
+# Unique ports per test: a stopped receiver keeps its socket until its recv times out
+_ports = iter(range(47000, 48000, 2))
+
+
+def _datagrams(frames):
+    # A leading partial frame lets the receiver find the start of frame 1
+    stream = bytes(1000) + frames.tobytes()
+    return list(packetize(stream, BYTES_IN_FRAME - 1000))
+
+
+def _packet_index(frame, offset):
+    # Index in _datagrams() of the packet carrying byte offset of frame (counted from 1)
+    return (1000 + (frame - 1) * BYTES_IN_FRAME + offset) // BYTES_IN_PACKET
+
+
+def _zero_filled(frames, lost):
+    # The frames as zerofill stores them when the packets at indices lost never arrive
+    stream = np.frombuffer(bytes(1000) + frames.tobytes(), dtype=np.uint8).copy()
+    for index in lost:
+        stream[index * BYTES_IN_PACKET:(index + 1) * BYTES_IN_PACKET] = 0
+    return stream[1000:].view(np.int16).reshape(frames.shape)
+
+
+def _capture(datagrams, receiver):
+    port = next(_ports)
+    capThread = adcCapThread(1, "adc", static_ip='127.0.0.1', data_port=port, config_port=port + 1,
+                             bufferSize=8, receiver=receiver, lostPacketPolicy='zerofill')
+    capThread.daemon = True
+    capThread.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for i, datagram in enumerate(datagrams):
+        sender.sendto(datagram, ('127.0.0.1', port))
+        if i % 64 == 63:
+            time.sleep(0.002)
+    sender.close()
+
+    # The last frame is only published when the next frame starts, which never comes
+    frames, numbers, lostFlags = [], [], []
+    deadline = time.monotonic() + 5
+    while len(frames) < NUM_FRAMES - 1 and time.monotonic() < deadline:
+        batch, itemNums, flags, _ = capThread.getFrames(8, 0.1)
+        frames.extend(batch.copy())
+        numbers.extend(itemNums.tolist())
+        lostFlags.extend(flags.tolist())
+        capThread.releaseFrames()
+    capThread.stop()
+    # The ring is larger than the capture, so frame k stayed in slot k
+    masks = capThread.lostPacketMaskArray[:len(frames)].copy()
+    return np.array(frames), numbers, lostFlags, masks, capThread.getStats()
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    return rng.integers(-2000, 2000, size=(NUM_FRAMES, BYTES_IN_FRAME // 2), dtype=np.int16)
+
+
+@pytest.mark.parametrize('receiver', RECEIVER_MODES)
+def test_zerofill_lost_packets(frames, receiver):
+    datagrams = _datagrams(frames)
+    lost = [_packet_index(1, 100000), _packet_index(2, 500000), _packet_index(2, 500000) + 1]
+    received, numbers, lostFlags, masks, stats = _capture(
+        [d for i, d in enumerate(datagrams) if i not in lost], receiver)
+
+    assert numbers == [1, 2, 3]
+    assert lostFlags == [True, True, False]
+    assert stats['lost_packets'] == 3
+    assert stats['late_packets'] == 0
+    assert masks[0].sum() == 2 and masks[1].sum() in (3, 4) and not masks[2].any()
+    np.testing.assert_array_equal(received, _zero_filled(frames, lost)[:3])
+
+
+@pytest.mark.parametrize('receiver', RECEIVER_MODES)
+def test_zerofill_reordered_packets(frames, receiver):
+    datagrams = _datagrams(frames)
+    # Packets delayed within their frame fill their span; the one delayed past the end of
+    # frame 2, already handed out when it arrives, is late
+    order = list(range(len(datagrams)))
+    late = _packet_index(2, BYTES_IN_FRAME - 5000)
+    for index, delay in ((_packet_index(1, 100000), 1), (_packet_index(1, 700000), 5),
+                         (_packet_index(2, 300000), 20), (late, 10)):
+        order.remove(index)
+        order.insert(order.index(index + delay) + 1, index)
+    received, numbers, lostFlags, masks, stats = _capture([datagrams[i] for i in order], receiver)
+
+    assert numbers == [1, 2, 3]
+    assert lostFlags == [False, True, False]
+    assert stats['lost_packets'] == 1
+    assert stats['late_packets'] == 1
+    assert not masks[0].any() and masks[1].sum() == 2 and not masks[2].any()
+    np.testing.assert_array_equal(received, _zero_filled(frames, [late])[:3])
+
+
+@pytest.mark.parametrize('receiver', RECEIVER_MODES)
+def test_copies_per_frame(frames, receiver):
+    received, numbers, _, _, stats = _capture(_datagrams(frames), receiver)
+
+    assert numbers == [1, 2, 3]
+    np.testing.assert_array_equal(received, frames[:3])
+    # Bytes already received of the unfinished frame 4 are not counted; the python receiver
+    # copies every payload out of the socket, into the recent frame and into the ring
+    expected = 3.0 if receiver == 'python' else 1.0
+    assert abs(stats['copies_per_frame'] - expected) < 1e-3
+
+
+def _ring(overflowPolicy, bufferSize=4):
+    port = next(_ports)
+    return adcCapThread(1, "adc", static_ip='127.0.0.1', data_port=port, config_port=port + 1,
+                        bufferSize=bufferSize, overflowPolicy=overflowPolicy)
+
+
+def _publish(capThread, number):
+    # What a receiver does once a frame is in place: every value of frame k is k
+    capThread._frameStorage[capThread.nextCapBufferPosition] = number
+    capThread.recentCapNum = number
+    capThread._publish_frame()
+
+
+def _close(capThread):
+    capThread.stop()
+    capThread.data_socket.close()
+    capThread.config_socket.close()
+
+
+def test_drop_oldest_overflow():
+    capThread = _ring('drop_oldest')
+    for number in range(1, 9):
+        _publish(capThread, number)
+
+    # The frame being assembled holds a slot too, so 3 of the 8 frames are left
+    assert capThread.getFrame() == ("bufferOverWritten", -1, False)
+    frames, numbers, _, _ = capThread.getFrames(8)
+    assert numbers.tolist() == [6, 7, 8]
+    assert all((frame == number).all() for frame, number in zip(frames, numbers))
+    assert capThread.getStats()['dropped_frames'] == 5
+    _close(capThread)
+
+
+def test_drop_oldest_spares_held_frame():
+    capThread = _ring('drop_oldest')
+    _publish(capThread, 1)
+    _publish(capThread, 2)
+    held, numbers, _, _ = capThread.getFrames(1)
+    assert numbers.tolist() == [1]
+
+    # The producer laps the consumer while it still holds frame 1
+    for number in range(3, 9):
+        _publish(capThread, number)
+    assert (held == 1).all()
+
+    received = [1]
+    while True:
+        frames, numbers, _, _ = capThread.getFrames(8)
+        if not len(frames):
+            break
+        assert all((frame == number).all() for frame, number in zip(frames, numbers))
+        received.extend(numbers.tolist())
+    assert received == sorted(received)
+    assert len(received) + capThread.getStats()['dropped_frames'] == 8
+    _close(capThread)
+
+
+def test_block_overflow():
+    capThread = _ring('block')
+    producer = threading.Thread(target=lambda: [_publish(capThread, number) for number in range(1, 9)],
+                                daemon=True)
+    producer.start()
+    # The producer waits for a free slot instead of dropping frames
+    time.sleep(0.3)
+    assert producer.is_alive() and capThread._writeSeq == 4
+
+    received = []
+    while len(received) < 8:
+        frames, numbers, _, _ = capThread.getFrames(1, timeout=5)
+        assert len(frames) and (frames[0] == numbers[0]).all()
+        received.append(int(numbers[0]))
+    producer.join(5)
+    capThread.releaseFrames()
+    assert received == list(range(1, 9))
+    assert capThread.getStats()['dropped_frames'] == 0
+    _close(capThread)
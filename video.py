@@ -0,0 +1,267 @@
+import queue
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from plotData import RawDataReader, bin2np_frames
+from processing import RangeDopplerProcessor
+from viewer import RangeDopplerViewer, apply_colormap, colormap_lut
+
+RENDER_MODES = ('figure', 'colormap')
+"""
+- RENDER_MODES: How render_capture_video draws a frame: the full viewer figure, or the
+  range-Doppler and range FFT maps colormapped straight to pixels.
+"""
+
+
+class VideoWriterThread(threading.Thread):
+    """
+    A thread class encoding RGB images to a video file with cv2.VideoWriter.
+
+    Images are handed over through a bounded queue, so rendering and encoding overlap,
+    and the renderer waits instead of piling up images when the encoder falls behind.
+    """
+    def __init__(self, path, fps, queueSize=32, fourcc='mp4v'):
+        """
+        Initialize the VideoWriterThread.
+
+        Args:
+            path (str): Path of the video file.
+            fps (float): Frames per second of the video.
+            queueSize (int): Maximum number of images waiting to be encoded.
+            fourcc (str): Four character code of the codec.
+        """
+        threading.Thread.__init__(self)
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.framesWritten = 0
+        self._queue = queue.Queue(queueSize)
+        self._writer = None
+
+    def write(self, image):
+        """
+        Queue an image for encoding.
+
+        Args:
+            image (ndarray): (height, width, 3) uint8 RGB image; all images must have the same size.
+        """
+        self._queue.put(image)
+
+    def close(self):
+        """
+        Encode the queued images, then close the video file.
+        """
+        self._queue.put(None)
+        self.join()
+
+    def run(self):
+        """
+        Run the thread.
+        """
+        while True:
+            image = self._queue.get()
+            if image is None:
+                break
+            if self._writer is None:
+                height, width = image.shape[:2]
+                self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (width, height))
+            self._writer.write(cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+            self.framesWritten += 1
+        if self._writer is not None:
+            self._writer.release()
+
+
+class FrameRenderer:
+    """
+    Render the frames of a capture to RGB images.
+    """
+    def __init__(self, path, mode='figure', min_range_meters=0, max_range_meters=3, vmin=None, vmax=None,
+                 limits=None, scale=4, batchFrames=8):
+        """
+        Initialize the FrameRenderer.
+
+        Args:
+            path (str): Raw .bin capture or CaptureRecorder segment.
+            mode (str): One of RENDER_MODES.
+            min_range_meters (float): Minimum range to display in meters.
+            max_range_meters (float): Maximum range to display in meters.
+            vmin (float): Lower color limit (default: per-frame minimum).
+            vmax (float): Upper color limit (default: per-frame maximum).
+            limits (tuple): Fixed color limits of the 'figure' mode, ((lower, upper) of the
+                            range-Doppler map, (lower, upper) of the range FFT), e.g. from
+                            limits(); by default they follow the data from frame to frame.
+            scale (int): Pixels per bin in 'colormap' mode.
+            batchFrames (int): Number of frames processed at once.
+        """
+        if mode not in RENDER_MODES:
+            raise ValueError(f"mode must be one of {RENDER_MODES}, got {mode!r}")
+        self.mode = mode
+        self.vmin = vmin
+        self.vmax = vmax
+        self.scale = scale
+        self.reader = RawDataReader(path)
+        config = self.reader.frameconfig
+        self.viewer = RangeDopplerViewer(config.numDopplerBins, min_range_meters, max_range_meters, maxFps=None,
+                                         vmin=vmin, vmax=vmax, headless=True)
+        # Only the displayed range bins are carried past the range FFT
+        self.rangeBins = (self.viewer.minRangeBin, self.viewer.maxRangeBin)
+        self.processor = RangeDopplerProcessor(config, maxBatch=batchFrames, rangeBins=self.rangeBins, workers=1)
+        if limits is not None:
+            self.viewer.fixLimits(*limits)
+        self.lut = colormap_lut('viridis')[:, :3]
+        self._frames = np.empty((batchFrames, config.frameSize), dtype=np.complex64)
+        self._scratch = np.empty((2, batchFrames, config.frameSize // 2), dtype=np.uint64)
+
+    def limits(self, start, stop):
+        """
+        Get the color limits covering the displayed range bins of a frame range.
+
+        Args:
+            start (int): First frame.
+            stop (int): End of the range (exclusive).
+
+        Returns:
+            tuple: ((lower, upper) of the range-Doppler maps, (lower, upper) of the range FFTs),
+                   vmin and vmax taking precedence over the data.
+        """
+        batchFrames = self.processor.maxBatch
+        extremes = {'rangeDoppler': [np.inf, -np.inf], 'rangeChirp': [np.inf, -np.inf]}
+        for first in range(start, stop, batchFrames):
+            n = min(batchFrames, stop - first)
+            bin2np_frames(self.reader[first:first + n], out=self._frames[:n], scratch=self._scratch[:, :n])
+            results = self.processor.process(self._frames[:n])
+            for name, extreme in extremes.items():
+                extreme[0] = min(extreme[0], float(results[name].min()))
+                extreme[1] = max(extreme[1], float(results[name].max()))
+        return tuple((lo if self.vmin is None else self.vmin, hi if self.vmax is None else self.vmax)
+                     for lo, hi in extremes.values())
+
+    def render(self, start, stop):
+        """
+        Render a frame range.
+
+        Args:
+            start (int): First frame.
+            stop (int): End of the range (exclusive).
+
+        Yields:
+            ndarray: (height, width, 3) uint8 RGB image of each frame, in order.
+        """
+        batchFrames = self.processor.maxBatch
+        for first in range(start, stop, batchFrames):
+            n = min(batchFrames, stop - first)
+            bin2np_frames(self.reader[first:first + n], out=self._frames[:n], scratch=self._scratch[:, :n])
+            results = self.processor.process(self._frames[:n])
+            for i in range(n):
+                if self.mode == 'figure':
+                    self.viewer.update(results['rangeDoppler'][i], results['rangeChirp'][i], results['rangeProfile'][i],
+                                       first + i, rangeOffset=self.rangeBins[0])
+                    yield self.viewer.toRGB()
+                else:
+                    yield self._colormap(results['rangeDoppler'][i], results['rangeChirp'][i])
+
+    def _colormap(self, rangeDoppler, rangeChirp):
+        """
+        Draw the range-Doppler and range FFT maps side by side, scale pixels per bin.
+        """
+        maps = []
+        for data in (rangeDoppler, rangeChirp):
+            vmin = data.min() if self.vmin is None else self.vmin
+            vmax = data.max() if self.vmax is None else self.vmax
+            maps.append(apply_colormap(data, vmin, vmax, self.lut))
+        image = np.concatenate(maps, axis=1)
+        return image.repeat(self.scale, axis=0).repeat(self.scale, axis=1)
+
+
+# Per-process renderer of a pool worker, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(path, options):
+    _worker['renderer'] = FrameRenderer(path, **options)
+
+
+def _render_shard(start, stop):
+    return list(_worker['renderer'].render(start, stop))
+
+
+def _limits_shard(start, stop):
+    return _worker['renderer'].limits(start, stop)
+
+
+def render_capture_video(path, outputPath, mode='figure', fps=10, startFrame=0, stopFrame=None, workers=1,
+                         shardFrames=16, **options):
+    """
+    Render the frames of a capture straight into a video file, without intermediate images on disk.
+
+    Rendering runs in this process or, with workers > 1, on a process pool working on
+    consecutive shards of frames. Shards are collected in order, at most two per worker
+    ahead of the encoder, and encoded by a VideoWriterThread. The color limits of the
+    'figure' mode follow the data from frame to frame, which a worker starting in the
+    middle of the capture cannot do, so on a pool they are fixed to the limits of the
+    whole frame range, computed by the workers in a first pass, unless vmin and vmax are
+    both given.
+
+    Args:
+        path (str): Raw .bin capture or CaptureRecorder segment.
+        outputPath (str): Path of the video file.
+        mode (str): One of RENDER_MODES.
+        fps (float): Frames per second of the video.
+        startFrame (int): First frame to render.
+        stopFrame (int): End of the frame range (default: the end of the capture).
+        workers (int): Number of rendering processes.
+        shardFrames (int): Number of frames per task given to a worker.
+        **options: Further FrameRenderer arguments, e.g. max_range_meters, vmin, vmax.
+
+    Returns:
+        int: Number of frames written.
+    """
+    options = dict(options, mode=mode)
+    writer = VideoWriterThread(outputPath, fps)
+    writer.start()
+    try:
+        if workers <= 1:
+            renderer = FrameRenderer(path, **options)
+            stopFrame = len(renderer.reader) if stopFrame is None else min(stopFrame, len(renderer.reader))
+            for image in renderer.render(startFrame, stopFrame):
+                writer.write(image)
+        else:
+            numFrames = len(RawDataReader(path))
+            stopFrame = numFrames if stopFrame is None else min(stopFrame, numFrames)
+            shards = deque((first, min(first + shardFrames, stopFrame))
+                           for first in range(startFrame, stopFrame, shardFrames))
+            if mode == 'figure' and (options.get('vmin') is None or options.get('vmax') is None) and shards:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(path, options)) as pool:
+                    shardLimits = list(pool.map(_limits_shard, *zip(*shards)))
+                options['limits'] = tuple((min(limits[i][0] for limits in shardLimits),
+                                           max(limits[i][1] for limits in shardLimits)) for i in range(2))
+            pending = deque()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(path, options)) as pool:
+                while shards or pending:
+                    while shards and len(pending) < 2 * workers:
+                        pending.append(pool.submit(_render_shard, *shards.popleft()))
+                    for image in pending.popleft().result():
+                        writer.write(image)
+    finally:
+        writer.close()
+    return writer.framesWritten
+
+
+def main():
+    # Usage: python video.py <filename.bin> [output.mp4] [figure|colormap] [workers]
+    bin_filename = sys.argv[1]
+    outputPath = sys.argv[2] if len(sys.argv) > 2 else 'Plot_Results.mp4'
+    mode = sys.argv[3] if len(sys.argv) > 3 else 'figure'
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    written = render_capture_video(bin_filename, outputPath, mode=mode, workers=workers)
+    print(f"Wrote {written} frames to {outputPath}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import configuration as cfg
+
+# Number of colors in the lookup tables built by colormap_lut
+COLORMAP_SIZE = 256
+
+
+def colormap_lut(cmap='viridis', size=COLORMAP_SIZE):
+    """
+    Precompute a colormap as a lookup table.
+
+    Args:
+        cmap (str): Name of a matplotlib colormap.
+        size (int): Number of colors, at most 256.
+
+    Returns:
+        ndarray: (size, 4) uint8 RGBA table.
+    """
+    return plt.get_cmap(cmap, size)(np.arange(size), bytes=True)
+
+
+def apply_colormap(data, vmin, vmax, lut, out=None, index=None):
+    """
+    Map values to colors with a lookup table from colormap_lut.
+
+    Args:
+        data (ndarray): Values to map.
+        vmin (float): Value mapped to the first color; lower values are clipped.
+        vmax (float): Value mapped to the last color; higher values are clipped.
+        lut (ndarray): (size, channels) uint8 table.
+        out (ndarray): Optional data.shape + (channels,) uint8 output.
+        index (ndarray): Optional float32 scratch of data.shape.
+
+    Returns:
+        ndarray: The colors, data.shape + (channels,) uint8.
+    """
+    if out is None:
+        out = np.empty(data.shape + lut.shape[1:], dtype=np.uint8)
+    if index is None:
+        index = np.empty(data.shape, dtype=np.float32)
+    scale = (len(lut) - 1) / (vmax - vmin) if vmax > vmin else 0.0
+    np.subtract(data, vmin, out=index)
+    np.multiply(index, scale, out=index)
+    np.clip(index, 0, len(lut) - 1, out=index)
+    np.take(lut, index.astype(np.intp), axis=0, out=out)
+    return out
+
+
+class RangeDopplerViewer:
+    """
+    Persistent figure showing the range-Doppler map, range FFT and relative power of a frame.
+
+    The figure, its axes and colorbars are created once. Each update only replaces the
+    image and line data, restores the static background and redraws the changing artists
+    (blitting), so a frame costs a few milliseconds instead of a full figure layout.
+    Only the displayed range window is colormapped, with a precomputed lookup table, and
+    redraws are capped at maxFps whatever the rate at which frames are given to update().
+
+    Without fixed vmin/vmax, the color limits follow the data with some hysteresis: they
+    are only changed, with a full redraw of the colorbars, when a frame falls outside them
+    or uses less than half of their span.
+    """
+    def __init__(self, numDopplerBins=cfg.NUM_DOPPLER_BINS, min_range_meters=0, max_range_meters=3,
+                 maxFps=20, vmin=None, vmax=None, powerFloor=-40, headless=False):
+        """
+        Initialize the RangeDopplerViewer.
+
+        Args:
+            numDopplerBins (int): Number of Doppler bins (chirp loops) per frame.
+            min_range_meters (float): Minimum range to display in meters.
+            max_range_meters (float): Maximum range to display in meters.
+            maxFps (float): Maximum number of redraws per second, or None for no limit.
+            vmin (float): Lower color limit of both images (default: per-frame minimum).
+            vmax (float): Upper color limit of both images (default: per-frame maximum).
+            powerFloor (float): Lower limit of the relative power axis in dB.
+            headless (bool): Render off-screen with the Agg canvas, e.g. for tests or video.
+        """
+        self.minRangeBin = int(min_range_meters / cfg.RANGE_RESOLUTION)
+        self.maxRangeBin = int(max_range_meters / cfg.RANGE_RESOLUTION)
+        self.maxFps = maxFps
+        self.vmin = vmin
+        self.vmax = vmax
+        self.headless = headless
+
+        self.framesShown = 0
+        self.framesSkipped = 0
+        self.drawSeconds = 0.0
+        self._lastDraw = None
+        self._background = None
+        self._fixedLimits = {}
+
+        numRangeBins = self.maxRangeBin - self.minRangeBin
+        if headless:
+            self.figure = Figure(figsize=(20, 4))
+            FigureCanvasAgg(self.figure)
+        else:
+            self.figure = plt.figure(figsize=(20, 4))
+        self.canvas = self.figure.canvas
+        axDoppler, axRange, axPower = self.figure.subplots(1, 3)
+
+        # Images span the displayed range bins only, in the same axes units as before
+        extent = (self.minRangeBin - 0.5, self.maxRangeBin - 0.5, numDopplerBins - 0.5, -0.5)
+        blank = np.zeros((numDopplerBins, numRangeBins), dtype=np.float32)
+        self._lut = colormap_lut('viridis')
+        self._index = np.empty(blank.shape, dtype=np.float32)
+        self._rgba = {}
+        self.dopplerImage = axDoppler.imshow(blank, cmap='viridis', aspect='auto', extent=extent,
+                                             interpolation='nearest')
+        self.figure.colorbar(self.dopplerImage, ax=axDoppler, label='Magnitude (dB)')
+        axDoppler.set_title('Doppler-Range Map')
+        axDoppler.set_ylabel('Chirp Index')
+
+        self.rangeImage = axRange.imshow(blank, cmap='viridis', aspect='auto', extent=extent,
+                                         interpolation='nearest')
+        self.figure.colorbar(self.rangeImage, ax=axRange, label='Magnitude (dB)')
+        axRange.set_title('Range FFT')
+        axRange.set_xlabel('Range Bins')
+        axRange.set_ylabel('Chirp Index')
+
+        self.rangeMeters = np.arange(self.minRangeBin, self.maxRangeBin) * cfg.RANGE_RESOLUTION
+        (self.powerLine,) = axPower.plot(self.rangeMeters, np.zeros(numRangeBins))
+        axPower.set_xlim(self.rangeMeters[0], self.rangeMeters[-1])
+        axPower.set_ylim(powerFloor, 1)
+        axPower.set_title('Relative Power vs. Range')
+        axPower.set_xlabel('Range (m)')
+        axPower.set_ylabel('Relative Power (dB)')
+        axPower.grid(True)
+
+        self.frameText = self.figure.text(0.01, 0.97, '', va='top')
+        self.figure.tight_layout()
+
+        # Everything that changes per frame is animated, i.e. left out of the background
+        self._animated = [self.dopplerImage, self.rangeImage, self.powerLine, self.frameText]
+        for artist in self._animated:
+            artist.set_animated(True)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        if headless:
+            self.canvas.draw()
+        else:
+            plt.show(block=False)
+            plt.pause(0.1)
+
+    def update(self, rangeDoppler, rangeChirp, rangeProfile, frame_number=None, rangeOffset=0, force=False):
+        """
+        Show a new frame, unless the last redraw was less than 1/maxFps seconds ago.
+
+        Args:
+            rangeDoppler (ndarray): (doppler bins, range bins) map, e.g. from RangeDopplerProcessor.
+            rangeChirp (ndarray): (loops, range bins) range FFT magnitude.
+            rangeProfile (ndarray): (range bins,) range FFT magnitude averaged over the chirps.
+            frame_number (int): Frame number shown in the figure.
+            rangeOffset (int): Range bin of the first column of the arrays, if they are already cropped.
+            force (bool): Redraw even if the redraw rate cap is reached.
+
+        Returns:
+            bool: True if the frame was drawn.
+        """
+        now = time.perf_counter()
+        if not force and self.maxFps and self._lastDraw is not None and now - self._lastDraw < 1 / self.maxFps:
+            self.framesSkipped += 1
+            return False
+        self._lastDraw = now
+
+        window = slice(self.minRangeBin - rangeOffset, self.maxRangeBin - rangeOffset)
+        limitsChanged = False
+        for image, data in ((self.dopplerImage, rangeDoppler[:, window]), (self.rangeImage, rangeChirp[:, window])):
+            # The image gets RGBA data, its color limits only drive the colorbar
+            limitsChanged |= self._update_limits(image, data)
+            rgba = self._rgba.get(image)
+            if rgba is None:
+                rgba = self._rgba[image] = np.empty(data.shape + (4,), dtype=np.uint8)
+            image.set_data(apply_colormap(data, *image.get_clim(), self._lut, out=rgba, index=self._index))
+        power = rangeProfile[window]
+        self.powerLine.set_ydata(10 * np.log10(power / np.max(power)))
+        self.frameText.set_text('' if frame_number is None else f'Frame {frame_number}')
+
+        if limitsChanged:
+            # The colorbars are part of the background, so it has to be drawn again
+            self._background = None
+        self._blit()
+        self.framesShown += 1
+        self.drawSeconds += time.perf_counter() - now
+        return True
+
+    def fixLimits(self, dopplerLimits, rangeLimits):
+        """
+        Fix the color limits of each image, e.g. to limits computed over a whole capture, so
+        that they no longer follow the data.
+
+        Args:
+            dopplerLimits (tuple): (lower, upper) color limits of the range-Doppler map.
+            rangeLimits (tuple): (lower, upper) color limits of the range FFT.
+        """
+        self._fixedLimits = {self.dopplerImage: dopplerLimits, self.rangeImage: rangeLimits}
+        for image, (lo, hi) in self._fixedLimits.items():
+            image.set_clim(lo, hi)
+        # The colorbars are part of the background, so it has to be drawn again
+        self._background = None
+
+    def getStats(self):
+        """
+        Get the viewer counters.
+
+        Returns:
+            dict: Frames drawn, frames skipped by the redraw rate cap and mean draw time in seconds.
+        """
+        return {'frames_shown': self.framesShown,
+                'frames_skipped': self.framesSkipped,
+                'draw_seconds': self.drawSeconds / self.framesShown if self.framesShown else 0.0}
+
+    def toRGB(self):
+        """
+        Get the current figure as an image.
+
+        Returns:
+            ndarray: (height, width, 3) uint8 RGB copy of the canvas.
+        """
+        return np.asarray(self.canvas.buffer_rgba())[..., :3].copy()
+
+    def close(self):
+        """
+        Close the figure.
+        """
+        if not self.headless:
+            plt.close(self.figure)
+
+    def _update_limits(self, image, data):
+        """
+        Adjust the color limits of an image to new data.
+
+        Returns:
+            bool: True if the limits were changed.
+        """
+        if image in self._fixedLimits:
+            return False
+        lo = data.min() if self.vmin is None else self.vmin
+        hi = data.max() if self.vmax is None else self.vmax
+        currentLo, currentHi = image.get_clim()
+        if lo >= currentLo and hi <= currentHi and (hi - lo) * 2 >= currentHi - currentLo:
+            return False
+        # Leave some headroom, so that small fluctuations do not change the limits again
+        margin = 0.1 * (hi - lo)
+        image.set_clim(lo - margin if self.vmin is None else lo, hi + margin if self.vmax is None else hi)
+        return True
+
+    def _on_draw(self, event):
+        """
+        Capture the static background after a full draw, e.g. on the first draw or a resize.
+        """
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self._animated:
+            self.figure.draw_artist(artist)
+
+    def _blit(self):
+        """
+        Redraw the animated artists over the static background.
+        """
+        if self._background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        if not self.headless:
+            self.canvas.blit(self.figure.bbox)
+            self.canvas.flush_events()